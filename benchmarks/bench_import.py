@@ -0,0 +1,74 @@
+"""Benchmarks the time it takes to ``import watergeo`` in a fresh interpreter.
+
+Usage:
+    python -m benchmarks.bench_import [--repeat 5] [--budget 0.25]
+
+The script exits with a non-zero status if the median import time exceeds the
+budget (in seconds), so it can be used as a regression gate in CI.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["ee", "folium", "geopandas", "ipyleaflet", "ipywidgets", "pandas"]
+
+_SNIPPET = (
+    "import sys, time; t = time.perf_counter(); import watergeo; "
+    "print(time.perf_counter() - t); "
+    f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+)
+
+
+def measure(statement=_SNIPPET, repeat=5):
+    """Measures the import time of watergeo in `repeat` fresh interpreters.
+
+    Args:
+        statement (str, optional): The Python code to run. It must print the
+            elapsed time on the first line and the loaded heavy modules on the second.
+        repeat (int, optional): The number of interpreters to start. Defaults to 5.
+
+    Returns:
+        dict: The individual timings, their median, and the heavy modules loaded.
+    """
+    timings = []
+    loaded = set()
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", statement],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.splitlines()
+        timings.append(float(out[0]))
+        if len(out) > 1 and out[1]:
+            loaded.update(out[1].split(","))
+    return {
+        "timings": timings,
+        "median": statistics.median(timings),
+        "heavy_modules": sorted(loaded),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--budget", type=float, default=0.25, help="Maximum median time in seconds."
+    )
+    args = parser.parse_args(argv)
+
+    result = measure(repeat=args.repeat)
+    print(f"import watergeo: median {result['median'] * 1000:.1f} ms")
+    if result["heavy_modules"]:
+        print(f"Heavy modules loaded at import: {', '.join(result['heavy_modules'])}")
+        return 1
+    if result["median"] > args.budget:
+        print(f"Import time exceeds the budget of {args.budget * 1000:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Benchmarks the per-tile latency of a large raster before and after building overviews.
+
+Usage:
+    python -m benchmarks.bench_raster [--size 6000] [--zooms 6 7 8]
+
+A striped float32 GeoTIFF without overviews is written to a temporary
+directory, and every tile covering it at each zoom level is rendered with
+raster.RasterReader, first from the raster alone and then after
+raster.build_overviews(). The rendered-tile cache is not used.
+"""
+
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BOUNDS = (-84.0, 35.0, -80.0, 39.0)
+
+
+def make_raster(path, size, seed=0):
+    """Writes a random, striped float32 GeoTIFF of size x size pixels without overviews."""
+    import rasterio
+    from rasterio.transform import from_bounds
+
+    profile = {
+        "driver": "GTiff",
+        "height": size,
+        "width": size,
+        "count": 1,
+        "dtype": "float32",
+        "crs": "EPSG:4326",
+        "transform": from_bounds(*BOUNDS, size, size),
+    }
+    rng = np.random.default_rng(seed)
+    with rasterio.open(path, "w", **profile) as dst:
+        for row in range(0, size, 512):
+            height = min(512, size - row)
+            data = rng.normal(100, 25, size=(height, size)).astype("float32")
+            dst.write(data, 1, window=((row, row + height), (0, size)))
+
+
+def tiles(zoom):
+    """Returns the XYZ tiles covering BOUNDS at a zoom level."""
+    n = 2**zoom
+
+    def index(lon, lat):
+        x = int((lon + 180) / 360 * n)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+        return x, y
+
+    x0, y0 = index(BOUNDS[0], BOUNDS[3])
+    x1, y1 = index(BOUNDS[2], BOUNDS[1])
+    return [(zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def tile_latencies(path, zooms):
+    """Renders the tiles at each zoom level and returns their render times in seconds."""
+    from watergeo.raster import RasterReader
+
+    reader = RasterReader(path)
+    latencies = {}
+    for zoom in zooms:
+        latencies[zoom] = []
+        for z, x, y in tiles(zoom):
+            start = time.perf_counter()
+            reader.render(z, x, y, vmin=0, vmax=200)
+            latencies[zoom].append(time.perf_counter() - start)
+    return latencies
+
+
+def run(size=6000, zooms=(6, 7, 8)):
+    """Times the tiles before and after building overviews."""
+    from watergeo import raster
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "large.tif")
+        make_raster(path, size)
+        before = tile_latencies(path, zooms)
+        start = time.perf_counter()
+        path = raster.build_overviews(path)
+        build = time.perf_counter() - start
+        after = tile_latencies(path, zooms)
+    return before, after, build
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=6000)
+    parser.add_argument("--zooms", type=int, nargs="+", default=[6, 7, 8])
+    args = parser.parse_args(argv)
+
+    before, after, build = run(args.size, args.zooms)
+    print(f"Raster: {args.size} x {args.size} float32 pixels, overviews built in {build:.2f} s")
+    for zoom in args.zooms:
+        median_before = statistics.median(before[zoom]) * 1000
+        median_after = statistics.median(after[zoom]) * 1000
+        print(
+            f"zoom {zoom:>2} ({len(before[zoom]):>3} tiles): median {median_before:7.1f} ms"
+            f" -> {median_after:6.1f} ms ({median_before / median_after:5.1f}x)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
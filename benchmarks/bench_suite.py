@@ -0,0 +1,396 @@
+"""Times and measures the memory of the package's hot paths and flags regressions against a baseline.
+
+Usage:
+    python -m benchmarks.bench_suite [--repeat 5] [--only zonal export] [--save]
+
+The suite runs offline: Earth Engine is replaced by benchmarks.fake_ee, whose
+downloads are served by a local HTTP server, and the rasters are synthetic.
+The cases use the bundled Appalachian counties shapefile and are:
+
+- import: ``import watergeo`` and ``import watergeo.foliumap`` in fresh interpreters
+- add_shp / add_vector: adding the counties to a map of each backend, without the vector caches
+- geojson: the time and size of the serialized maps, plain and compact (see export.render_compact())
+- zonal_stats: common.zonal_stats() on a local raster and on the fake Earth Engine
+- ee_export_vector: single and paged downloads from the fake Earth Engine
+
+Each case reports its best time over --repeat runs, the peak memory allocated
+by Python and NumPy during one more run (with tracemalloc, so the GDAL block
+cache is not counted), and the size of its output where relevant. With --save
+the results are written to the baseline file; otherwise they are compared
+with it, and the script exits with a non-zero status if a case got slower,
+bigger or more memory-hungry than the tolerances allow.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_zonal import make_raster
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+COUNTIES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "docs",
+    "examples",
+    "datasets",
+    "countiesAppalachia_ARC_ll83.shp",
+)
+
+# Differences below these floors are noise, whatever the tolerance.
+_FLOORS = {"seconds": 0.005, "peak_mb": 1.0, "bytes": 1024}
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+_IMPORT_MEMORY_SNIPPET = (
+    "import tracemalloc; tracemalloc.start(); import {module}; print(tracemalloc.get_traced_memory()[1])"
+)
+
+
+def _python(statement):
+    return subprocess.run(
+        [sys.executable, "-c", statement], capture_output=True, text=True, check=True
+    ).stdout.splitlines()[-1]
+
+
+def measure_import(module, repeat=5):
+    """Measures the import time and memory of a module in fresh interpreters.
+
+    The memory is measured in one more interpreter, as tracemalloc slows down imports.
+
+    Args:
+        module (str): The module to import.
+        repeat (int, optional): The number of interpreters to start. Defaults to 5.
+
+    Returns:
+        dict: The best time in seconds, the median time, and the peak memory in MB.
+    """
+    timings = [float(_python(_IMPORT_SNIPPET.format(module=module))) for _ in range(repeat)]
+    peak = int(_python(_IMPORT_MEMORY_SNIPPET.format(module=module)))
+    return {"seconds": min(timings), "median": statistics.median(timings), "peak_mb": peak / 1e6}
+
+
+def measure(func, repeat=5):
+    """Measures the time and peak memory of a function.
+
+    The function runs once to warm up, repeat times to be timed, and once more
+    under tracemalloc.
+
+    Args:
+        func (callable): The function. It may return a dict of extra metrics, e.g., {"bytes": 1024}.
+        repeat (int, optional): The number of timed runs. Defaults to 5.
+
+    Returns:
+        dict: The best time in seconds, the median time, the peak memory in MB, and the extra metrics.
+    """
+    extra = func() or {}
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": min(timings),
+        "median": statistics.median(timings),
+        "peak_mb": peak / 1e6,
+        **extra,
+    }
+
+
+class Context:
+    """The data shared by the cases: the counties, a synthetic raster and a fake Earth Engine."""
+
+    def __init__(self, tmpdir, raster_size):
+        import geopandas as gpd
+
+        from benchmarks import fake_ee
+
+        self.tmpdir = tmpdir
+        self.ee = fake_ee.install()
+        self.counties = gpd.read_file(COUNTIES)
+        self.raster = os.path.join(tmpdir, "values.tif")
+        make_raster(self.raster, self.counties.total_bounds, raster_size)
+        self.ee.ASSETS["counties"] = self.counties
+        self.ee.ASSETS["values"] = self.raster
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+
+def _folium_map(ctx, method):
+    from watergeo import foliumap
+
+    def run():
+        m = foliumap.Map()
+        getattr(m, method)(COUNTIES, name="counties", cache=False)
+        return {}
+
+    return run
+
+
+def _ipyleaflet_map(ctx, method):
+    from watergeo import watergeo
+
+    def run():
+        m = watergeo.Map()
+        getattr(m, method)(COUNTIES, name="counties", cache=False)
+        return {}
+
+    return run
+
+
+def _folium_html(ctx, compact):
+    from watergeo import foliumap
+
+    m = foliumap.Map()
+    m.add_vector(COUNTIES, name="counties", cache=False)
+
+    def run():
+        html = m.to_html(compact=True) if compact else m.get_root().render()
+        return {"bytes": len(html.encode("utf-8"))}
+
+    return run
+
+
+def _ipyleaflet_html(ctx):
+    from watergeo import watergeo
+
+    m = watergeo.Map()
+    m.add_vector(COUNTIES, name="counties", cache=False)
+
+    def run():
+        return {"bytes": len(m.to_html().encode("utf-8"))}
+
+    return run
+
+
+def _geojson_dumps(ctx):
+    def run():
+        return {"bytes": len(ctx.counties.to_json().encode("utf-8"))}
+
+    return run
+
+
+def _zonal_local(ctx):
+    from watergeo import common
+
+    def run():
+        common.zonal_stats(ctx.raster, COUNTIES, ctx.path("local.csv"), stat_type="MEAN", verbose=False)
+        return {"bytes": os.path.getsize(ctx.path("local.csv"))}
+
+    return run
+
+
+def _zonal_ee(ctx, **kwargs):
+    from watergeo import common
+
+    def run():
+        image = ctx.ee.Image("values")
+        zones = ctx.ee.FeatureCollection("counties")
+        common.zonal_stats(image, zones, ctx.path("ee.csv"), stat_type="MEAN", verbose=False, **kwargs)
+        return {"bytes": os.path.getsize(ctx.path("ee.csv"))}
+
+    return run
+
+
+def _export(ctx, filename, **kwargs):
+    from watergeo import common
+
+    def run():
+        path = ctx.path(filename)
+        common.ee_export_vector(ctx.ee.FeatureCollection("counties"), path, verbose=False, **kwargs)
+        return {"bytes": os.path.getsize(path)}
+
+    return run
+
+
+# The cases in the order they run, with the functions that set them up.
+CASES = {
+    "add_shp folium": lambda ctx: _folium_map(ctx, "add_shp"),
+    "add_shp ipyleaflet": lambda ctx: _ipyleaflet_map(ctx, "add_shp"),
+    "add_vector folium": lambda ctx: _folium_map(ctx, "add_vector"),
+    "add_vector ipyleaflet": lambda ctx: _ipyleaflet_map(ctx, "add_vector"),
+    "geojson to_json": _geojson_dumps,
+    "geojson folium render": lambda ctx: _folium_html(ctx, compact=False),
+    "geojson folium compact": lambda ctx: _folium_html(ctx, compact=True),
+    "geojson ipyleaflet to_html": _ipyleaflet_html,
+    "zonal_stats local": _zonal_local,
+    "zonal_stats ee": _zonal_ee,
+    "zonal_stats ee batched": lambda ctx: _zonal_ee(ctx, batch_size=100),
+    "ee_export_vector csv": lambda ctx: _export(ctx, "counties.csv"),
+    "ee_export_vector geojson": lambda ctx: _export(ctx, "counties.geojson"),
+    "ee_export_vector paged": lambda ctx: _export(ctx, "paged.csv", page_size=100),
+}
+IMPORTS = {
+    "import watergeo": "watergeo",
+    "import watergeo.foliumap": "watergeo.foliumap",
+}
+
+
+def _selected(name, patterns):
+    return not patterns or any(fnmatch.fnmatch(name, f"*{p}*") for p in patterns)
+
+
+def run(patterns=None, repeat=5, raster_size=2000, verbose=True):
+    """Runs the benchmark cases.
+
+    Args:
+        patterns (list, optional): Only run the cases whose names contain one of these
+            patterns, e.g., ["zonal", "import"]. Defaults to None (all cases).
+        repeat (int, optional): The number of timed runs of each case. Defaults to 5.
+        raster_size (int, optional): The width and height of the synthetic raster in pixels. Defaults to 2000.
+        verbose (bool, optional): Whether to print the cases as they run. Defaults to True.
+
+    Returns:
+        dict: The metrics of each case, see measure().
+    """
+    results = {}
+    for name, module in IMPORTS.items():
+        if _selected(name, patterns):
+            if verbose:
+                print(f"Running {name} ...")
+            results[name] = measure_import(module, repeat)
+
+    names = [name for name in CASES if _selected(name, patterns)]
+    if not names:
+        return results
+
+    # Keep the parsed-vector and download caches out of the user's cache directory.
+    with tempfile.TemporaryDirectory() as tmpdir:
+        previous = os.environ.get("WATERGEO_CACHE_DIR")
+        os.environ["WATERGEO_CACHE_DIR"] = os.path.join(tmpdir, "cache")
+        try:
+            ctx = Context(tmpdir, raster_size)
+            for name in names:
+                if verbose:
+                    print(f"Running {name} ...")
+                results[name] = measure(CASES[name](ctx), repeat)
+        finally:
+            if previous is None:
+                os.environ.pop("WATERGEO_CACHE_DIR")
+            else:
+                os.environ["WATERGEO_CACHE_DIR"] = previous
+    return results
+
+
+def compare(results, baseline, tolerance=0.3, memory_tolerance=0.2, size_tolerance=0.05):
+    """Compares results with a baseline.
+
+    Args:
+        results (dict): The results of run().
+        baseline (dict): The baseline results.
+        tolerance (float, optional): The allowed relative increase of the time. Defaults to 0.3.
+        memory_tolerance (float, optional): The allowed relative increase of the peak memory. Defaults to 0.2.
+        size_tolerance (float, optional): The allowed relative increase of the output sizes. Defaults to 0.05.
+
+    Returns:
+        dict: For each case, the list of the metrics that regressed.
+    """
+    tolerances = {"seconds": tolerance, "peak_mb": memory_tolerance, "bytes": size_tolerance}
+    regressions = {}
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, allowed in tolerances.items():
+            if metric not in metrics or metric not in base:
+                continue
+            increase = metrics[metric] - base[metric]
+            if increase > _FLOORS[metric] and increase > base[metric] * allowed:
+                regressions.setdefault(name, []).append(metric)
+    return regressions
+
+
+def _change(value, base):
+    if base is None or not base:
+        return ""
+    return f"{(value - base) / base:+.0%}"
+
+
+def print_results(results, baseline=None, regressions=None):
+    """Prints the results, with their change from the baseline and the regressions."""
+    baseline = baseline or {}
+    regressions = regressions or {}
+    width = max(len(name) for name in results)
+    print(f"{'Case':<{width}}  {'ms':>9} {'':>6}  {'peak MB':>8} {'':>6}  {'KB':>9} {'':>6}")
+    for name, metrics in results.items():
+        base = baseline.get(name, {})
+        size = metrics.get("bytes")
+        line = (
+            f"{name:<{width}}  {metrics['seconds'] * 1000:9.1f} {_change(metrics['seconds'], base.get('seconds')):>6}"
+            f"  {metrics['peak_mb']:8.1f} {_change(metrics['peak_mb'], base.get('peak_mb')):>6}"
+        )
+        if size is not None:
+            line += f"  {size / 1024:9.1f} {_change(size, base.get('bytes')):>6}"
+        else:
+            line += f"  {'':>9} {'':>6}"
+        if name in regressions:
+            line += "  REGRESSION: " + ", ".join(regressions[name])
+        print(line)
+
+
+def _machine():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", metavar="PATTERN", help="Only run the matching cases.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--raster-size", type=int, default=2000)
+    parser.add_argument("--baseline", default=BASELINE, help="The baseline file.")
+    parser.add_argument("--save", action="store_true", help="Save the results as the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed relative slowdown.")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2)
+    parser.add_argument("--size-tolerance", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.repeat, args.raster_size)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved["results"]
+        if saved.get("machine") != _machine():
+            print(f"Note: the baseline was recorded on another machine: {saved.get('machine')}")
+
+    if args.save:
+        # Keep the baseline of the cases that were not run.
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": _machine(), "raster_size": args.raster_size, "results": baseline}, f, indent=2)
+            f.write("\n")
+        print_results(results)
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance, args.memory_tolerance, args.size_tolerance)
+    print_results(results, baseline, regressions)
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
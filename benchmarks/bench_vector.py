@@ -0,0 +1,104 @@
+"""Benchmarks vector.read_vector() against the previous ways of reading vector files.
+
+Usage:
+    python -m benchmarks.bench_vector [--repeat 5]
+
+The bundled Appalachian counties shapefile is read with pyshp (the old
+ipyleaflet add_shp() path), geopandas.read_file(), and read_vector() with and
+without filters and caches. The parsed-vector caches are kept in a temporary
+directory.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+COUNTIES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "docs",
+    "examples",
+    "datasets",
+    "countiesAppalachia_ARC_ll83.shp",
+)
+
+# The county geometries of Kentucky, Tennessee and Virginia, roughly.
+BBOX = (-85.0, 36.0, -81.0, 38.5)
+
+
+def pyshp_geo_interface(path):
+    """The old ipyleaflet add_shp() path."""
+    import shapefile
+
+    with shapefile.Reader(path) as shp:
+        return shp.__geo_interface__
+
+
+def best_time(func, repeat):
+    """Returns the best time of func() in seconds over repeat runs."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(path=COUNTIES, repeat=5):
+    """Times the readers and returns the best time of each in seconds."""
+    import geopandas as gpd
+    from watergeo import vector
+
+    readers = {
+        "pyshp __geo_interface__": lambda: pyshp_geo_interface(path),
+        "gpd.read_file": lambda: gpd.read_file(path),
+        "read_vector": lambda: vector.read_vector(path, cache=False),
+        "read_vector columns": lambda: vector.read_vector(
+            path, columns=["CNTY_NAME"], cache=False
+        ),
+        "read_vector bbox": lambda: vector.read_vector(path, bbox=BBOX, cache=False),
+        "read_vector where": lambda: vector.read_vector(
+            path, where="STATE_NAME = 'Ohio'", cache=False
+        ),
+    }
+    timings = {name: best_time(func, repeat) for name, func in readers.items()}
+
+    previous = os.environ.get("WATERGEO_CACHE_DIR")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ["WATERGEO_CACHE_DIR"] = tmpdir
+        vector._disk_cache = None
+        vector.read_vector(path)
+
+        def from_disk():
+            vector.vector_cache.clear()
+            vector.read_vector(path)
+
+        timings["read_vector disk cache"] = best_time(from_disk, repeat)
+        timings["read_vector memory cache"] = best_time(
+            lambda: vector.read_vector(path), repeat
+        )
+        vector._disk_cache = None
+        vector.vector_cache.clear()
+    if previous is None:
+        os.environ.pop("WATERGEO_CACHE_DIR")
+    else:
+        os.environ["WATERGEO_CACHE_DIR"] = previous
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--path", default=COUNTIES)
+    args = parser.parse_args(argv)
+
+    timings = run(args.path, args.repeat)
+    baseline = timings["gpd.read_file"]
+    for name, seconds in timings.items():
+        print(f"{name:>26}: {seconds * 1000:8.1f} ms  ({baseline / seconds:5.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
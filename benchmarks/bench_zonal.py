@@ -0,0 +1,156 @@
+"""Benchmarks zonal.zonal_stats_local() against a per-polygon masking baseline.
+
+Usage:
+    python -m benchmarks.bench_zonal [--size 4000] [--grid 0] [--processes 1 2 4]
+
+A synthetic raster covering the Appalachian counties is written to a temporary
+directory, and the county means are computed with both approaches. With
+--grid N, an N x N grid of square zones is used instead of the counties to
+show how both approaches scale with the number of zones.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+COUNTIES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "docs",
+    "examples",
+    "datasets",
+    "countiesAppalachia_ARC_ll83.shp",
+)
+
+
+def make_raster(path, bounds, size, seed=0):
+    """Writes a random float32 GeoTIFF of size x size pixels covering bounds."""
+    import rasterio
+    from rasterio.transform import from_bounds
+
+    rng = np.random.default_rng(seed)
+    data = rng.normal(100, 25, size=(size, size)).astype("float32")
+    profile = {
+        "driver": "GTiff",
+        "height": size,
+        "width": size,
+        "count": 1,
+        "dtype": "float32",
+        "crs": "EPSG:4269",
+        "transform": from_bounds(*bounds, size, size),
+        "nodata": -9999,
+        "tiled": True,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+
+
+def per_polygon_mean(raster, zones):
+    """The baseline: crops and masks the raster once per polygon."""
+    import rasterio
+    from rasterio.mask import mask
+
+    means = []
+    with rasterio.open(raster) as src:
+        for geom in zones.geometry:
+            try:
+                data, _ = mask(src, [geom], crop=True, filled=False)
+            except ValueError:
+                means.append(np.nan)
+                continue
+            values = data.compressed()
+            means.append(values.mean() if values.size else np.nan)
+    return np.array(means, dtype=float)
+
+
+def grid_zones(bounds, n, crs):
+    """Returns an n x n grid of square zones covering bounds."""
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    xs = np.linspace(bounds[0], bounds[2], n + 1)
+    ys = np.linspace(bounds[1], bounds[3], n + 1)
+    cells = [
+        box(xs[i], ys[j], xs[i + 1], ys[j + 1]) for j in range(n) for i in range(n)
+    ]
+    return gpd.GeoDataFrame(geometry=cells, crs=crs)
+
+
+def run(size=4000, repeat=3, grid=0):
+    """Times both approaches and returns the best time of each in seconds."""
+    import geopandas as gpd
+    from watergeo.zonal import zonal_stats_local
+
+    zones = gpd.read_file(COUNTIES)
+    if grid:
+        zones = grid_zones(zones.total_bounds, grid, zones.crs)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raster = os.path.join(tmpdir, "values.tif")
+        make_raster(raster, zones.total_bounds, size)
+
+        timings = {"per_polygon": [], "vectorized": []}
+        for _ in range(repeat):
+            start = time.perf_counter()
+            baseline = per_polygon_mean(raster, zones)
+            timings["per_polygon"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            result = zonal_stats_local(raster, zones, stat_type="MEAN")
+            timings["vectorized"].append(time.perf_counter() - start)
+
+    np.testing.assert_allclose(result["mean"].to_numpy(), baseline, rtol=1e-4)
+    return {name: min(values) for name, values in timings.items()}
+
+
+def run_blocks(size=4000, processes=(1, 2, 4), block_size=1024, grid=0):
+    """Times zonal_stats_blocks() with different numbers of processes."""
+    import geopandas as gpd
+    from watergeo.zonal import zonal_stats_blocks
+
+    zones = gpd.read_file(COUNTIES)
+    if grid:
+        zones = grid_zones(zones.total_bounds, grid, zones.crs)
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raster = os.path.join(tmpdir, "values.tif")
+        make_raster(raster, zones.total_bounds, size)
+        for n in processes:
+            start = time.perf_counter()
+            zonal_stats_blocks(
+                raster, zones, stat_type=["MEAN", "STD"], block_size=block_size, processes=n
+            )
+            timings[f"blocks x{n}"] = time.perf_counter() - start
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--grid", type=int, default=0)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        nargs="*",
+        help="Also time zonal_stats_blocks() with these numbers of processes.",
+    )
+    args = parser.parse_args(argv)
+
+    result = run(args.size, args.repeat, args.grid)
+    zones = f"{args.grid ** 2} grid cells" if args.grid else "Appalachian counties"
+    print(f"Raster: {args.size} x {args.size} pixels, zones: {zones}")
+    for name, seconds in result.items():
+        print(f"{name:>12}: {seconds * 1000:8.1f} ms")
+    print(f"     speedup: {result['per_polygon'] / result['vectorized']:8.1f}x")
+
+    if args.processes:
+        for name, seconds in run_blocks(args.size, args.processes, grid=args.grid).items():
+            print(f"{name:>12}: {seconds * 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
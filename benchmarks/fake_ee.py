@@ -0,0 +1,286 @@
+"""A local stand-in for the parts of the Earth Engine API that watergeo calls, for offline benchmarks.
+
+Feature collections are GeoDataFrames, images are local rasters, and
+reduceRegions() runs zonal.zonal_stats_local(). Download URLs point at a local
+HTTP server (see DownloadServer), so common.ee_export_vector() and
+common.zonal_stats() run their real request, streaming and parsing code.
+
+The "server-side" work, i.e., the zonal statistics and the serialization of
+the downloads, is cached, so repeated runs time the client side of watergeo.
+
+Usage:
+    from benchmarks import fake_ee
+
+    ee = fake_ee.install()
+    ee.ASSETS["counties"] = gpd.read_file(COUNTIES)
+    common.ee_export_vector(ee.FeatureCollection("counties"), "counties.csv")
+"""
+
+import hashlib
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The feature collections and images returned for asset ids.
+ASSETS = {}
+
+_REDUCERS = {
+    "count": "COUNT",
+    "mean": "MEAN",
+    "max": "MAXIMUM",
+    "median": "MEDIAN",
+    "min": "MINIMUM",
+    "mode": "MODE",
+    "stdDev": "STD",
+    "minMax": "MIN_MAX",
+    "sum": "SUM",
+    "variance": "VARIANCE",
+    "histogram": "HIST",
+    "fixedHistogram": "FIXED_HIST",
+}
+_results = {}
+_server = None
+_server_lock = threading.Lock()
+
+
+class EEException(Exception):
+    pass
+
+
+class _Computed:
+    """A value computed on the "server", returned by getInfo()."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def getInfo(self):
+        return self.value
+
+    def multiply(self, factor):
+        return self.value * factor
+
+    def nominalScale(self):
+        return self
+
+
+class _List:
+    def __init__(self, collection, count, start):
+        self.collection = collection
+        self.count = count
+        self.start = start
+
+
+class Reducer:
+    def __init__(self, names, **params):
+        self.names = names
+        self.params = params
+
+    def unweighted(self):
+        return self
+
+    def combine(self, other, sharedInputs=False):
+        return Reducer(self.names + other.names, **self.params, **other.params)
+
+    @property
+    def stat_type(self):
+        types_ = [_REDUCERS[name] for name in self.names]
+        return types_[0] if len(types_) == 1 else types_
+
+
+for _name in _REDUCERS:
+    setattr(Reducer, _name, staticmethod(lambda *args, _name=_name, **kwargs: Reducer([_name], **kwargs)))
+
+
+class Feature:
+    def __init__(self, properties):
+        self.properties = properties
+
+    def propertyNames(self):
+        return _Computed(list(self.properties))
+
+    def copyProperties(self, other):
+        return self
+
+
+class FeatureCollection:
+    """A feature collection backed by a GeoDataFrame.
+
+    Args:
+        data (str | gpd.GeoDataFrame | _List | FeatureCollection): An asset id in ASSETS, the features,
+            or a slice of another collection.
+    """
+
+    def __init__(self, data, key=None):
+        if isinstance(data, FeatureCollection):
+            data, key = data.gdf, data.key
+        elif isinstance(data, _List):
+            key = (data.collection.key, data.start, data.count)
+            data = data.collection.gdf.iloc[data.start : data.start + data.count]
+        elif isinstance(data, str):
+            key = data
+            data = ASSETS[data]
+        self.gdf = data
+        self.key = key if key is not None else id(data)
+
+    def size(self):
+        return _Computed(len(self.gdf))
+
+    def first(self):
+        columns = [c for c in self.gdf.columns if c != self.gdf.geometry.name]
+        return Feature(dict.fromkeys(columns))
+
+    def toList(self, count, offset=0):
+        return _List(self, count, offset)
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def map(self, func):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def getDownloadURL(self, filetype="csv", selectors=None, filename=None):
+        return get_server().register(self, filetype, selectors)
+
+
+class Image:
+    """An image backed by a local raster file.
+
+    Args:
+        path (str): The path to the raster, or an asset id in ASSETS.
+    """
+
+    def __init__(self, path):
+        self.path = ASSETS.get(path, path)
+
+    def projection(self):
+        return _Computed(30.0)
+
+    def reduceRegions(self, collection, reducer, scale=None, crs=None, tileScale=1):
+        key = (self.path, collection.key, tuple(reducer.names))
+        if key not in _results:
+            from watergeo.zonal import zonal_stats_local
+
+            _results[key] = zonal_stats_local(self.path, collection.gdf, stat_type=reducer.stat_type)
+        return FeatureCollection(_results[key], key=key)
+
+
+class ImageCollection:
+    def __init__(self, images):
+        self.images = images
+
+    def toBands(self):
+        return Image(self.images[0])
+
+
+class Filter:
+    @staticmethod
+    def eq(*args):
+        return None
+
+
+def _serialize(collection, filetype, selectors):
+    gdf = collection.gdf
+    columns = [c for c in selectors or [] if c != ".geo" and c in gdf.columns]
+    if not columns:
+        columns = [c for c in gdf.columns if c != gdf.geometry.name]
+    if filetype == "csv":
+        return gdf[columns].to_csv(index=False).encode("utf-8")
+    if filetype in ("geojson", "json"):
+        return gdf[columns + [gdf.geometry.name]].to_json().encode("utf-8")
+    raise EEException(f"The fake download server does not support {filetype} files.")
+
+
+class DownloadServer:
+    """Serves the downloads of getDownloadURL() from a local HTTP server.
+
+    The content of each URL is serialized on its first request and kept in memory.
+    """
+
+    def __init__(self):
+        self.downloads = {}
+        self.content = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                token = self.path.strip("/")
+                try:
+                    body = server.get(token)
+                    self.send_response(200)
+                except KeyError:
+                    body = b'{"error": {"message": "Unknown download."}}'
+                    self.send_response(404)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def register(self, collection, filetype, selectors):
+        key = repr((collection.key, filetype, selectors))
+        token = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.downloads.setdefault(token, (collection, filetype, selectors))
+        return f"{self.url}/{token}"
+
+    def get(self, token):
+        with self._lock:
+            self.requests += 1
+            if token not in self.content:
+                self.content[token] = _serialize(*self.downloads[token])
+            return self.content[token]
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def get_server():
+    """Returns the download server of the process, starting it on first use."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = DownloadServer()
+        return _server
+
+
+def install():
+    """Replaces the ee module with the fake one, in sys.modules and in the loaded watergeo modules.
+
+    Returns:
+        module: The fake ee module.
+    """
+    module = types.ModuleType("ee")
+    module.__dict__.update(
+        ASSETS=ASSETS,
+        EEException=EEException,
+        Feature=Feature,
+        FeatureCollection=FeatureCollection,
+        Filter=Filter,
+        Image=Image,
+        ImageCollection=ImageCollection,
+        Reducer=Reducer,
+        Initialize=lambda *args, **kwargs: None,
+        Authenticate=lambda *args, **kwargs: None,
+        data=types.SimpleNamespace(is_initialized=lambda: True),
+        ee_exception=types.SimpleNamespace(EEException=EEException),
+    )
+    sys.modules["ee"] = module
+    for name in ("watergeo.common", "watergeo.foliumap", "watergeo.watergeo"):
+        if name in sys.modules and hasattr(sys.modules[name], "ee"):
+            sys.modules[name].ee = module
+    return module
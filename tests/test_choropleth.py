@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.choropleth`."""
+
+
+import unittest
+from unittest import mock
+
+import geopandas as gpd
+import numpy as np
+
+from watergeo import choropleth, common
+from tests.test_vector import COUNTIES
+
+
+class TestClassify(unittest.TestCase):
+    """Tests for the classification schemes."""
+
+    values = np.array([1, 2, 3, 10, 11, 12, 30, 31, 32.0])
+
+    def test_schemes(self):
+        breaks, classes = choropleth.classify(self.values, "natural_breaks", k=3)
+        np.testing.assert_array_equal(breaks, [3, 12, 32])
+        np.testing.assert_array_equal(classes, [0, 0, 0, 1, 1, 1, 2, 2, 2])
+
+        breaks, _ = choropleth.classify(self.values, "equal_interval", k=3)
+        np.testing.assert_allclose(breaks, [11 + 1 / 3, 21 + 2 / 3, 32])
+
+        breaks, classes = choropleth.classify(self.values, "quantiles", k=3)
+        self.assertEqual(np.bincount(classes).tolist(), [3, 3, 3])
+
+    def test_custom_bins_and_missing_values(self):
+        breaks, classes = choropleth.classify([1, np.nan, 5, 100], bins=[4, 2, 10])
+        np.testing.assert_array_equal(breaks, [2, 4, 10])
+        np.testing.assert_array_equal(classes, [0, -1, 2, 2])
+
+    def test_natural_breaks_of_sampled_values(self):
+        values = np.concatenate([np.full(3000, 1.0), np.full(3000, 50.0), np.full(3000, 100.0)])
+        np.testing.assert_array_equal(
+            choropleth.natural_breaks(values, k=3, max_samples=500), [1, 50, 100]
+        )
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            choropleth.classify(self.values, "jenks")
+
+
+class TestChoropleth(unittest.TestCase):
+    """Tests for the precomputed styles and the choropleth layers."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gdf = gpd.read_file(COUNTIES)
+
+    def test_styles(self):
+        styles = choropleth.ChoroplethStyles(self.gdf, ["WFPOP93", "STATE_NAME"], k=4, cmap="Blues")
+        self.assertEqual(len(styles.colors["WFPOP93"]), len(self.gdf))
+        self.assertEqual(set(styles.colors["WFPOP93"]), set(styles.palettes["WFPOP93"]))
+        self.assertEqual(set(styles.colors["STATE_NAME"]), {"#cccccc"})
+        self.assertEqual(len(styles.legend("WFPOP93")), 4)
+
+    def test_folium_embeds_classes_of_all_columns(self):
+        from watergeo import foliumap
+
+        with mock.patch.object(common, "_ee_initialized", True):
+            m = foliumap.Map()
+        data = self.gdf[["FIPS", "WFPOP93", "BFPOP93"]]
+        m.add_choropleth(COUNTIES, data, ["FIPS", "WFPOP93", "BFPOP93"], "feature.properties.FIPS")
+
+        switcher = [c for c in m._children.values() if c._name == "ColumnSwitcher"][0]
+        self.assertEqual(switcher.columns, ["WFPOP93", "BFPOP93"])
+        self.assertEqual(len(switcher.classes["BFPOP93"]), len(self.gdf))
+        html = m.get_root().render()
+        self.assertEqual(html.count('"type": "Polygon"') + html.count('"type": "MultiPolygon"'), len(self.gdf))
+
+    def test_ipyleaflet_switches_styles(self):
+        from watergeo import watergeo
+
+        with mock.patch.object(common, "_ee_initialized", True):
+            m = watergeo.Map()
+        m.add_choropleth(self.gdf, ["WFPOP93", "BFPOP93"], key_on="FIPS", scheme="natural_breaks")
+        layer = m.layers[-1]
+        styles = layer.choropleth_styles
+        dropdown = [c.widget for c in m.controls if isinstance(getattr(c, "widget", None), watergeo._ColumnDropdown)][0]
+        fills = [f["properties"]["style"]["fillColor"] for f in layer.data["features"]]
+        self.assertEqual(fills, styles.colors["WFPOP93"].tolist())
+        classes = [f["properties"]["classes"] for f in layer.data["features"]]
+        self.assertEqual([c[1] for c in classes], styles.classes["BFPOP93"].tolist())
+        self.assertEqual(dropdown.palettes["BFPOP93"], styles.palettes["BFPOP93"] + ["#cccccc"])
+
+        # Switching only syncs the column name, not the features
+        with mock.patch.object(layer, "send_state") as layer_sync, mock.patch.object(
+            dropdown, "send_state"
+        ) as dropdown_sync:
+            layer.show_column("BFPOP93")
+        self.assertEqual(layer.column, "BFPOP93")
+        self.assertEqual(dropdown.value, "BFPOP93")
+        self.assertNotIn(mock.call(key="data"), layer_sync.call_args_list)
+        self.assertEqual(dropdown_sync.call_args_list, [mock.call(key="value")])
+
+        dropdown.value = "WFPOP93"
+        self.assertEqual(layer.column, "WFPOP93")
+        with self.assertRaises(ValueError):
+            layer.show_column("FIPS")
+
+    def test_key_on_feature_id(self):
+        import pandas as pd
+
+        from watergeo import foliumap, watergeo
+
+        geojson = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "id": state,
+                    "properties": {"rate": rate},
+                    "geometry": {"type": "Point", "coordinates": [x, 40.0]},
+                }
+                for x, (state, rate) in enumerate([("OH", 5.0), ("PA", 6.0), ("WV", 7.0)])
+            ],
+        }
+        df = pd.DataFrame({"State": ["WV", "OH", "PA"], "Unemployment": [7.0, 5.0, 6.0]})
+
+        with mock.patch.object(common, "_ee_initialized", True):
+            m = foliumap.Map()
+        m.add_choropleth(geojson, df, ["State", "Unemployment"], key_on="feature.id", k=3)
+        switcher = [c for c in m._children.values() if c._name == "ColumnSwitcher"][0]
+        self.assertEqual(list(switcher.classes["Unemployment"]), [0, 1, 2])
+
+        with mock.patch.object(common, "_ee_initialized", True):
+            m = watergeo.Map()
+        m.add_choropleth(geojson, "rate", key_on="id", k=3)
+        ids = [feature["properties"]["id"] for feature in m.layers[-1].data["features"]]
+        self.assertEqual(ids, ["OH", "PA", "WV"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.cli`."""
+
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import box
+
+from watergeo import cli
+from tests.test_zonal import write_raster
+
+
+class TestBatchJobs(unittest.TestCase):
+    """Tests for the batch-job runner."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+        data = np.arange(40 * 60, dtype="float32").reshape(40, 60)
+        write_raster(os.path.join(self.dir, "values.tif"), data)
+        zones = gpd.GeoDataFrame(
+            {"name": ["a", "b"]}, geometry=[box(0, 20, 30, 40), box(30, 0, 60, 25)], crs="EPSG:4326"
+        )
+        zones.to_file(os.path.join(self.dir, "zones.geojson"))
+        self.spec = os.path.join(self.dir, "jobs.json")
+        self.write_spec(
+            [
+                {
+                    "name": "mean",
+                    "type": "zonal_stats",
+                    "raster": "values.tif",
+                    "zones": "zones.geojson",
+                    "output": "out/mean.geojson",
+                    "stat_type": ["MEAN", "MAXIMUM"],
+                },
+                {
+                    "name": "map",
+                    "type": "static_map",
+                    "layers": [{"path": "out/mean.geojson", "column": "mean"}],
+                    "output": "out/mean.png",
+                },
+                {
+                    "name": "sum",
+                    "type": "zonal_stats",
+                    "raster": "values.tif",
+                    "zones": "zones.geojson",
+                    "output": "out/sum.csv",
+                    "stat_type": "SUM",
+                },
+            ]
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_spec(self, jobs):
+        with open(self.spec, "w") as f:
+            json.dump({"workers": 2, "report": "out/report.json", "jobs": jobs}, f)
+
+    def run_main(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            status = cli.main([self.spec, "-q", *args])
+        with open(os.path.join(self.dir, "out", "report.json")) as f:
+            return status, {entry["name"]: entry for entry in json.load(f)}
+
+    def test_load_spec_resolves_paths_and_dependencies(self):
+        jobs = cli.load_spec(self.spec)["jobs"]
+        self.assertEqual(jobs[0]["inputs"], [os.path.join(self.dir, "values.tif"), os.path.join(self.dir, "zones.geojson")])
+        self.assertEqual(jobs[1]["inputs"], [os.path.join(self.dir, "out", "mean.geojson")])
+        self.assertEqual(cli._dependencies(jobs), {"mean": set(), "map": {"mean"}, "sum": set()})
+
+    def test_runs_jobs_then_skips_up_to_date(self):
+        status, report = self.run_main()
+        self.assertEqual(status, 0)
+        self.assertEqual({entry["status"] for entry in report.values()}, {"done"})
+        self.assertTrue(os.path.getsize(os.path.join(self.dir, "out", "mean.png")) > 0)
+        mean = gpd.read_file(os.path.join(self.dir, "out", "mean.geojson"))
+        self.assertEqual(list(mean["name"]), ["a", "b"])
+
+        status, report = self.run_main()
+        self.assertEqual({entry["status"] for entry in report.values()}, {"up to date"})
+
+        # A newer input reruns the jobs that read it, and the jobs that read their outputs
+        future = os.path.getmtime(self.spec) + 10
+        os.utime(os.path.join(self.dir, "zones.geojson"), (future, future))
+        status, report = self.run_main("--only", "mean", "map")
+        self.assertEqual([report["mean"]["status"], report["map"]["status"]], ["done", "done"])
+        self.assertNotIn("sum", report)
+
+    def test_failed_job_blocks_dependents(self):
+        os.remove(os.path.join(self.dir, "values.tif"))
+        status, report = self.run_main()
+        self.assertEqual(status, 1)
+        self.assertEqual(report["mean"]["status"], "failed")
+        self.assertEqual(report["map"]["status"], "not run")
+        self.assertEqual(report["sum"]["status"], "failed")
+
+    def test_rejects_unknown_job_type(self):
+        self.write_spec([{"type": "reproject", "output": "out.tif"}])
+        with self.assertRaises(ValueError):
+            cli.load_spec(self.spec)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.common`."""
+
+
+import threading
+import unittest
+from unittest import mock
+
+from watergeo import common
+
+
+class FakeEEObject:
+    """Stands in for an Earth Engine object with a serialized expression."""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.calls = 0
+
+    def serialize(self):
+        return self.expression
+
+    def getInfo(self):
+        self.calls += 1
+        return {}
+
+
+class TestEEInitialize(unittest.TestCase):
+    """Tests for the session-wide Earth Engine initialization."""
+
+    def setUp(self):
+        common._ee_initialized = False
+
+    def tearDown(self):
+        common._ee_initialized = False
+
+    def test_initializes_once_across_threads(self):
+        with mock.patch.object(
+            common, "ee_is_initialized", return_value=False
+        ), mock.patch.object(common.ee, "Initialize") as initialize:
+            threads = [threading.Thread(target=common.ee_initialize) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            common.ee_initialize()
+        self.assertEqual(initialize.call_count, 1)
+
+    def test_authenticates_on_failure(self):
+        with mock.patch.object(
+            common, "ee_is_initialized", return_value=False
+        ), mock.patch.object(
+            common.ee, "Initialize", side_effect=[Exception("no credentials"), None]
+        ) as initialize, mock.patch.object(
+            common.ee, "Authenticate"
+        ) as authenticate:
+            common.ee_initialize(authenticate=True)
+        authenticate.assert_called_once()
+        self.assertEqual(initialize.call_count, 2)
+
+
+class TestEECheckObject(unittest.TestCase):
+    """Tests for the Earth Engine object validation cache."""
+
+    def test_same_expression_is_checked_once(self):
+        first = FakeEEObject("expression-1")
+        second = FakeEEObject("expression-1")
+        common.ee_check_object(first)
+        common.ee_check_object(second)
+        self.assertEqual(first.calls + second.calls, 1)
+
+    def test_invalid_object_is_not_cached(self):
+        invalid = FakeEEObject("expression-2")
+        invalid.getInfo = mock.Mock(side_effect=common.ee.EEException("invalid"))
+        for _ in range(2):
+            with self.assertRaises(common.ee.EEException):
+                common.ee_check_object(invalid)
+        self.assertEqual(invalid.getInfo.call_count, 2)
+
+
+class TestGetMapId(unittest.TestCase):
+    """Tests for the Earth Engine map ID cache."""
+
+    def setUp(self):
+        common.map_id_cache.clear()
+
+    def test_reuses_map_id_for_equivalent_vis_params(self):
+        image = FakeEEObject("image-1")
+        image.getMapId = mock.Mock(return_value={"mapid": "abc"})
+        with mock.patch.object(common.ee, "Image", side_effect=lambda obj: obj):
+            first = common.get_map_id(image, {"bands": ["B4", "B3"], "min": 0})
+            second = common.get_map_id(image, {"min": 0.0, "bands": "B4,B3"})
+            common.get_map_id(image, {"bands": ["B4", "B3"], "min": 1})
+        self.assertIs(first, second)
+        self.assertEqual(image.getMapId.call_count, 2)
+        self.assertEqual(common.map_id_cache.hits, 1)
+        self.assertEqual(common.map_id_cache.misses, 2)
+
+
+class FakeZones:
+    def __init__(self, n):
+        self.n = n
+
+    def size(self):
+        return mock.Mock(getInfo=lambda: self.n)
+
+    def toList(self, count, offset=0):
+        return list(range(offset, min(offset + count, self.n)))
+
+
+class FakeResult:
+    def __init__(self, ids, tile_scale):
+        self.ids = ids
+        self.tile_scale = tile_scale
+
+    def first(self):
+        return mock.Mock(propertyNames=lambda: mock.Mock(getInfo=lambda: ["id", "mean"]))
+
+    def select(self, *args):
+        return self
+
+    def getDownloadURL(self, filetype, selectors, filename):
+        if len(self.ids) > 2 and self.tile_scale < 2:
+            raise common.ee.EEException("User memory limit exceeded.")
+        return "ids=" + ",".join(str(i) for i in self.ids)
+
+
+class FakeRaster:
+    def reduceRegions(self, collection, reducer, scale, crs, tileScale):
+        return FakeResult(collection, tileScale)
+
+
+def fake_get(url, **kwargs):
+    ids = url.split("=", 1)[1].split(",")
+    content = "id,mean\n" + "".join(f"{i},{int(i) * 10}\n" for i in ids)
+    return mock.Mock(status_code=200, content=content.encode())
+
+
+class TestZonalStatsBatched(unittest.TestCase):
+    """Tests for the batched mode of `zonal_stats`."""
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_splits_failing_chunks_and_merges_in_order(self):
+        import os
+
+        filename = os.path.join(self.tmpdir.name, "stats.csv")
+        with mock.patch.object(
+            common.ee, "FeatureCollection", side_effect=lambda ids: ids
+        ), mock.patch.object(common.requests, "get", side_effect=fake_get):
+            common._zonal_stats_batched(
+                FakeRaster(),
+                FakeZones(11),
+                filename,
+                reducer=None,
+                scale=30,
+                crs=None,
+                tile_scale=1,
+                batch_size=4,
+                max_workers=2,
+                verbose=False,
+            )
+        with open(filename) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "id,mean")
+        self.assertEqual(lines[1:], [f"{i},{i * 10}" for i in range(11)])
+
+    def test_returns_dataframe_without_writing(self):
+        import os
+
+        filename = os.path.join(self.tmpdir.name, "stats.csv")
+        with mock.patch.object(
+            common.ee, "FeatureCollection", side_effect=lambda ids: ids
+        ), mock.patch.object(common.requests, "get", side_effect=fake_get):
+            df = common._zonal_stats_batched(
+                FakeRaster(),
+                FakeZones(11),
+                filename,
+                reducer=None,
+                scale=30,
+                crs=None,
+                tile_scale=1,
+                batch_size=4,
+                verbose=False,
+                return_df=True,
+            )
+        self.assertFalse(os.path.exists(filename))
+        self.assertEqual(df["id"].tolist(), list(range(11)))
+        self.assertEqual(df["mean"].tolist(), [i * 10 for i in range(11)])
+
+
+class FakePage:
+    """A page of feature ids whose first download attempt fails."""
+
+    attempts = {}
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def getDownloadURL(self, filetype, selectors, filename):
+        key = tuple(self.ids)
+        FakePage.attempts[key] = FakePage.attempts.get(key, 0) + 1
+        if FakePage.attempts[key] == 1:
+            raise common.ee.EEException("Too many concurrent aggregations.")
+        return "ids=" + ",".join(str(i) for i in self.ids)
+
+
+class TestEEExportVector(unittest.TestCase):
+    """Tests for `ee_export_vector`."""
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        FakePage.attempts = {}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fetches_property_names_once(self):
+        import os
+
+        fc = mock.Mock(spec=common.ee.FeatureCollection)
+        fc.select.return_value = fc
+        fc.first.return_value.propertyNames.return_value.getInfo.return_value = ["id"]
+        response = mock.Mock(status_code=200)
+        response.iter_content.return_value = [b"id\n", b"1\n"]
+        filename = os.path.join(self.tmpdir.name, "out.csv")
+        with mock.patch.object(common.requests, "get", return_value=response):
+            common.ee_export_vector(fc, filename, verbose=False)
+        self.assertEqual(fc.first.return_value.propertyNames.return_value.getInfo.call_count, 1)
+        with open(filename) as f:
+            self.assertEqual(f.read(), "id\n1\n")
+
+    def test_paged_download_retries_and_concatenates(self):
+        import os
+
+        filename = os.path.join(self.tmpdir.name, "out.csv")
+        with mock.patch.object(
+            common.ee, "FeatureCollection", side_effect=FakePage
+        ), mock.patch.object(common.requests, "get", side_effect=fake_get), mock.patch.object(
+            common.time, "sleep"
+        ) as sleep:
+            common._export_vector_paged(
+                FakeZones(10), filename, ["id", "mean"], page_size=3, max_workers=2, verbose=False
+            )
+        with open(filename) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines, ["id,mean"] + [f"{i},{i * 10}" for i in range(10)])
+        self.assertEqual(sleep.call_count, 4)
+
+    def test_paged_download_of_empty_collection(self):
+        import os
+        import zipfile
+
+        import geopandas as gpd
+
+        with mock.patch.object(common.requests, "get") as get:
+            df = common._export_vector_paged(
+                FakeZones(0), "out.csv", ["id", "mean"], page_size=3, verbose=False, return_df=True
+            )
+            self.assertEqual((len(df), list(df.columns)), (0, ["id", "mean"]))
+
+            filename = os.path.join(self.tmpdir.name, "out.csv")
+            common._export_vector_paged(FakeZones(0), filename, ["id", "mean"], page_size=3, verbose=False)
+            with open(filename) as f:
+                self.assertEqual(f.read().splitlines(), ["id,mean"])
+
+            filename = os.path.join(self.tmpdir.name, "out.geojson")
+            common._export_vector_paged(FakeZones(0), filename, [".geo", "id"], page_size=3, verbose=False)
+            self.assertEqual(len(gpd.read_file(filename)), 0)
+
+            filename = os.path.join(self.tmpdir.name, "out.shp")
+            common._export_vector_paged(
+                FakeZones(0), filename, ["id"], page_size=3, verbose=False, keep_zip=True
+            )
+            self.assertEqual(list(gpd.read_file(filename).columns), ["id", "geometry"])
+            with zipfile.ZipFile(os.path.join(self.tmpdir.name, "out.zip")) as z:
+                self.assertIn("out.shp", z.namelist())
+        get.assert_not_called()
+
+class TestContentToDf(unittest.TestCase):
+    """Tests for parsing downloads in memory."""
+
+    def test_reads_zipped_shapefile_from_memory(self):
+        import io
+        import os
+        import tempfile
+        import zipfile
+
+        import geopandas as gpd
+        from shapely.geometry import Point
+
+        gdf = gpd.GeoDataFrame({"id": [1, 2]}, geometry=[Point(0, 0), Point(1, 1)], crs="EPSG:4326")
+        buffer = io.BytesIO()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gdf.to_file(os.path.join(tmpdir, "points.shp"))
+            with zipfile.ZipFile(buffer, "w") as z:
+                for name in os.listdir(tmpdir):
+                    z.write(os.path.join(tmpdir, name), name)
+
+        result = common._content_to_df(buffer.getvalue(), "shp")
+        self.assertEqual(result["id"].tolist(), [1, 2])
+        self.assertEqual(result.crs, gdf.crs)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.export`."""
+
+
+import base64
+import gzip
+import json
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from watergeo import common, export, foliumap, watergeo
+from tests.test_vector import COUNTIES
+
+
+class TestCompactExport(unittest.TestCase):
+    """Tests for the compact HTML export."""
+
+    def setUp(self):
+        self.patcher = mock.patch.object(common, "_ee_initialized", True)
+        self.patcher.start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.m = foliumap.Map()
+        self.m.add_geojson(COUNTIES, name="left")
+        self.m.add_geojson(COUNTIES, name="right")
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp.cleanup()
+
+    def test_inline_data_is_compressed_once(self):
+        html = self.m.to_html(compact=True)
+        report = self.m.export_report
+        self.assertEqual([entry["layer"] for entry in report], ["left", "right"])
+        self.assertTrue(all(entry["shared"] for entry in report))
+        self.assertEqual(report[0]["dataset"], report[1]["dataset"])
+        self.assertLess(report[0]["compressed_bytes"], report[0]["json_bytes"] / 2)
+
+        blocks = re.findall(r'id="watergeo-data-(\w+)">(.*?)</script>', html)
+        self.assertEqual([digest for digest, _ in blocks], [report[0]["dataset"]])
+        data = json.loads(gzip.decompress(base64.b64decode(blocks[0][1])))
+        self.assertEqual(len(data["features"]), 408)
+        self.assertEqual(html.count("watergeoData("), 2)
+        self.assertNotIn("$.ajax", html)
+        self.assertLess(len(html), len(self.m.get_root().render()) / 4)
+
+    def test_external_files(self):
+        filename = os.path.join(self.tmp.name, "report.html")
+        self.m.to_html(filename, compact=True, mode="external")
+        files = os.listdir(os.path.join(self.tmp.name, "report_files"))
+        self.assertEqual(files, [self.m.export_report[0]["dataset"] + ".json.gz"])
+        with open(filename) as f:
+            self.assertIn(f'"report_files/{files[0]}"', f.read())
+
+    def test_small_layers_stay_embedded(self):
+        m = foliumap.Map()
+        m.add_geojson({"type": "FeatureCollection", "features": []}, name="empty")
+        html = m.to_html(compact=True)
+        self.assertEqual(m.export_report[0]["compressed_bytes"], None)
+        self.assertNotIn("watergeoData", html)
+
+
+class TestWidgetExport(unittest.TestCase):
+    """Tests for the HTML export of ipyleaflet maps."""
+
+    def test_to_html_reports_layer_sizes(self):
+        with mock.patch.object(common, "_ee_initialized", True):
+            m = watergeo.Map()
+        m.add_geojson(COUNTIES, name="counties")
+        html = m.to_html()
+        self.assertIn("application/vnd.jupyter.widget-state+json", html)
+        self.assertEqual([entry["layer"] for entry in m.export_report], ["counties"])
+        self.assertGreater(m.export_report[0]["json_bytes"], 1024**2)
+
+
+class TestHtmlCache(unittest.TestCase):
+    """Tests for the content-keyed cache of rendered maps."""
+
+    def setUp(self):
+        self.patcher = mock.patch.object(common, "_ee_initialized", True)
+        self.patcher.start()
+        self.cache = mock.patch.object(export, "_html_cache", export.LRUCache(maxsize=4))
+        self.cache.start()
+
+    def tearDown(self):
+        self.cache.stop()
+        self.patcher.stop()
+
+    def build(self, color="red"):
+        m = foliumap.Map()
+        m.add_geojson(COUNTIES, name="counties", style_function=lambda feature: {"color": color})
+        return m
+
+    def test_fingerprint_ignores_element_ids(self):
+        fingerprint = export.map_fingerprint(self.build())
+        self.assertIsNotNone(fingerprint)
+        self.assertEqual(export.map_fingerprint(self.build()), fingerprint)
+        self.assertNotEqual(export.map_fingerprint(self.build("blue")), fingerprint)
+
+        m = self.build()
+        m.add_geojson(COUNTIES, name="copy")
+        self.assertNotEqual(export.map_fingerprint(m), fingerprint)
+
+    def test_widget_fingerprint(self):
+        m = watergeo.Map()
+        fingerprint = export.map_fingerprint(m)
+        self.assertEqual(export.map_fingerprint(watergeo.Map()), fingerprint)
+        m.zoom = 7
+        self.assertNotEqual(export.map_fingerprint(m), fingerprint)
+
+    def test_to_streamlit_renders_once(self):
+        components = mock.MagicMock()
+        streamlit = mock.MagicMock()
+        streamlit.components.v1 = components
+        modules = {
+            "streamlit": streamlit,
+            "streamlit.components": streamlit.components,
+            "streamlit.components.v1": components,
+        }
+        with mock.patch.dict("sys.modules", modules):
+            self.build().to_streamlit()
+            self.build().to_streamlit()
+            self.build("blue").to_streamlit()
+
+        first, second, third = [call.args[0] for call in components.html.call_args_list]
+        self.assertIs(first, second)
+        self.assertIsNot(first, third)
+        info = export.get_html_cache().info()
+        self.assertEqual((info["hits"], info["misses"]), (1, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.foliumap`."""
+
+
+import unittest
+from unittest import mock
+
+from watergeo import common, foliumap
+
+
+class FakeImage:
+    def __init__(self, index):
+        self.index = index
+
+    def serialize(self):
+        return f"image-{self.index}"
+
+    def getMapId(self, vis_params):
+        return {"tile_fetcher": mock.Mock(url_format=f"https://tiles/{self.index}/{{z}}/{{x}}/{{y}}")}
+
+
+class FakeImageCollection:
+    """Records the number of server round trips made by add_time_slider."""
+
+    def __init__(self, dates):
+        self.dates = dates
+        self.round_trips = 0
+
+    def map(self, func):
+        return self
+
+    def aggregate_array(self, prop):
+        collection = self
+
+        class _List:
+            def getInfo(self):
+                collection.round_trips += 1
+                return list(collection.dates)
+
+        return _List()
+
+    def toList(self, count):
+        return mock.Mock(get=lambda i: FakeImage(i))
+
+
+class TestFoliumMap(unittest.TestCase):
+    """Tests for `watergeo.foliumap.Map`."""
+
+    def setUp(self):
+        common._ee_initialized = True
+        common.map_id_cache.clear()
+        self.patcher = mock.patch.object(common.ee, "Image", side_effect=lambda obj: obj)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        common._ee_initialized = False
+
+    def test_add_time_slider_preserves_order_with_one_round_trip(self):
+        dates = [f"2020-01-{day:02d}" for day in range(1, 21)]
+        collection = FakeImageCollection(dates)
+        progress = []
+        m = foliumap.Map()
+        m.add_time_slider(
+            collection, {}, "NDWI", max_workers=4, progress=lambda *args: progress.append(args)
+        )
+
+        layers = [
+            child for child in m._children.values() if child.layer_name.startswith("NDWI")
+        ]
+        self.assertEqual([layer.layer_name for layer in layers], [f"NDWI {d}" for d in dates])
+        self.assertEqual(layers[3].tiles, "https://tiles/3/{z}/{x}/{y}")
+        self.assertEqual(collection.round_trips, 1)
+        self.assertEqual(progress[-1], (20, 20))
+
+    def test_add_vector_tiles(self):
+        from tests.test_vector import COUNTIES
+        from watergeo.tileserver import get_tile_server
+
+        m = foliumap.Map()
+        m.add_vector(COUNTIES, name="counties", mode="tiles")
+
+        layer = list(m._children.values())[-1]
+        self.assertEqual(layer.layer_name, "counties")
+        self.assertTrue(layer.url.startswith(get_tile_server().url))
+        self.assertTrue(layer.url.endswith("/{z}/{x}/{y}.pbf"))
+        self.assertIn("layer", layer.options["vectorTileLayerStyles"])
+
+    def test_add_geojson_file_keeps_ids_and_lists(self):
+        import json
+        import os
+        import tempfile
+
+        data = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "id": "OH",
+                    "properties": {"years": [2019, 2020]},
+                    "geometry": {"type": "Point", "coordinates": [-82.9, 40.0]},
+                }
+            ],
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "states.geojson")
+            with open(path, "w") as f:
+                json.dump(data, f)
+            m = foliumap.Map()
+            m.add_geojson(path, name="states")
+
+        layer = list(m._children.values())[-1]
+        self.assertEqual(layer.data["features"][0]["id"], "OH")
+        self.assertEqual(layer.data["features"][0]["properties"], {"years": [2019, 2020]})
+        self.assertIn("[2019, 2020]", m.get_root().render())
+
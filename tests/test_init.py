@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+"""Tests for the lazy top-level `watergeo` namespace."""
+
+
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ["ee", "folium", "geopandas", "ipyleaflet", "ipywidgets", "pandas"]
+
+
+def _run(code):
+    return subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+class TestLazyImport(unittest.TestCase):
+    """Tests for the lazy loading in `watergeo/__init__.py`."""
+
+    def test_import_does_not_load_heavy_dependencies(self):
+        code = (
+            "import sys, watergeo; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        )
+        self.assertEqual(_run(code), "")
+
+    def test_utility_does_not_load_heavy_dependencies(self):
+        code = (
+            "import sys, watergeo; watergeo.utility.csv_to_df; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        )
+        self.assertEqual(_run(code), "")
+
+    def test_submodules_resolve(self):
+        import watergeo
+
+        self.assertIs(watergeo.utility, sys.modules["watergeo.utility"])
+        self.assertIn("common", dir(watergeo))
+        with self.assertRaises(AttributeError):
+            watergeo.__missing__
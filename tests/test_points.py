@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.points`."""
+
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from watergeo import common, points
+
+
+class TestHeatmapBinning(unittest.TestCase):
+    """Tests for the aggregation of points into grids."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.lat = rng.normal(37, 1, 50_000)
+        self.lon = rng.normal(-82, 1, 50_000)
+        self.weight = rng.random(50_000)
+
+    def test_point_arrays(self):
+        df = pd.DataFrame({"lat": [1.0, 2.0, np.nan], "lon": [3.0, 4.0, 5.0], "v": [1.0, 2.0, 3.0]})
+        lat, lon, weight = points.point_arrays(df, "lat", "lon", "v")
+        np.testing.assert_array_equal(lat, [1, 2])
+        np.testing.assert_array_equal(weight, [1, 2])
+
+        lat, lon, weight = points.point_arrays([[1, 3], [2, 4]])
+        np.testing.assert_array_equal(weight, [1, 1])
+        with self.assertRaises(ValueError):
+            points.point_arrays([1, 2, 3])
+
+    def test_bins_keep_total_weight(self):
+        for shape in ("square", "hex"):
+            lat, lon, weight = points.bin_points(self.lat, self.lon, self.weight, 6, shape=shape)
+            self.assertLess(len(weight), 1000)
+            self.assertAlmostEqual(weight.sum(), self.weight.sum())
+            self.assertTrue(np.all((lat >= self.lat.min()) & (lat <= self.lat.max())))
+
+    def test_pyramid_coarsens_with_zoom(self):
+        levels = points.heatmap_pyramid(self.lat, self.lon, self.weight, zooms=(2, 5, 8), shape="hex")
+        self.assertEqual([level[0] for level in levels], [2, 5, 8])
+        counts = [len(level[3]) for level in levels]
+        self.assertEqual(counts, sorted(counts))
+        self.assertAlmostEqual(levels[0][3].sum(), self.weight.sum())
+
+    def test_add_aggregated_heatmap(self):
+        from watergeo import foliumap
+
+        with mock.patch.object(common, "_ee_initialized", True):
+            m = foliumap.Map()
+        data = np.column_stack([self.lat, self.lon, self.weight])
+        m.add_heatmap(data, aggregate="square", zooms=(0, 4, 8))
+        group = [c for c in m._children.values() if hasattr(c, "cell_counts")][0]
+        self.assertEqual(list(group.cell_counts), [0, 4, 8])
+        self.assertLess(group.cell_counts[8], len(data) / 10)
+        self.assertIn("ZoomLevels", [c._name for c in m._children.values()])
+
+
+class TestClusterIndex(unittest.TestCase):
+    """Tests for the hierarchical point clusters."""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(1)
+        n = 20_000
+        cls.df = pd.DataFrame(
+            {
+                "latitude": rng.uniform(30, 45, n),
+                "longitude": rng.uniform(-100, -80, n),
+                "discharge": rng.lognormal(size=n),
+                "site": [f"G{i}" for i in range(n)],
+            }
+        )
+        cls.index = points.ClusterIndex(cls.df, aggregate={"discharge": "max"}, max_zoom=14)
+
+    def test_levels_keep_points_and_aggregates(self):
+        self.assertEqual(len(self.index), len(self.df))
+        for zoom in (0, 5, 10):
+            level = self.index.levels[zoom]
+            self.assertEqual(level["count"].sum(), len(self.df))
+            self.assertEqual(np.nanmax(level["discharge"]), self.df["discharge"].max())
+        counts = [len(self.index.levels[z]["x"]) for z in range(15)]
+        self.assertEqual(counts, sorted(counts))
+
+    def test_query_viewport(self):
+        bounds = ((35, -90), (37, -88))
+        features = self.index.query(bounds, 7)["features"]
+        self.assertTrue(features)
+        for feature in features:
+            lon, lat = feature["geometry"]["coordinates"]
+            self.assertTrue(35 <= lat <= 37 and -90 <= lon <= -88)
+        clusters = [f["properties"] for f in features if f["properties"].get("cluster")]
+        self.assertTrue(all(c["point_count"] > 1 and c["style"]["radius"] > 5 for c in clusters))
+
+        # Above max_zoom, every point is returned with its own properties
+        features = self.index.query(bounds, 15)["features"]
+        inside = self.df[self.df.latitude.between(35, 37) & self.df.longitude.between(-90, -88)]
+        self.assertEqual(len(features), len(inside))
+        self.assertEqual(set(features[0]["properties"]), {"discharge", "site"})
+
+    def test_mean_ignores_missing_values(self):
+        df = pd.DataFrame(
+            {"latitude": [40.0, 40.0, 40.0], "longitude": [-90.0] * 3, "q": [4.0, np.nan, "n/a"]}
+        )
+        index = points.ClusterIndex(df, aggregate={"q": "mean"}, max_zoom=4)
+        [cluster] = index.query(zoom=0)["features"]
+        self.assertEqual(cluster["properties"]["point_count"], 3)
+        self.assertEqual(cluster["properties"]["q"], 4.0)
+
+        df["q"] = np.nan
+        index = points.ClusterIndex(df, aggregate={"q": "mean"}, max_zoom=4)
+        self.assertIsNone(index.query(zoom=0)["features"][0]["properties"]["q"])
+
+    def test_unknown_aggregate(self):
+        with self.assertRaises(ValueError):
+            points.ClusterIndex(self.df, aggregate={"discharge": "median"})
+
+    def test_add_points_to_ipyleaflet_map(self):
+        from watergeo import watergeo
+
+        with mock.patch.object(common, "_ee_initialized", True):
+            m = watergeo.Map()
+        m.add_points(self.df, aggregate={"discharge": "max"}, debounce=0)
+        layer = m.layers[-1]
+        total = sum(f["properties"].get("point_count", 1) for f in layer.data["features"])
+        self.assertEqual(total, len(self.df))
+
+        m.set_trait("bounds", ((35, -90), (37, -88)))
+        m.set_trait("zoom", 20)
+        self.assertTrue(all("site" in f["properties"] for f in layer.data["features"]))
+
+    def test_add_points_to_folium_map(self):
+        import json
+        import urllib.request
+
+        from watergeo import foliumap
+
+        with mock.patch.object(common, "_ee_initialized", True):
+            m = foliumap.Map()
+        m.add_points(self.df, aggregate={"discharge": "max"})
+        script = [c for c in m._children.values() if c._name == "ClusterLayer"][0]
+        with urllib.request.urlopen(script.url + "/3/-180,-85,180,85.json") as response:
+            data = json.loads(response.read())
+        total = sum(f["properties"].get("point_count", 1) for f in data["features"])
+        self.assertEqual(total, len(self.df))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.raster`."""
+
+
+import gc
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+
+from watergeo import raster
+
+
+def write_cog(path, size=1024):
+    """Writes a random Cloud-Optimized GeoTIFF and returns its data."""
+    data = np.random.default_rng(0).integers(0, 255, (size, size)).astype("uint8")
+    with rasterio.open(
+        path,
+        "w",
+        driver="COG",
+        height=size,
+        width=size,
+        count=1,
+        dtype="uint8",
+        crs="EPSG:4326",
+        transform=from_bounds(-80, 35, -79, 36, size, size),
+        blocksize=256,
+    ) as dst:
+        dst.write(data, 1)
+    return data
+
+
+class FileServer:
+    """Serves the bytes of a file over HTTP, optionally with range requests, and records the requests.
+
+    Servers with head=False refuse HEAD requests, like presigned S3 URLs, and
+    servers with truncate=True send one byte less than requested.
+    """
+
+    def __init__(self, content, ranges=True, head=True, truncate=False):
+        self.content = content
+        self.ranges = ranges
+        self.head = head
+        self.truncate = truncate
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                if not server.head:
+                    self.send_response(403)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(server.content)))
+                self.send_header("ETag", '"v1"')
+                if server.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+
+            def do_GET(self):
+                match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+                if server.ranges and match:
+                    start, end = int(match[1]), int(match[2])
+                    body = server.content[start : end + 1 - server.truncate]
+                    self.send_response(206)
+                    self.send_header(
+                        "Content-Range", f"bytes {start}-{end}/{len(server.content)}"
+                    )
+                else:
+                    body = server.content
+                    self.send_response(200)
+                server.requests.append(len(body))
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/cog.tif"
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestRemoteRasters(unittest.TestCase):
+    """Tests for streaming and downloading remote rasters."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmp.name, "cog.tif")
+        cls.data = write_cog(path)
+        with open(path, "rb") as f:
+            cls.content = f.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {"WATERGEO_CACHE_DIR": self.cache_dir.name})
+        self.env.start()
+        raster._caches.clear()
+
+    def tearDown(self):
+        self.env.stop()
+        raster._caches.clear()
+        self.cache_dir.cleanup()
+
+    def test_streams_only_the_blocks_read(self):
+        server = FileServer(self.content)
+        try:
+            with raster.open_remote(server.url, block_size=16 * 1024) as src:
+                window = src.read(1, window=((0, 256), (0, 256)))
+            np.testing.assert_array_equal(window, self.data[:256, :256])
+            self.assertLess(sum(server.requests), len(self.content) / 2)
+
+            # A new reader finds the blocks in the on-disk cache
+            fetched = len(server.requests)
+            with raster.open_remote(server.url, block_size=16 * 1024) as src:
+                src.read(1, window=((0, 256), (0, 256)))
+            self.assertEqual(len(server.requests), fetched)
+        finally:
+            server.shutdown()
+
+    def test_downloads_once_without_range_support(self):
+        server = FileServer(self.content, ranges=False)
+        try:
+            path = raster.raster_source(server.url)
+            self.assertEqual(raster.raster_source(server.url), path)
+            self.assertEqual(server.requests, [len(self.content)])
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.content)
+            self.assertTrue(path.startswith(os.path.join(self.cache_dir.name, "downloads")))
+        finally:
+            server.shutdown()
+
+    def test_falls_back_to_range_get_without_head(self):
+        server = FileServer(self.content, head=False)
+        try:
+            with raster.open_remote(server.url, block_size=16 * 1024) as src:
+                self.assertEqual(src.range_reader.size, len(self.content))
+                window = src.read(1, window=((0, 256), (0, 256)))
+            np.testing.assert_array_equal(window, self.data[:256, :256])
+        finally:
+            server.shutdown()
+
+        server = FileServer(self.content, ranges=False, head=False)
+        try:
+            path = raster.raster_source(server.url)
+            self.assertEqual(raster.raster_source(server.url), path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.content)
+        finally:
+            server.shutdown()
+
+    def test_short_range_responses_are_not_cached(self):
+        server = FileServer(self.content, truncate=True)
+        try:
+            reader = raster.RangeReader(server.url, block_size=1024)
+            with self.assertRaises(ValueError):
+                reader.read(0, 4000)
+            self.assertIsNone(reader.cache.get(reader._block_key(0)))
+
+            server.truncate = False
+            self.assertEqual(reader.read(0, 4000), self.content[:4001])
+        finally:
+            server.shutdown()
+
+    def test_renders_tiles_of_streamed_raster(self):
+        server = FileServer(self.content)
+        try:
+            source = raster.RasterTileSource(raster.RasterReader(raster.raster_source(server.url)))
+            lat, lon = source.center()
+            self.assertAlmostEqual(lat, 35.5)
+            self.assertAlmostEqual(lon, -79.5)
+            self.assertEqual(source.tile(10, 285, 403)[:4], b"\x89PNG")
+            self.assertIsNone(source.tile(10, 0, 0))
+        finally:
+            server.shutdown()
+
+    def test_add_raster_serves_remote_tiles(self):
+        from watergeo import common, foliumap
+
+        server = FileServer(self.content)
+        try:
+            with mock.patch.object(common, "_ee_initialized", True):
+                m = foliumap.Map()
+            m.add_raster(server.url, name="cog", colormap="viridis")
+            layer = [c for c in m._children.values() if getattr(c, "layer_name", None) == "cog"][0]
+            url = layer.tiles.format(z=10, x=285, y=403)
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(response.read()[:4], b"\x89PNG")
+            self.assertEqual(layer.tile_source.style, {"colormap": "viridis"})
+        finally:
+            server.shutdown()
+
+
+class TestRasterPool(unittest.TestCase):
+    """Tests for the shared raster pool."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, "cog.tif")
+        write_cog(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_maps_share_readers_sources_and_tiles(self):
+        from watergeo import common, foliumap
+
+        pool = raster.RasterPool()
+        with mock.patch.object(raster, "_pool", pool), mock.patch.object(
+            common, "_ee_initialized", True
+        ):
+            layers = []
+            for _ in range(2):
+                m = foliumap.Map()
+                m.add_raster(self.path, name="cog", colormap="viridis")
+                layers.append(
+                    [c for c in m._children.values() if getattr(c, "layer_name", None) == "cog"][0]
+                )
+            gray = foliumap.Map()
+            gray.add_raster(self.path, name="gray", zoom_to_layer=False)
+
+        self.assertEqual(layers[0].tiles, layers[1].tiles)
+        self.assertIs(layers[0].tile_source, layers[1].tile_source)
+        url = layers[0].tiles.format(z=10, x=285, y=403)
+        for _ in range(3):
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(response.read()[:4], b"\x89PNG")
+
+        stats = pool.stats()
+        self.assertEqual((stats["rasters"], stats["layers"]), (1, 2))
+        self.assertEqual((stats["tiles"]["hits"], stats["tiles"]["misses"]), (2, 1))
+        self.assertEqual(stats["render"]["count"], 1)
+        self.assertGreater(stats["render"]["max_ms"], 0)
+
+    def test_releases_rasters_of_collected_layers(self):
+        from watergeo import common, foliumap
+        from watergeo.tileserver import get_tile_server
+
+        pool = raster.RasterPool()
+        with mock.patch.object(raster, "_pool", pool), mock.patch.object(
+            common, "_ee_initialized", True
+        ):
+            maps = [foliumap.Map() for _ in range(2)]
+            for m in maps:
+                m.add_raster(self.path, name="cog", zoom_to_layer=False)
+            del m
+        key = next(iter(pool.sources))
+
+        del maps[0]
+        gc.collect()
+        self.assertEqual((pool.stats()["rasters"], pool.stats()["layers"]), (1, 1))
+        self.assertIn(key, get_tile_server().sources)
+
+        del maps[0]
+        gc.collect()
+        self.assertEqual((pool.stats()["rasters"], pool.stats()["layers"]), (0, 0))
+        self.assertNotIn(key, get_tile_server().sources)
+
+    def test_releases_layers_collected_while_locked(self):
+        from watergeo import common, foliumap
+        from watergeo.tileserver import get_tile_server
+
+        pool = raster.RasterPool()
+        with mock.patch.object(raster, "_pool", pool), mock.patch.object(
+            common, "_ee_initialized", True
+        ):
+            m = foliumap.Map()
+            m.add_raster(self.path, name="cog", zoom_to_layer=False)
+        key = next(iter(pool.sources))
+        del m
+
+        def collect():
+            # Layer finalizers run in the thread that holds the lock
+            with pool._lock:
+                gc.collect()
+
+        thread = threading.Thread(target=collect, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual((pool.stats()["rasters"], pool.stats()["layers"]), (0, 0))
+        self.assertNotIn(key, get_tile_server().sources)
+
+    def test_opens_each_raster_once_outside_the_lock(self):
+        pool = raster.RasterPool()
+        opened = []
+        proceed = threading.Event()
+
+        def slow_source(data, stream=True):
+            opened.append(data)
+            proceed.wait(10)
+            return data
+
+        with mock.patch.object(raster, "raster_source", slow_source):
+            readers = []
+            threads = [
+                threading.Thread(target=lambda: readers.append(pool.reader(self.path, overviews=False)))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            while not opened:
+                time.sleep(0.01)
+            # The lock of the pool is free while the raster is opened
+            self.assertTrue(pool._lock.acquire(timeout=2))
+            pool._lock.release()
+            proceed.set()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(opened, [self.path])
+        self.assertEqual(len(readers), 2)
+        self.assertIs(readers[0], readers[1])
+
+    def test_changed_file_is_opened_again(self):
+        pool = raster.RasterPool()
+        reader = pool.reader(self.path)
+        self.assertIs(pool.reader(self.path), reader)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertIsNot(pool.reader(self.path), reader)
+
+
+class TestOverviews(unittest.TestCase):
+    """Tests for the overview builder."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "striped.tif")
+        with rasterio.open(
+            self.path,
+            "w",
+            driver="GTiff",
+            height=1000,
+            width=1200,
+            count=1,
+            dtype="float32",
+            crs="EPSG:4326",
+            transform=from_bounds(-80, 35, -79, 36, 1200, 1000),
+        ) as dst:
+            dst.write(np.ones((1000, 1200), dtype="float32"), 1)
+        self.env = mock.patch.dict(os.environ, {"WATERGEO_CACHE_DIR": self.tmp.name})
+        self.env.start()
+        raster._caches.clear()
+
+    def tearDown(self):
+        self.env.stop()
+        raster._caches.clear()
+        self.tmp.cleanup()
+
+    def test_overview_factors(self):
+        self.assertEqual(raster.overview_factors(4000, 3000), [2, 4, 8, 16])
+        self.assertEqual(raster.overview_factors(256, 100), [])
+
+    def test_builds_external_overviews(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        self.assertEqual(raster.build_overviews(self.path), self.path)
+        self.assertTrue(os.path.exists(self.path + ".ovr"))
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+        with rasterio.open(self.path) as src:
+            self.assertEqual(src.overviews(1), [2, 4, 8])
+
+    def test_builds_cached_copy(self):
+        path = raster.build_overviews(self.path, location="cache")
+        self.assertNotEqual(path, self.path)
+        self.assertEqual(raster.build_overviews(self.path, location="cache"), path)
+        with rasterio.open(path) as src:
+            self.assertEqual(src.overviews(1), [2, 4, 8])
+            self.assertEqual(src.block_shapes[0], (512, 512))
+        self.assertFalse(os.path.exists(self.path + ".ovr"))
+
+    def test_only_large_files_get_overviews(self):
+        size = os.path.getsize(self.path)
+        raster.ensure_overviews(self.path, threshold=size + 1)
+        self.assertFalse(os.path.exists(self.path + ".ovr"))
+        raster.ensure_overviews(self.path, threshold=size)
+        self.assertTrue(os.path.exists(self.path + ".ovr"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.tileproxy`."""
+
+
+import gc
+import os
+import re
+import tempfile
+import threading
+import unittest
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from watergeo import common, foliumap, tileproxy
+from watergeo.utility import DiskCache
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+class UpstreamServer:
+    """Stands in for a remote XYZ tile server and records the tiles requested."""
+
+    def __init__(self):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                match = re.match(r"/(\w)/(\d+)/(\d+)/(\d+)\.png", self.path)
+                server.requests.append(self.path)
+                if match is None or int(match[2]) > 10:
+                    self.send_response(404)
+                    body = b""
+                else:
+                    self.send_response(200)
+                    body = PNG + self.path.encode()
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/{{s}}/{{z}}/{{x}}/{{y}}.png"
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestTileProxy(unittest.TestCase):
+    """Tests for the caching tile proxy."""
+
+    def setUp(self):
+        self.upstream = UpstreamServer()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self.tmp.name, "tiles"))
+
+    def tearDown(self):
+        self.upstream.shutdown()
+        self.tmp.cleanup()
+
+    def test_fetches_each_tile_once(self):
+        source = tileproxy.ProxyTileSource(self.upstream.url, disk_cache=self.cache)
+        self.assertEqual(source.extension, "png")
+        self.assertEqual(source.tile(3, 4, 2), PNG + b"/a/3/4/2.png")
+        self.assertEqual(source.tile(3, 4, 2), PNG + b"/a/3/4/2.png")
+        self.assertIsNone(source.tile(11, 0, 0))
+        self.assertEqual(len(self.upstream.requests), 2)
+
+        # A new source, e.g., in another session, reads the tile from disk
+        source = tileproxy.ProxyTileSource(self.upstream.url, disk_cache=self.cache)
+        self.assertEqual(source.tile(3, 4, 2), PNG + b"/a/3/4/2.png")
+        self.assertEqual(len(self.upstream.requests), 2)
+
+    def test_seeds_bounding_box(self):
+        source = tileproxy.ProxyTileSource(self.upstream.url, disk_cache=self.cache)
+        self.assertEqual(tileproxy.tile_range([[35, -80], [36, -79]], 0), (0, 0, 0, 0))
+        self.assertEqual(tileproxy.tile_range([[35, -80], [36, -79]], 8), (71, 71, 100, 101))
+
+        count = source.seed([[35, -80], [36, -79]], range(0, 9))
+        self.assertEqual(count, 10)
+        self.assertEqual(len(self.upstream.requests), 10)
+        source.tile(8, 71, 101)
+        self.assertEqual(len(self.upstream.requests), 10)
+
+    def test_add_basemap_through_proxy(self):
+        with mock.patch.object(common, "_ee_initialized", True), mock.patch.object(
+            tileproxy, "_disk_cache", self.cache
+        ), mock.patch.dict(tileproxy._sources, clear=True):
+            m = foliumap.Map()
+            m.add_tile_layer(self.upstream.url, name="upstream", proxy=True)
+
+        layer = list(m._children.values())[-1]
+        self.assertFalse(layer.tiles.startswith(self.upstream.url[:20]))
+        with urllib.request.urlopen(layer.tiles.format(z=3, x=4, y=2)) as response:
+            self.assertEqual(response.headers.get("Content-Type"), "image/png")
+            self.assertEqual(response.read(), PNG + b"/a/3/4/2.png")
+        self.assertIs(layer.tile_source.disk_cache, self.cache)
+
+    def test_sources_share_memory_and_differ_by_arguments(self):
+        with mock.patch.object(tileproxy, "_disk_cache", self.cache), mock.patch.dict(
+            tileproxy._sources, clear=True
+        ):
+            source, url = tileproxy.proxy_tiles(self.upstream.url)
+            self.assertIs(tileproxy.proxy_tiles(self.upstream.url)[0], source)
+            other, other_url = tileproxy.proxy_tiles(self.upstream.url, subdomains="b")
+            self.assertNotEqual(other_url, url)
+            self.assertEqual(other.subdomains, "b")
+
+        self.assertIs(source.memory, tileproxy.get_memory_cache())
+        self.assertIs(other.memory, source.memory)
+        self.assertIs(other.session, source.session)
+        source.tile(3, 4, 2)
+        self.assertEqual(other.tile(3, 4, 2), PNG + b"/a/3/4/2.png")
+        self.assertEqual(len(self.upstream.requests), 1)
+
+    def test_source_is_dropped_with_its_layer(self):
+        server = tileproxy.get_tile_server()
+        with mock.patch.object(common, "_ee_initialized", True), mock.patch.object(
+            tileproxy, "_disk_cache", self.cache
+        ):
+            m = foliumap.Map()
+            m.add_tile_layer(self.upstream.url, name="upstream", proxy=True)
+        key = list(m._children.values())[-1].tile_source.key
+        self.assertIn(key, tileproxy._sources)
+
+        del m
+        gc.collect()
+        self.assertNotIn(key, tileproxy._sources)
+        self.assertNotIn(key, server.sources)
+
+
+if __name__ == "__main__":
+    unittest.main()
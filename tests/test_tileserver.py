@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.tileserver`."""
+
+
+import gc
+import math
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import geopandas as gpd
+import mapbox_vector_tile
+
+from watergeo import tileserver, vector
+from tests.test_vector import COUNTIES
+
+
+class EchoSource(tileserver.TileSource):
+    def tile(self, z, x, y):
+        if z == 0:
+            return None
+        return f"{z}/{x}/{y}".encode()
+
+
+def fetch(url):
+    with urllib.request.urlopen(url) as response:
+        return response.status, response.headers.get("Content-Type"), response.read()
+
+
+class TestTileServer(unittest.TestCase):
+    """Tests for the local tile server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = tileserver.TileServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_serves_registered_source(self):
+        key = self.server.register(EchoSource())
+        url = self.server.tile_url(key)
+        self.assertTrue(url.endswith(f"/{key}/{{z}}/{{x}}/{{y}}.png"))
+
+        status, content_type, body = fetch(url.format(z=3, x=4, y=2))
+        self.assertEqual((status, content_type, body), (200, "image/png", b"3/4/2"))
+        self.assertEqual(fetch(url.format(z=0, x=0, y=0))[0], 204)
+
+        self.server.unregister(key)
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            fetch(url.format(z=3, x=4, y=2))
+        self.assertEqual(cm.exception.code, 404)
+
+    def test_shared_server(self):
+        self.assertIs(tileserver.get_tile_server(), tileserver.get_tile_server())
+
+    def test_source_is_unregistered_with_its_last_layer(self):
+        class Layer:
+            pass
+
+        layers = [Layer(), Layer()]
+        key = self.server.register(EchoSource(), layer=layers[0])
+        self.server.attach(layers[1], key)
+
+        del layers[0]
+        gc.collect()
+        self.assertIn(key, self.server.sources)
+        self.server.detach(layers[0])
+        self.assertNotIn(key, self.server.sources)
+
+    def test_layers_collected_while_locked_are_released_later(self):
+        class Layer:
+            pass
+
+        layer = Layer()
+        layer.cycle = layer
+        key = self.server.register(EchoSource(), layer=layer)
+        del layer
+        with self.server._lock:
+            gc.collect()
+        self.assertIn(key, self.server.sources)
+        self.server.register(EchoSource())
+        self.assertNotIn(key, self.server.sources)
+
+    @mock.patch("watergeo.common._ee_initialized", True)
+    def test_layers_release_their_sources(self):
+        from watergeo import foliumap, watergeo
+
+        counties = gpd.read_file(COUNTIES).head(5)
+        server = tileserver.get_tile_server()
+
+        m = foliumap.Map()
+        m.add_vector_tiles(counties, name="counties")
+        key = [c for c in m._children.values() if hasattr(c, "tile_source")][0].url.split("/")[-4]
+        self.assertIn(key, server.sources)
+        del m
+        gc.collect()
+        self.assertNotIn(key, server.sources)
+
+        m = watergeo.Map()
+        m.add_vector_tiles(counties, name="counties")
+        layer = m.layers[-1]
+        key = layer.url.split("/")[-4]
+        self.assertIn(key, server.sources)
+        m.remove(layer)
+        self.assertNotIn(key, server.sources)
+
+
+class TestVectorTileSource(unittest.TestCase):
+    """Tests for the vector tiles cut from a GeoDataFrame."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.counties = gpd.read_file(COUNTIES).head(60)
+        cls.source = vector.VectorTileSource(cls.counties, layer_name="counties")
+
+    def test_tile_contains_features_in_view(self):
+        lon, lat = self.counties.to_crs("EPSG:4326").geometry.iloc[0].representative_point().coords[0]
+        z = 7
+        x, y = tile_index(lon, lat, z)
+        tile = mapbox_vector_tile.decode(self.source.tile(z, x, y))
+        features = tile["counties"]["features"]
+        self.assertIn(0, [f["id"] for f in features])
+        self.assertLess(len(features), len(self.counties))
+        self.assertIn("CNTY_NAME", features[0]["properties"])
+
+    def test_empty_tile(self):
+        self.assertIsNone(self.source.tile(3, 0, 0))
+
+    def test_tiles_are_cached(self):
+        before = self.source.cache.info()["hits"]
+        self.source.tile(4, 4, 6)
+        self.source.tile(4, 4, 6)
+        self.assertEqual(self.source.cache.info()["hits"], before + 1)
+
+
+def tile_index(lon, lat, z):
+    n = 2**z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+if __name__ == "__main__":
+    unittest.main()
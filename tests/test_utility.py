@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.utility`."""
+
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from watergeo.utility import DiskCache, LRUCache, cache_dir
+
+
+class TestLRUCache(unittest.TestCase):
+    """Tests for `LRUCache`."""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_expires_after_ttl(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.info()["misses"], 1)
+
+    def test_get_or_set_counts_hits_and_misses(self):
+        cache = LRUCache()
+        calls = []
+        for _ in range(3):
+            cache.get_or_set("key", lambda: calls.append(1) or len(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.info(), {"hits": 2, "misses": 1, "size": 1, "maxsize": 128})
+
+
+class TestDiskCache(unittest.TestCase):
+    """Tests for `DiskCache`."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip_and_stats(self):
+        cache = DiskCache(self.tmp.name)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", b"abc")
+        self.assertEqual(cache.get("a"), b"abc")
+        self.assertEqual(cache.info()["files"], 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = DiskCache(self.tmp.name, max_bytes=25)
+        for key in "abc":
+            cache.set(key, b"x" * 10)
+            os.utime(cache.path(key), (time.time() - 10, time.time() - 10))
+            if key == "b":
+                cache.get_path("a")
+        self.assertIsNotNone(cache.get_path("a"))
+        self.assertIsNone(cache.get_path("b"))
+        self.assertIsNotNone(cache.get_path("c"))
+        self.assertLessEqual(cache.info()["size"], 25)
+
+    def test_replaced_entries_are_not_counted_twice(self):
+        cache = DiskCache(self.tmp.name, max_bytes=25)
+        for _ in range(5):
+            cache.set("a", b"x" * 10)
+            self.assertEqual(cache._size, 10)
+        cache.set("a", b"x" * 4)
+        self.assertEqual(cache._size, 4)
+        self.assertEqual(cache.info()["size"], 4)
+
+    def test_cache_dir_honours_environment(self):
+        with mock.patch.dict(os.environ, {"WATERGEO_CACHE_DIR": self.tmp.name}):
+            path = cache_dir("tiles")
+        self.assertEqual(path, os.path.join(self.tmp.name, "tiles"))
+        self.assertTrue(os.path.isdir(path))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.vector`."""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import geopandas as gpd
+import shapely
+
+from watergeo import vector
+
+COUNTIES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "docs",
+    "examples",
+    "datasets",
+    "countiesAppalachia_ARC_ll83.shp",
+)
+
+
+class TestBuildLod(unittest.TestCase):
+    """Tests for the zoom-dependent levels of detail."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.counties = gpd.read_file(COUNTIES).head(60)
+        cls.levels, cls.report = vector.build_lod(cls.counties)
+
+    def test_levels_get_smaller_at_lower_zooms(self):
+        sizes = [self.report[zoom] for zoom, _ in self.levels]
+        self.assertEqual(sizes, sorted(sizes))
+        self.assertLess(self.report[0], self.report["original"] / 2)
+        self.assertLess(self.report[12], self.report["original"])
+        self.assertEqual(len(self.levels[0][1]["features"]), len(self.counties))
+
+    def test_coverage_stays_gap_free(self):
+        coarse = vector.to_gdf(self.levels[0][1])
+        original = shapely.union_all(self.counties.to_crs(4326).geometry.values).area
+        simplified = shapely.union_all(coarse.geometry.values).area
+        overlap = coarse.geometry.area.sum() - simplified
+        self.assertLess(overlap / original, 1e-3)
+
+    def test_lod_index(self):
+        self.assertEqual(vector.lod_index(self.levels, 2), 0)
+        self.assertEqual(vector.lod_index(self.levels, 6), 1)
+        self.assertEqual(vector.lod_index(self.levels, 18), len(self.levels) - 1)
+
+
+class TestReadVector(unittest.TestCase):
+    """Tests for the parsed-vector caches of read_vector()."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {"WATERGEO_CACHE_DIR": self.tmp.name})
+        self.env.start()
+        vector._disk_cache = None
+        vector.vector_cache.clear()
+        stem = os.path.join(self.tmp.name, "counties")
+        for ext in (".shp",) + vector.SHAPEFILE_SIDECARS:
+            if os.path.exists(COUNTIES[:-4] + ext):
+                shutil.copy(COUNTIES[:-4] + ext, stem + ext)
+        self.path = stem + ".shp"
+
+    def tearDown(self):
+        self.env.stop()
+        vector._disk_cache = None
+        vector.vector_cache.clear()
+        self.tmp.cleanup()
+
+    def test_reads_from_memory_then_disk(self):
+        first = vector.read_vector(self.path)
+        self.assertEqual(vector.get_vector_disk_cache().info()["files"], 1)
+
+        with mock.patch.object(vector, "_read_file") as read_file:
+            second = vector.read_vector(self.path)
+            vector.vector_cache.clear()
+            third = vector.read_vector(self.path)
+        read_file.assert_not_called()
+        self.assertEqual(vector.vector_cache.info()["hits"], 0)
+        self.assertTrue(first.geom_equals(second).all())
+        self.assertTrue(first.equals(third))
+        self.assertIsNot(second, third)
+
+    def test_changed_file_is_read_again(self):
+        vector.read_vector(self.path)
+        dbf = self.path[:-4] + ".dbf"
+        stat = os.stat(dbf)
+        os.utime(dbf, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with mock.patch.object(vector, "_read_file", wraps=vector._read_file) as read_file:
+            vector.read_vector(self.path)
+        read_file.assert_called_once()
+
+    def test_filters_are_applied_while_reading(self):
+        everything = vector.read_vector(self.path, cache=False)
+        bbox = (-84, 36, -82, 38)
+        subset = vector.read_vector(
+            self.path, columns=["STATE_NAME"], bbox=bbox, where="STATE_NAME = 'Kentucky'"
+        )
+        expected = everything[
+            everything.intersects(shapely.box(*bbox)) & (everything.STATE_NAME == "Kentucky")
+        ]
+        self.assertEqual(list(subset.columns), ["STATE_NAME", "geometry"])
+        self.assertEqual(len(subset), len(expected))
+        self.assertGreater(len(subset), 0)
+
+        masked = vector.read_vector(self.path, mask=everything.head(3))
+        self.assertLess(len(masked), len(everything))
+        self.assertEqual(vector.get_vector_disk_cache().info()["files"], 2)
+
+
+
+class TestViewportIndex(unittest.TestCase):
+    """Tests for the viewport queries of `ViewportIndex`."""
+
+    def test_viewport_across_antimeridian(self):
+        points = gpd.GeoDataFrame(
+            {"id": list(range(6))},
+            geometry=gpd.points_from_xy([-179, -175, -100, 0, 172, 179], [0] * 6),
+            crs="EPSG:4326",
+        )
+        index = vector.ViewportIndex(points)
+
+        def ids(bounds):
+            return [f["properties"]["id"] for f in index.query(bounds)["features"]]
+
+        self.assertEqual(ids(((-10, 170), (10, 190))), [0, 1, 4, 5])
+        self.assertEqual(ids(((-10, -190), (10, -170))), [0, 1, 4, 5])
+        self.assertEqual(ids(((-10, 530), (10, 550))), [0, 1, 4, 5])
+        self.assertEqual(ids(((-10, -10), (10, 10))), [3])
+        self.assertEqual(ids(((-10, -200), (10, 300))), list(range(6)))
@@ -3,7 +3,9 @@
 """Tests for `watergeo` package."""
 
 
+import time
 import unittest
+from unittest import mock
 
 from watergeo import watergeo
 
@@ -19,3 +21,109 @@ class TestWatergeo(unittest.TestCase):
 
     def test_000_something(self):
         """Test something."""
+
+
+class FakeImage:
+    """Counts the thumbnail URLs requested for each frame."""
+
+    requests = []
+
+    def __init__(self, index):
+        self.index = index
+
+    def visualize(self, **kwargs):
+        return self
+
+    def getThumbURL(self, params):
+        FakeImage.requests.append(self.index)
+        return f"https://thumbs/{self.index}.png"
+
+
+class FakeImageCollection:
+    def __init__(self, n):
+        self.n = n
+
+    def size(self):
+        return mock.Mock(getInfo=lambda: self.n)
+
+    def toList(self, count):
+        return mock.Mock(get=lambda i: i)
+
+
+class TestTimeSlider(unittest.TestCase):
+    """Tests for `watergeo.Map.add_time_slider`."""
+
+    def setUp(self):
+        FakeImage.requests = []
+
+    def test_reuses_overlay_and_prefetches_frames(self):
+        m = watergeo.Map()
+        n_layers = len(m.layers)
+        with mock.patch.object(watergeo, "interact") as interact, mock.patch.object(
+            watergeo.ee, "Image", side_effect=FakeImage
+        ):
+            m.add_time_slider(FakeImageCollection(10), {}, prefetch=2)
+            update_map = interact.call_args[0][0]
+            update_map(0)
+            update_map(1)
+            update_map(2)
+            # Wait for the background prefetches of frames 3 and 4
+            deadline = time.monotonic() + 5
+            while len(FakeImage.requests) < 5 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        overlays = [layer for layer in m.layers if isinstance(layer, watergeo.ipyleaflet.ImageOverlay)]
+        self.assertEqual(len(m.layers), n_layers + 1)
+        self.assertEqual(len(overlays), 1)
+        self.assertEqual(overlays[0].url, "https://thumbs/2.png")
+        self.assertEqual(sorted(FakeImage.requests), [0, 1, 2, 3, 4])
+
+
+class TestAddGeojsonLod(unittest.TestCase):
+    """Tests for the levels of detail of `watergeo.Map.add_geojson`."""
+
+    def test_swaps_level_on_zoom(self):
+        data = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"id": 1},
+                    "geometry": {
+                        "type": "LineString",
+                        "coordinates": [[0, 0], [0.001, 0.0001], [0.002, 0], [1, 1]],
+                    },
+                }
+            ],
+        }
+        m = watergeo.Map(zoom=2)
+        m.add_geojson(data, lod=True)
+        layer = m.layers[-1]
+        coarse = layer.data
+        self.assertLess(len(coarse["features"][0]["geometry"]["coordinates"]), 4)
+        m.zoom = 14
+        self.assertEqual(len(layer.data["features"][0]["geometry"]["coordinates"]), 4)
+        self.assertIn("original", layer.lod_report)
+
+
+class TestAddLazyVector(unittest.TestCase):
+    """Tests for the viewport-driven loading of `watergeo.Map.add_vector`."""
+
+    def test_pushes_features_in_viewport(self):
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"id": i},
+                "geometry": {"type": "Point", "coordinates": [i, 0]},
+            }
+            for i in range(100)
+        ]
+        data = {"type": "FeatureCollection", "features": features}
+        m = watergeo.Map()
+        m.add_vector(data, lazy=True, max_features=50, debounce=0)
+        layer = m.layers[-1]
+        self.assertEqual(len(layer.data["features"]), 50)
+
+        m.set_trait("bounds", ((-1, 9.5), (1, 20.5)))
+        ids = [f["properties"]["id"] for f in layer.data["features"]]
+        self.assertEqual(ids, list(range(10, 21)))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""Tests for `watergeo.zonal`."""
+
+
+import os
+import tempfile
+import unittest
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from watergeo import zonal
+
+
+def write_raster(path, data, nodata=None, **kwargs):
+    profile = {
+        "driver": "GTiff",
+        "height": data.shape[0],
+        "width": data.shape[1],
+        "count": 1,
+        "dtype": data.dtype,
+        "crs": "EPSG:4326",
+        "transform": from_origin(0, data.shape[0], 1, 1),
+        "nodata": nodata,
+        **kwargs,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+
+
+class TestZonalStatsLocal(unittest.TestCase):
+    """Tests for `zonal_stats_local`."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(0, 20, size=(40, 60)).astype("float32")
+        self.data[0, 0] = -9999
+        self.raster = os.path.join(self.tmpdir.name, "values.tif")
+        write_raster(self.raster, self.data, nodata=-9999)
+        # Row 0 is at the top (y = 40)
+        self.zones = gpd.GeoDataFrame(
+            {"name": ["a", "b", "empty"]},
+            geometry=[box(0, 20, 30, 40), box(30, 0, 60, 25), box(100, 100, 101, 101)],
+            crs="EPSG:4326",
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def expected(self, rows, cols):
+        values = self.data[rows, cols].ravel()
+        return values[values != -9999].astype(float)
+
+    def test_matches_per_zone_numpy(self):
+        stats = ["COUNT", "MEAN", "MEDIAN", "MODE", "STD", "MIN_MAX", "SUM", "VARIANCE"]
+        result = zonal.zonal_stats_local(self.raster, self.zones, stat_type=stats)
+        for i, (rows, cols) in enumerate([(slice(0, 20), slice(0, 30)), (slice(15, 40), slice(30, 60))]):
+            values = self.expected(rows, cols)
+            uniques, counts = np.unique(values, return_counts=True)
+            row = result.iloc[i]
+            self.assertEqual(row["count"], len(values))
+            self.assertAlmostEqual(row["mean"], values.mean(), places=6)
+            self.assertAlmostEqual(row["median"], np.median(values))
+            self.assertEqual(row["mode"], uniques[np.argmax(counts)])
+            self.assertAlmostEqual(row["stdDev"], values.std(), places=6)
+            self.assertAlmostEqual(row["variance"], values.var(), places=6)
+            self.assertEqual(row["min"], values.min())
+            self.assertEqual(row["max"], values.max())
+            self.assertAlmostEqual(row["sum"], values.sum(), places=3)
+        self.assertEqual(result.iloc[2]["count"], 0)
+        self.assertTrue(np.isnan(result.iloc[2]["mean"]))
+
+    def test_histograms(self):
+        result = zonal.zonal_stats_local(
+            self.raster, self.zones, stat_type="FIXED_HIST", hist_min=0, hist_max=20, hist_steps=4
+        )
+        values = self.expected(slice(0, 20), slice(0, 30))
+        expected = np.histogram(values, bins=4, range=(0, 20))[0]
+        self.assertEqual([count for _, count in result.iloc[0]["histogram"]], expected.tolist())
+
+        result = zonal.zonal_stats_local(self.raster, self.zones, stat_type="HIST", max_buckets=8)
+        histogram = result.iloc[1]["histogram"]
+        self.assertEqual(sum(histogram["histogram"]), len(self.expected(slice(15, 40), slice(30, 60))))
+        self.assertIsNone(result.iloc[2]["histogram"])
+
+    def test_writes_csv(self):
+        out_file = os.path.join(self.tmpdir.name, "stats.csv")
+        zonal.zonal_stats_local(self.raster, self.zones, out_file, stat_type="MEAN")
+        with open(out_file) as f:
+            self.assertEqual(f.readline().strip(), "name,mean")
+
+
+class TestZonalStatsBlocks(unittest.TestCase):
+    """Tests for `zonal_stats_blocks`."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(1)
+        self.data = rng.integers(0, 50, size=(90, 110)).astype("int16")
+        self.zones = gpd.GeoDataFrame(
+            geometry=[box(3, 7, 61, 80), box(50, 0, 110, 45), box(0, 0, 5, 5)],
+            crs="EPSG:4326",
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_matches_in_memory(self, raster, **kwargs):
+        stats = ["COUNT", "MEAN", "MEDIAN", "MODE", "STD", "MIN_MAX", "SUM"]
+        expected = zonal.zonal_stats_local(raster, self.zones, stat_type=stats)
+        result = zonal.zonal_stats_blocks(raster, self.zones, stat_type=stats, block_size=32, **kwargs)
+        for column in ["count", "mean", "median", "mode", "stdDev", "min", "max", "sum"]:
+            np.testing.assert_allclose(result[column], expected[column], rtol=1e-9)
+
+    def test_matches_in_memory_engine(self):
+        raster = os.path.join(self.tmpdir.name, "tiled.tif")
+        write_raster(raster, self.data, nodata=0, tiled=True, blockxsize=32, blockysize=32)
+        self.assertIsNone(zonal._memmap_band(raster))
+        self.check_matches_in_memory(raster, processes=1)
+
+    def test_process_pool_with_memory_map(self):
+        raster = os.path.join(self.tmpdir.name, "strips.tif")
+        write_raster(raster, self.data, nodata=0)
+        self.assertIsNotNone(zonal._memmap_band(raster))
+        self.check_matches_in_memory(raster, processes=2)
+
+    def test_histogram_range_covers_every_value(self):
+        # Outliers that a decimated read of the raster would miss
+        data = np.random.default_rng(3).integers(0, 50, size=(2048, 2048)).astype("int16")
+        for row, col in [(100, 200), (100, 202), (102, 200)]:
+            data[row, col] = 1000
+        raster = os.path.join(self.tmpdir.name, "outliers.tif")
+        write_raster(raster, data)
+        zones = gpd.GeoDataFrame(geometry=[box(200, 2048 - 104, 204, 2048 - 100)], crs="EPSG:4326")
+
+        expected = zonal.zonal_stats_local(raster, zones, stat_type=["MODE", "MEDIAN"])
+        result = zonal.zonal_stats_blocks(
+            raster, zones, stat_type=["MODE", "MEDIAN"], block_size=512, processes=1
+        )
+        self.assertEqual(expected["mode"][0], 1000)
+        self.assertEqual(result["mode"][0], 1000)
+        self.assertEqual(result["median"][0], expected["median"][0])
+
+    def test_accumulator_merge_is_exact(self):
+        rng = np.random.default_rng(2)
+        labels = rng.integers(0, 5, 1000)
+        values = rng.normal(size=1000)
+        accumulator = zonal.ZoneAccumulator(5)
+        for part in np.array_split(np.arange(1000), 7):
+            accumulator.merge(accumulator.partial(labels[part], values[part]))
+        result = accumulator.result(["MEAN", "VARIANCE"])
+        expected = zonal.zone_statistics(labels, values, 5, ["MEAN", "VARIANCE"])
+        np.testing.assert_allclose(result["mean"], expected["mean"])
+        np.testing.assert_allclose(result["variance"], expected["variance"])
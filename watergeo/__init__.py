@@ -3,8 +3,14 @@
 __author__ = """Xinming Zhang"""
 __email__ = "andyzxm1101@gmail.com"
 __version__ = "0.1.1"
+import importlib
 import os
-from .watergeo import *
+
+# Submodules are imported on first attribute access so that ``import watergeo``
+# does not pull in ee, geopandas, ipyleaflet, folium, etc.
+_SUBMODULES = ("common", "foliumap", "utility", "watergeo")
+
+__all__ = ["Map", "common", "utility", "view_pmtiles"]
 
 def _in_colab_shell():
     """Tests if the code is being executed within Google Colab."""
@@ -61,11 +67,12 @@ def view_pmtiles(
     return m
 
 
-if _use_folium():
-    from .foliumap import *
-else:
+def _backend():
+    """Imports and returns the plotting backend module."""
+    if _use_folium():
+        return importlib.import_module(".foliumap", __name__)
     try:
-        from .watergeo import *
+        return importlib.import_module(".watergeo", __name__)
     except Exception as e:
         if _in_colab_shell():
             print(
@@ -75,4 +82,26 @@ else:
             print(
                 "Please restart Jupyter kernel after installation if you encounter any errors when importing leafmap."
             )
-        raise Exception(e)
\ No newline at end of file
+        raise Exception(e)
+
+
+def __getattr__(name):
+    """Lazily loads submodules and the public names of the plotting backend."""
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    backend = _backend()
+    try:
+        value = getattr(backend, name)
+    except AttributeError:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}"
+        ) from None
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES) | {"Map"})
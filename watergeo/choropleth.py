@@ -0,0 +1,224 @@
+"""The choropleth module classifies the values of data columns and precomputes the fill colors of choropleth maps.
+
+The classification works on whole columns with NumPy, so the colors of all
+features, and of all candidate columns, are computed once and switching the
+column shown on a map only changes the styles of the features.
+"""
+import numpy as np
+
+SCHEMES = ("quantiles", "equal_interval", "natural_breaks")
+
+
+def natural_breaks(values, k=5, max_samples=2000):
+    """Computes the Jenks natural breaks of values with dynamic programming.
+
+    The breaks minimize the sum of the squared deviations from the class means.
+    Columns with more than max_samples values are classified from evenly
+    spaced quantiles of the values, which keeps the computation in O(k * max_samples**2).
+
+    Args:
+        values (np.ndarray): The values, without NaNs.
+        k (int, optional): The number of classes. Defaults to 5.
+        max_samples (int, optional): The maximum number of values classified exactly. Defaults to 2000.
+
+    Returns:
+        np.ndarray: The upper bounds of the classes.
+    """
+    x = np.sort(np.asarray(values, dtype="float64"))
+    if len(x) > max_samples:
+        x = np.quantile(x, np.linspace(0, 1, max_samples))
+    n = len(x)
+    k = min(k, len(np.unique(x)))
+    if k <= 1:
+        return x[-1:]
+
+    s1 = np.concatenate([[0], np.cumsum(x)])
+    s2 = np.concatenate([[0], np.cumsum(x * x)])
+    # ssd[i, j] is the sum of the squared deviations of x[i:j + 1] from their mean.
+    i = np.arange(n)[:, None]
+    j = np.arange(n)[None, :]
+    count = np.maximum(j - i + 1, 1)
+    ssd = s2[j + 1] - s2[i] - (s1[j + 1] - s1[i]) ** 2 / count
+    ssd = np.where(j >= i, ssd, np.inf)
+
+    cost = ssd[0]
+    starts = []
+    for _ in range(1, k):
+        # The last class starts at i, after the best split of x[:i] in one class less.
+        total = np.concatenate([[np.inf], cost[:-1]])[:, None] + ssd
+        start = np.argmin(total, axis=0)
+        cost = total[start, np.arange(n)]
+        starts.append(start)
+
+    ends = [n - 1]
+    for start in reversed(starts):
+        ends.append(start[ends[-1]] - 1)
+    return x[np.array(ends[::-1])]
+
+
+def classify(values, scheme="quantiles", k=5, bins=None):
+    """Classifies values with a classification scheme.
+
+    Args:
+        values (array-like): The values to classify. NaNs are not classified.
+        scheme (str, optional): The classification scheme, one of "quantiles", "equal_interval"
+            and "natural_breaks". Ignored if bins is given. Defaults to "quantiles".
+        k (int, optional): The number of classes. Defaults to 5.
+        bins (list, optional): The upper bounds of custom classes. Values above the last bound
+            are put in the last class. Defaults to None.
+
+    Returns:
+        tuple: The upper bounds of the classes, and the class index of each value (-1 for NaNs).
+    """
+    values = np.asarray(values, dtype="float64")
+    valid = np.isfinite(values)
+    v = values[valid]
+
+    if bins is not None:
+        breaks = np.sort(np.asarray(bins, dtype="float64"))
+    elif len(v) == 0:
+        breaks = np.array([np.nan])
+    elif scheme == "quantiles":
+        breaks = np.unique(np.quantile(v, np.linspace(0, 1, k + 1)[1:]))
+    elif scheme == "equal_interval":
+        breaks = v.min() + (v.max() - v.min()) * np.arange(1, k + 1) / k
+        breaks[-1] = v.max()
+    elif scheme == "natural_breaks":
+        breaks = natural_breaks(v, k)
+    else:
+        raise ValueError(f"Unknown classification scheme {scheme!r}. Use one of {SCHEMES}.")
+
+    classes = np.full(len(values), -1)
+    classes[valid] = np.minimum(np.searchsorted(breaks, v), len(breaks) - 1)
+    return breaks, classes
+
+
+def class_colors(k, cmap="YlGn"):
+    """Returns the colors of k classes.
+
+    Args:
+        k (int): The number of classes.
+        cmap (str | list, optional): The name of a ColorBrewer color scheme, or a list of colors
+            sampled evenly. Defaults to "YlGn".
+
+    Returns:
+        list: The hex colors of the classes.
+    """
+    if isinstance(cmap, str):
+        from branca.utilities import color_brewer
+
+        colors = color_brewer(cmap, max(k, 3))
+    else:
+        colors = list(cmap)
+    if len(colors) == k:
+        return colors
+    index = np.round(np.linspace(0, len(colors) - 1, k)).astype(int)
+    return [colors[i] for i in index]
+
+
+def key_column(key_on):
+    """Returns the column of read_geodata() that holds the key of the features.
+
+    Args:
+        key_on (str): The key as in folium, e.g., "feature.id" or "feature.properties.FIPS",
+            or the name of a property.
+
+    Returns:
+        str: The column, "id" for the feature ids.
+    """
+    parts = key_on.split(".")
+    if parts[0] == "feature":
+        parts = parts[1:]
+    if parts[0] == "properties":
+        parts = parts[1:]
+    return ".".join(parts)
+
+
+def _is_id(key_on):
+    return key_on is not None and key_on.split(".")[-2:] in (["id"], ["feature", "id"])
+
+
+def read_geodata(data, key_on=None):
+    """Reads the features of a choropleth into a GeoDataFrame in EPSG:4326.
+
+    Remote files are downloaded once into the download cache (see
+    raster.cached_download()) and local files are read with vector.read_vector(),
+    so both are parsed only once. If the features are keyed on their ids, the
+    ids are kept in an "id" column, as GeoDataFrames drop them.
+
+    Args:
+        data (str | dict | gpd.GeoDataFrame): A URL, a file path, GeoJSON or a GeoDataFrame.
+        key_on (str, optional): The key of the features, see key_column(). Defaults to None.
+
+    Returns:
+        gpd.GeoDataFrame: The features, with a default index.
+    """
+    from .vector import read_geojson, read_vector, to_gdf
+
+    if isinstance(data, str):
+        from .raster import cached_download, is_url
+
+        path = cached_download(data) if is_url(data) else data
+        data = read_geojson(path) if _is_id(key_on) else read_vector(path)
+
+    ids = None
+    if _is_id(key_on):
+        if isinstance(data, dict):
+            ids = [feature.get("id") for feature in data["features"]]
+        elif hasattr(data, "index"):
+            ids = list(data.index)
+    gdf = to_gdf(data).reset_index(drop=True)
+    if ids is not None:
+        gdf["id"] = ids
+    return gdf
+
+
+class ChoroplethStyles:
+    """The classes and fill colors of the features of a GeoDataFrame for several columns.
+
+    Args:
+        data (gpd.GeoDataFrame | pd.DataFrame): The data.
+        columns (list): The columns to classify.
+        scheme (str, optional): The classification scheme, see classify(). Defaults to "quantiles".
+        k (int, optional): The number of classes. Defaults to 5.
+        bins (list, optional): The upper bounds of custom classes. Defaults to None.
+        cmap (str | list, optional): The color scheme, see class_colors(). Defaults to "YlGn".
+        nodata_color (str, optional): The color of the features without a value. Defaults to "#cccccc".
+    """
+
+    def __init__(
+        self, data, columns, scheme="quantiles", k=5, bins=None, cmap="YlGn", nodata_color="#cccccc"
+    ):
+        import pandas as pd
+
+        self.columns = list(columns)
+        self.nodata_color = nodata_color
+        self.breaks = {}
+        self.palettes = {}
+        self.classes = {}
+        self.colors = {}
+        for column in self.columns:
+            values = pd.to_numeric(data[column], errors="coerce").to_numpy(dtype="float64")
+            breaks, classes = classify(values, scheme, k, bins)
+            palette = class_colors(len(breaks), cmap)
+            self.breaks[column] = breaks
+            self.palettes[column] = palette
+            self.classes[column] = classes
+            self.colors[column] = np.array(palette + [nodata_color])[classes]
+
+    def legend(self, column):
+        """Returns the labels and colors of the classes of a column.
+
+        Args:
+            column (str): The column.
+
+        Returns:
+            list: (label, color) pairs, one per class.
+        """
+        breaks = self.breaks[column]
+        lower = np.concatenate([[-np.inf], breaks[:-1]])
+        labels = [
+            f"≤ {b:,.4g}" if i == 0 else f"{lo:,.4g} – {b:,.4g}"
+            for i, (lo, b) in enumerate(zip(lower, breaks))
+        ]
+        return list(zip(labels, self.palettes[column]))
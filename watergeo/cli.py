@@ -0,0 +1,438 @@
+"""The cli module runs batch jobs, e.g., nightly zonal statistics, from a job spec file.
+
+The `watergeo` console script reads a YAML or JSON spec listing zonal_stats,
+export and static_map jobs and runs them on a process pool. Like make, a job
+whose outputs are newer than its inputs is skipped, and a job that reads the
+output of another job waits for it. For example::
+
+    workers: 4
+    report: report.json
+    jobs:
+      - name: ndvi
+        type: zonal_stats
+        raster: ndvi.tif
+        zones: counties.shp
+        output: out/ndvi.geojson
+        stat_type: [MEAN, MAXIMUM]
+      - name: ndvi-map
+        type: static_map
+        layers: [{path: out/ndvi.geojson, column: mean}]
+        output: out/ndvi.png
+
+Relative paths are resolved against the directory of the spec file.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+JOB_TYPES = ("zonal_stats", "export", "static_map")
+
+# The job keys that hold local paths, by job type. Earth Engine jobs read assets instead.
+_PATH_KEYS = {
+    "zonal_stats": ("raster", "zones"),
+    "export": (),
+    "static_map": ("layers",),
+}
+_RASTER_EXTENSIONS = (".tif", ".tiff", ".vrt", ".img", ".jp2", ".nc")
+
+
+def _is_local(path):
+    return isinstance(path, str) and "://" not in path
+
+
+def _resolve(path, base):
+    if _is_local(path):
+        return os.path.normpath(os.path.join(base, os.path.expanduser(path)))
+    return path
+
+
+def load_spec(path):
+    """Reads a job spec from a YAML or JSON file.
+
+    Args:
+        path (str): The path to the spec, a .yml, .yaml or .json file.
+
+    Returns:
+        dict: The spec, with a "jobs" list of job dicts that each have a name, a type,
+            a list of outputs and a list of inputs, all as absolute paths.
+    """
+    with open(path) as f:
+        if path.lower().endswith((".yml", ".yaml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Please install pyyaml using 'pip install pyyaml' to read YAML job specs.")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    if not isinstance(spec, dict) or not isinstance(spec.get("jobs"), list):
+        raise ValueError(f"{path} must contain a 'jobs' list.")
+
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    names = set()
+    for index, job in enumerate(spec["jobs"]):
+        job = dict(job)
+        job_type = job.get("type")
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Job {index} has an unknown type {job_type!r}. Use one of {JOB_TYPES}.")
+        if "output" not in job:
+            raise ValueError(f"Job {index} ({job_type}) has no output.")
+        job.setdefault("name", f"{job_type}-{index}")
+        if job["name"] in names:
+            raise ValueError(f"The job name {job['name']!r} is used twice.")
+        names.add(job["name"])
+
+        job["output"] = _resolve(job["output"], base)
+        if not job.get("ee"):
+            for key in _PATH_KEYS[job_type]:
+                if key == "layers":
+                    job[key] = [_resolve_layer(layer, base) for layer in job.get(key, [])]
+                elif key in job:
+                    job[key] = _resolve(job[key], base)
+        job["inputs"] = [_resolve(p, base) for p in job.get("inputs", [])] + job_inputs(job)
+        job["outputs"] = [job["output"]]
+        jobs.append(job)
+
+    spec["jobs"] = jobs
+    if spec.get("report"):
+        spec["report"] = _resolve(spec["report"], base)
+    return spec
+
+
+def _resolve_layer(layer, base):
+    if isinstance(layer, str):
+        layer = {"path": layer}
+    return {**layer, "path": _resolve(layer["path"], base)}
+
+
+def job_inputs(job):
+    """Returns the local files a job reads.
+
+    Args:
+        job (dict): The job.
+
+    Returns:
+        list: The paths, without the remote data, e.g., Earth Engine assets and URLs.
+    """
+    if job.get("ee"):
+        return []
+    if job["type"] == "static_map":
+        paths = [layer["path"] for layer in job.get("layers", [])]
+    else:
+        paths = [job[key] for key in _PATH_KEYS[job["type"]] if key in job]
+    return [p for p in paths if _is_local(p)]
+
+
+def _sidecars(path):
+    # A shapefile is only as new as all of its files.
+    root, ext = os.path.splitext(path)
+    if ext.lower() != ".shp":
+        return [path]
+    return [root + e for e in (".shp", ".shx", ".dbf", ".prj") if os.path.exists(root + e)]
+
+
+def is_up_to_date(job):
+    """Checks whether the outputs of a job are newer than its inputs, like make.
+
+    Args:
+        job (dict): The job, as returned by load_spec().
+
+    Returns:
+        bool: True if all outputs exist and none is older than an input.
+    """
+    outputs = [p for path in job["outputs"] for p in _sidecars(path)]
+    if not all(os.path.exists(p) for p in job["outputs"]):
+        return False
+    oldest = min(os.path.getmtime(p) for p in outputs)
+    for path in job["inputs"]:
+        for p in _sidecars(path):
+            if not os.path.exists(p) or os.path.getmtime(p) > oldest:
+                return False
+    return True
+
+
+def _options(job, *keys):
+    reserved = {"name", "type", "output", "outputs", "inputs", "ee", *keys}
+    return {key: value for key, value in job.items() if key not in reserved}
+
+
+def _zonal_stats_job(job):
+    from . import common
+
+    raster, zones = job["raster"], job["zones"]
+    if job.get("ee"):
+        import ee
+
+        common.ee_initialize()
+        raster, zones = ee.Image(raster), ee.FeatureCollection(zones)
+    options = _options(job, "raster", "zones")
+    options.setdefault("verbose", False)
+    common.zonal_stats(raster, zones, job["output"], **options)
+
+
+def _export_job(job):
+    import ee
+
+    from . import common
+
+    common.ee_initialize()
+    options = _options(job, "collection")
+    options.setdefault("verbose", False)
+    common.ee_export_vector(ee.FeatureCollection(job["collection"]), job["output"], **options)
+
+
+def _static_map_job(job):
+    output = job["output"]
+    if output.lower().endswith((".html", ".htm")):
+        _html_map(job)
+    else:
+        _image_map(job)
+
+
+def _html_map(job):
+    from .export import export_folium
+    from .foliumap import Map
+
+    m = Map(**{"init_ee": False, **job.get("map", {})})
+    for layer in job["layers"]:
+        options = {k: v for k, v in layer.items() if k != "path"}
+        if layer["path"].lower().endswith(_RASTER_EXTENSIONS):
+            raise ValueError(
+                f"{layer['path']}: raster layers of HTML maps need a running tile server; use an image output."
+            )
+        options.setdefault("name", os.path.basename(layer["path"]))
+        m.add_vector(layer["path"], **options)
+    export_folium(m, job["output"], mode=job.get("mode", "inline"))
+
+
+def _image_map(job):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import rasterio
+    from rasterio.plot import show
+
+    from .vector import read_vector
+
+    fig, ax = plt.subplots(figsize=job.get("figsize", (10, 8)))
+    for layer in job["layers"]:
+        options = {k: v for k, v in layer.items() if k != "path"}
+        if layer["path"].lower().endswith(_RASTER_EXTENSIONS):
+            with rasterio.open(layer["path"]) as src:
+                show(src, ax=ax, **options)
+        else:
+            read_vector(layer["path"]).plot(ax=ax, **options)
+    if job.get("title"):
+        ax.set_title(job["title"])
+    ax.set_axis_off()
+    fig.savefig(job["output"], dpi=job.get("dpi", 150), bbox_inches="tight")
+    plt.close(fig)
+
+
+_RUNNERS = {
+    "zonal_stats": _zonal_stats_job,
+    "export": _export_job,
+    "static_map": _static_map_job,
+}
+
+
+def run_job(job):
+    """Runs a job and times it.
+
+    Args:
+        job (dict): The job, as returned by load_spec().
+
+    Returns:
+        dict: The name, type, status ("done" or "failed"), seconds, outputs and error of the job.
+    """
+    start = time.perf_counter()
+    result = {"name": job["name"], "type": job["type"], "outputs": job["outputs"], "error": None}
+    try:
+        directory = os.path.dirname(job["output"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _RUNNERS[job["type"]](job)
+        result["status"] = "done"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _dependencies(jobs):
+    producers = {path: job["name"] for job in jobs for path in job["outputs"]}
+    return {
+        job["name"]: {producers[p] for p in job["inputs"] if p in producers and producers[p] != job["name"]}
+        for job in jobs
+    }
+
+
+def run_jobs(jobs, workers=None, force=False, verbose=True):
+    """Runs jobs on a process pool, skipping the jobs that are up to date.
+
+    A job that reads the output of another job starts after it, and is not run
+    if it failed.
+
+    Args:
+        jobs (list): The jobs, as returned by load_spec().
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+        force (bool, optional): Whether to run the jobs that are up to date. Defaults to False.
+        verbose (bool, optional): Whether to print the progress. Defaults to True.
+
+    Returns:
+        list: The results of the jobs, see run_job(), in the order of the jobs. Skipped jobs
+            have the status "up to date", and jobs after a failed job "not run".
+    """
+    by_name = {job["name"]: job for job in jobs}
+    waiting = _dependencies(jobs)
+    results = {}
+    cycle = [name for name in waiting if name in _reachable(waiting, name)]
+    if cycle:
+        raise ValueError(f"The jobs {cycle} depend on each other.")
+
+    def finish(result):
+        results[result["name"]] = result
+        if verbose:
+            print(f"[{len(results)}/{len(jobs)}] {result['name']}: {result['status']} ({result['seconds']:.2f} s)")
+            if result["error"]:
+                print(f"    {result['error']}")
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        running = {}
+        while waiting or running:
+            for name in list(waiting):
+                deps = waiting[name]
+                if not deps.issubset(results):
+                    continue
+                del waiting[name]
+                job = by_name[name]
+                failed = [d for d in deps if results[d]["status"] in ("failed", "not run")]
+                if failed:
+                    finish({**_skipped(job, "not run"), "error": f"Depends on the failed job {failed[0]!r}."})
+                elif not force and is_up_to_date(job):
+                    finish(_skipped(job, "up to date"))
+                else:
+                    running[executor.submit(run_job, job)] = name
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    finish(future.result())
+    return [results[job["name"]] for job in jobs]
+
+
+def _skipped(job, status):
+    return {
+        "name": job["name"],
+        "type": job["type"],
+        "outputs": job["outputs"],
+        "status": status,
+        "seconds": 0.0,
+        "error": None,
+    }
+
+
+def _reachable(graph, start):
+    seen, stack = set(), list(graph.get(start, ()))
+    while stack:
+        name = stack.pop()
+        if name not in seen:
+            seen.add(name)
+            stack.extend(graph.get(name, ()))
+    return seen
+
+
+def write_report(results, path):
+    """Writes the timing report of a run to a csv or JSON file.
+
+    Args:
+        results (list): The results returned by run_jobs().
+        path (str): The output file, .csv or .json.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fields = ["name", "type", "status", "seconds", "outputs", "error"]
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fields, extrasaction="ignore")
+            writer.writeheader()
+            for result in results:
+                writer.writerow({**result, "outputs": ";".join(result["outputs"])})
+    else:
+        with open(path, "w") as f:
+            json.dump([{key: result.get(key) for key in fields} for result in results], f, indent=2)
+
+
+def print_report(results, seconds=None):
+    """Prints the status and duration of each job of a run.
+
+    Args:
+        results (list): The results returned by run_jobs().
+        seconds (float, optional): The wall time of the run. Defaults to None.
+    """
+    width = max([len(r["name"]) for r in results] + [4])
+    print(f"{'Job':<{width}}  {'Type':<11}  {'Status':<10}  {'Seconds':>8}")
+    for r in results:
+        print(f"{r['name']:<{width}}  {r['type']:<11}  {r['status']:<10}  {r['seconds']:>8.2f}")
+    total = sum(r["seconds"] for r in results)
+    summary = f"{len(results)} jobs, {total:.2f} s of work"
+    if seconds is not None:
+        summary += f" in {seconds:.2f} s"
+    print(summary + ".")
+
+
+def main(argv=None):
+    """Runs the jobs of a spec file, the entry point of the `watergeo` console script.
+
+    Args:
+        argv (list, optional): The command-line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The exit status, 1 if a job failed.
+    """
+    parser = argparse.ArgumentParser(
+        prog="watergeo",
+        description="Run zonal_stats, export and static_map jobs listed in a YAML or JSON spec.",
+    )
+    parser.add_argument("spec", help="The job spec, a .yml, .yaml or .json file.")
+    parser.add_argument("-j", "--workers", type=int, help="The number of processes. Defaults to the spec or the CPU count.")
+    parser.add_argument("-B", "--force", action="store_true", help="Run the jobs that are up to date.")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="Only run these jobs.")
+    parser.add_argument("--report", help="Write the timing report to this .csv or .json file.")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print the report.")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    jobs = spec["jobs"]
+    if args.only:
+        unknown = set(args.only) - {job["name"] for job in jobs}
+        if unknown:
+            parser.error(f"Unknown jobs: {', '.join(sorted(unknown))}")
+        jobs = [job for job in jobs if job["name"] in args.only]
+
+    start = time.perf_counter()
+    results = run_jobs(jobs, workers=args.workers or spec.get("workers"), force=args.force, verbose=not args.quiet)
+    print_report(results, time.perf_counter() - start)
+
+    report = args.report or spec.get("report")
+    if report:
+        write_report(results, report)
+    for result in results:
+        if result["status"] == "failed" and result.get("traceback") and not args.quiet:
+            print(f"\n{result['name']}:\n{result['traceback']}", file=sys.stderr)
+    return int(any(r["status"] == "failed" for r in results))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
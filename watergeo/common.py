@@ -1,9 +1,25 @@
 """The common module contains common functions and classes used by the other modules.
 """
 import ee
+import hashlib
+import json
 import os
 import requests
+import threading
+import time
 import zipfile
+from .utility import LRUCache
+
+# Map IDs returned by getMapId() expire on the server after a while. Keep the
+# cache entries well below that lifetime so that cached tile URLs stay usable.
+EE_MAP_ID_TTL = 60 * 60
+
+_ee_init_lock = threading.Lock()
+_ee_initialized = False
+_ee_validated_lock = threading.Lock()
+_ee_validated = set()
+
+map_id_cache = LRUCache(maxsize=256, ttl=EE_MAP_ID_TTL)
 
 
 def hello_world():
@@ -11,6 +27,119 @@ def hello_world():
     """
     print("Hello World!")
 
+
+def ee_is_initialized():
+    """Checks whether Earth Engine has been initialized in this session.
+
+    Returns:
+        bool: True if Earth Engine is initialized.
+    """
+    if _ee_initialized:
+        return True
+    if hasattr(ee.data, "is_initialized"):
+        return ee.data.is_initialized()
+    return getattr(ee.data, "_initialized", False)
+
+
+def ee_initialize(authenticate=False, **kwargs):
+    """Initializes Earth Engine once per session. Subsequent calls return immediately.
+
+    The function is thread-safe, so concurrent callers block until the first
+    initialization finishes instead of each initializing Earth Engine.
+
+    Args:
+        authenticate (bool, optional): Whether to run ee.Authenticate() if the
+            initialization fails, e.g., because no credentials are stored. Defaults to False.
+        **kwargs: Keyword arguments to pass to ee.Initialize(), such as project.
+    """
+    global _ee_initialized
+
+    if _ee_initialized:
+        return
+
+    with _ee_init_lock:
+        if _ee_initialized:
+            return
+        if not ee_is_initialized():
+            try:
+                ee.Initialize(**kwargs)
+            except Exception:
+                if not authenticate:
+                    raise
+                ee.Authenticate()
+                ee.Initialize(**kwargs)
+        _ee_initialized = True
+
+
+def ee_object_key(ee_object):
+    """Returns a hash of the serialized expression of an Earth Engine object.
+
+    Two objects built from the same sequence of operations have the same key.
+
+    Args:
+        ee_object (object): An Earth Engine object, e.g., ee.Image or ee.FeatureCollection.
+
+    Returns:
+        str: The SHA-1 hex digest of the serialized expression.
+    """
+    return hashlib.sha1(ee_object.serialize().encode("utf-8")).hexdigest()
+
+
+def ee_check_object(ee_object):
+    """Checks that an Earth Engine object is valid by evaluating it on the server.
+
+    The result is cached by the serialized expression of the object, so an
+    object that has been checked once is not sent to the server again.
+
+    Args:
+        ee_object (object): The Earth Engine object to check.
+
+    Raises:
+        ee.EEException: If the object cannot be evaluated.
+    """
+    key = ee_object_key(ee_object)
+    with _ee_validated_lock:
+        if key in _ee_validated:
+            return
+
+    ee_object.getInfo()
+
+    with _ee_validated_lock:
+        _ee_validated.add(key)
+
+def _normalize_vis_params(vis_params):
+    """Converts visualization parameters to a canonical JSON string."""
+    normalized = {}
+    for key, value in (vis_params or {}).items():
+        if isinstance(value, (list, tuple)):
+            value = ",".join(str(v) for v in value)
+        elif isinstance(value, bool):
+            value = str(value).lower()
+        elif isinstance(value, (int, float)):
+            value = repr(float(value))
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+def get_map_id(ee_object, vis_params=None):
+    """Returns the map ID of an Earth Engine image, reusing recent results.
+
+    Results are cached in `map_id_cache` by the serialized image and the
+    normalized visualization parameters, so requesting the same layer twice
+    within `EE_MAP_ID_TTL` seconds costs a single getMapId() call.
+
+    Args:
+        ee_object (object): An ee.Image or an object that can be cast to one.
+        vis_params (dict, optional): Visualization parameters. Defaults to None.
+
+    Returns:
+        dict: The map ID dictionary, including the 'tile_fetcher'.
+    """
+    image = ee.Image(ee_object)
+    key = (ee_object_key(image), _normalize_vis_params(vis_params))
+    return map_id_cache.get_or_set(key, lambda: image.getMapId(vis_params or {}))
+
+
 def filter_polygons(ftr):
     """Converts GeometryCollection to Polygon/MultiPolygon
 
@@ -41,6 +170,11 @@ def ee_export_vector(
     keep_zip=False,
     timeout=300,
     proxies=None,
+    page_size=None,
+    max_workers=4,
+    max_retries=3,
+    chunk_size=1024 * 1024,
+    return_df=False,
 ):
     """Exports Earth Engine FeatureCollection to other formats, including shp, csv, json, kml, and kmz.
 
@@ -49,9 +183,23 @@ def ee_export_vector(
         filename (str): Output file name.
         selectors (list, optional): A list of attributes to export. Defaults to None.
         verbose (bool, optional): Whether to print out descriptive text.
-        keep_zip (bool, optional): Whether to keep the downloaded shapefile as a zip file.
+        keep_zip (bool, optional): Whether to keep the downloaded shapefile as a zip file. In the paged mode,
+            the merged shapefile is zipped.
         timeout (int, optional): Timeout in seconds. Defaults to 300 seconds.
         proxies (dict, optional): A dictionary of proxies to use. Defaults to None.
+        page_size (int, optional): If given, the collection is downloaded in pages of this many features,
+            which are fetched concurrently and concatenated into the output file. Only csv, geojson, and shp
+            are supported in this mode. An empty collection gives an empty file or DataFrame.
+            Defaults to None (a single download).
+        max_workers (int, optional): The maximum number of pages to download concurrently. Defaults to 4.
+        max_retries (int, optional): How many times a failing page is retried, with exponential backoff. Defaults to 3.
+        chunk_size (int, optional): The size in bytes of the chunks written to the output file. Defaults to 1 MiB.
+        return_df (bool, optional): Whether to return the data as a pandas.DataFrame (csv) or
+            geopandas.GeoDataFrame (geojson, json, shp) parsed in memory, without writing a file.
+            The filename is then only used to determine the file type. Defaults to False.
+
+    Returns:
+        pandas.DataFrame | geopandas.GeoDataFrame: The data if return_df is True, otherwise None.
     """
 
     if not isinstance(ee_object, ee.FeatureCollection):
@@ -74,20 +222,19 @@ def ee_export_vector(
             )
         )
 
+    if return_df and filetype in ["kml", "kmz"]:
+        raise ValueError("return_df only supports csv, geojson, json, and shp.")
+
     if selectors is None:
         selectors = ee_object.first().propertyNames().getInfo()
         if filetype == "csv":
             # remove .geo coordinate field
             ee_object = ee_object.select([".*"], None, False)
-
-    if filetype == "geojson":
-        selectors = [".geo"] + selectors
-
-    elif not isinstance(selectors, list):
-        raise ValueError(
-            "selectors must be a list, such as ['attribute1', 'attribute2']"
-        )
-    else:
+    elif filetype != "geojson":
+        if not isinstance(selectors, list):
+            raise ValueError(
+                "selectors must be a list, such as ['attribute1', 'attribute2']"
+            )
         allowed_attributes = ee_object.first().propertyNames().getInfo()
         for attribute in selectors:
             if not (attribute in allowed_attributes):
@@ -97,6 +244,29 @@ def ee_export_vector(
                     )
                 )
 
+    if filetype == "geojson":
+        selectors = [".geo"] + selectors
+
+    if page_size is not None:
+        if filetype not in ["csv", "geojson", "shp"]:
+            raise ValueError("The paged mode only supports csv, geojson, and shp.")
+        try:
+            return _export_vector_paged(
+                ee_object,
+                filename.replace(".zip", ".shp"),
+                selectors,
+                page_size=page_size,
+                max_workers=max_workers,
+                max_retries=max_retries,
+                verbose=verbose,
+                timeout=timeout,
+                proxies=proxies,
+                return_df=return_df,
+                keep_zip=keep_zip,
+            )
+        except Exception as e:
+            raise ValueError(e)
+
     try:
         if verbose:
             print("Generating URL ...")
@@ -122,15 +292,21 @@ def ee_export_vector(
                 print(e)
                 raise ValueError
 
-        with open(filename, "wb") as fd:
-            for chunk in r.iter_content(chunk_size=1024):
-                fd.write(chunk)
+        if return_df:
+            content = r.content
+        else:
+            with open(filename, "wb", buffering=chunk_size) as fd:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    fd.write(chunk)
     except Exception as e:
         print("An error occurred while downloading.")
         if r is not None:
             print(r.json()["error"]["message"])
         raise ValueError(e)
 
+    if return_df:
+        return _content_to_df(content, filetype)
+
     try:
         if filetype == "shp":
             with zipfile.ZipFile(filename) as z:
@@ -156,13 +332,19 @@ def zonal_stats(
     verbose=True,
     timeout=300,
     proxies=None,
+    batch_size=None,
+    max_workers=4,
+    max_retries=3,
+    return_df=False,
     **kwargs,
 ):
     """Summarizes the values of a raster within the zones of another dataset and exports the results as a csv, shp, json, kml, or kmz.
 
     Args:
         in_value_raster (object): An ee.Image or ee.ImageCollection that contains the values on which to calculate a statistic.
-        in_zone_vector (object): An ee.FeatureCollection that defines the zones.
+            If a local raster file path is given, the statistics are computed locally with zonal.zonal_stats_local().
+        in_zone_vector (object): An ee.FeatureCollection that defines the zones, or a vector file path or GeoDataFrame
+            if in_value_raster is a local file.
         out_file_path (str): Output file path that will contain the summary of the values in each zone. The file type can be: csv, shp, json, kml, kmz
         stat_type (str, optional): Statistical type to be calculated. Defaults to 'MEAN'. For 'HIST', you can provide three parameters: max_buckets, min_bucket_width, and max_raw. For 'FIXED_HIST', you must provide three parameters: hist_min, hist_max, and hist_steps.
         scale (float, optional): A nominal scale in meters of the projection to work in. Defaults to None.
@@ -172,8 +354,43 @@ def zonal_stats(
         return_fc (bool, optional): Whether to return the results as an ee.FeatureCollection. Defaults to False.
         timeout (int, optional): Timeout in seconds. Default to 300.
         proxies (dict, optional): A dictionary of proxy servers to use for the request. Default to None.
+        batch_size (int, optional): If given, the zones are processed in chunks of this many features, and the
+            results are appended to the output file as the chunks finish. Only csv and geojson outputs are
+            supported in this mode. Defaults to None (all zones in one request).
+        max_workers (int, optional): The maximum number of chunks to process concurrently. Defaults to 4.
+        max_retries (int, optional): How many times a failing chunk is split in half and retried with a doubled
+            tile_scale before giving up. Defaults to 3.
+        return_df (bool, optional): Whether to return the results as a pandas.DataFrame (csv) or
+            geopandas.GeoDataFrame (other file types) parsed in memory, without writing out_file_path. Defaults to False.
     """
 
+    if isinstance(in_value_raster, str):
+        from .zonal import zonal_stats_local
+
+        if "statistics_type" in kwargs:
+            stat_type = kwargs.pop("statistics_type")
+        local_params = {
+            key: kwargs[key]
+            for key in [
+                "max_buckets",
+                "min_bucket_width",
+                "hist_min",
+                "hist_max",
+                "hist_steps",
+                "block_size",
+                "processes",
+            ]
+            if key in kwargs
+        }
+        return zonal_stats_local(
+            in_value_raster,
+            in_zone_vector,
+            out_file_path,
+            stat_type=stat_type,
+            verbose=verbose,
+            **local_params,
+        )
+
     if isinstance(in_value_raster, ee.ImageCollection):
         in_value_raster = in_value_raster.toBands()
 
@@ -280,6 +497,30 @@ def zonal_stats(
     if scale is None:
         scale = in_value_raster.projection().nominalScale().multiply(10)
 
+    if batch_size is not None and not return_fc:
+        if filetype not in ["csv", "geojson"]:
+            print("The batched mode only supports csv and geojson outputs.")
+            return
+        try:
+            return _zonal_stats_batched(
+                in_value_raster,
+                in_zone_vector,
+                filename,
+                reducer,
+                scale=scale,
+                crs=crs,
+                tile_scale=tile_scale,
+                batch_size=batch_size,
+                max_workers=max_workers,
+                max_retries=max_retries,
+                verbose=verbose,
+                timeout=timeout,
+                proxies=proxies,
+                return_df=return_df,
+            )
+        except Exception as e:
+            raise Exception(e)
+
     try:
         if verbose:
             print("Computing statistics ...")
@@ -293,9 +534,346 @@ def zonal_stats(
         if return_fc:
             return result
         else:
-            ee_export_vector(result, filename, timeout=timeout, proxies=proxies)
+            return ee_export_vector(
+                result,
+                filename,
+                verbose=verbose,
+                timeout=timeout,
+                proxies=proxies,
+                return_df=return_df,
+            )
     except Exception as e:
         raise Exception(e)
 
 
+def _download_content(
+    ee_object,
+    filetype,
+    selectors,
+    name,
+    timeout=300,
+    proxies=None,
+    max_retries=0,
+    backoff=1.0,
+):
+    """Downloads an ee.FeatureCollection into memory.
+
+    Args:
+        ee_object (object): The ee.FeatureCollection to download.
+        filetype (str): The file type, e.g., csv or geojson.
+        selectors (list): The attributes to download.
+        name (str): The file name used by Earth Engine.
+        timeout (int, optional): Timeout in seconds. Defaults to 300.
+        proxies (dict, optional): A dictionary of proxies to use. Defaults to None.
+        max_retries (int, optional): How many times to retry a failed download. Defaults to 0.
+        backoff (float, optional): The delay in seconds before the first retry, doubled after each retry. Defaults to 1.0.
+
+    Returns:
+        bytes: The downloaded content.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            url = ee_object.getDownloadURL(
+                filetype=filetype, selectors=selectors, filename=name
+            )
+            r = requests.get(url, timeout=timeout, proxies=proxies)
+            if r.status_code != 200:
+                raise ValueError(
+                    f"Failed to download {url}: {r.status_code} {r.text[:200]}"
+                )
+            return r.content
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+
+
+def _content_to_df(content, filetype):
+    """Parses downloaded csv, geojson, json, or zipped shapefile bytes into a DataFrame in memory.
+
+    Args:
+        content (bytes): The downloaded content.
+        filetype (str): The file type of the content.
+
+    Returns:
+        pandas.DataFrame | geopandas.GeoDataFrame: A DataFrame for csv, otherwise a GeoDataFrame.
+    """
+    import io
+
+    if filetype == "csv":
+        import pandas as pd
+
+        return pd.read_csv(io.BytesIO(content))
+    else:
+        import geopandas as gpd
+
+        # Zipped shapefiles are read from memory, too
+        return gpd.read_file(io.BytesIO(content))
+
+
+def _concat_dfs(frames):
+    """Concatenates DataFrames, keeping the GeoDataFrame type and CRS."""
+    import pandas as pd
+
+    df = pd.concat(frames, ignore_index=True)
+    if hasattr(frames[0], "crs"):
+        import geopandas as gpd
+
+        df = gpd.GeoDataFrame(df, geometry=frames[0].geometry.name, crs=frames[0].crs)
+    return df
+
+
+def _ordered_results(executor, func, items, max_pending):
+    """Submits func(*item) for each item and yields the results in order.
+
+    At most max_pending items are in flight at a time, so finished results do
+    not pile up in memory while an earlier item is still running.
+    """
+    from collections import deque
+
+    pending = deque()
+    items = iter(items)
+    for item in items:
+        pending.append(executor.submit(func, *item))
+        if len(pending) >= max_pending:
+            break
+    while pending:
+        yield pending.popleft().result()
+        for item in items:
+            pending.append(executor.submit(func, *item))
+            break
+
+
+def _export_vector_paged(
+    ee_object,
+    filename,
+    selectors,
+    page_size,
+    max_workers=4,
+    max_retries=3,
+    verbose=True,
+    timeout=300,
+    proxies=None,
+    return_df=False,
+    keep_zip=False,
+):
+    """Downloads an ee.FeatureCollection in pages of page_size features and concatenates them into one file.
+
+    If return_df is True, the pages are parsed in memory and returned as one DataFrame instead.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    basename = os.path.basename(filename)
+    name, ext = os.path.splitext(basename)
+    filetype = ext[1:].lower()
+
+    n = ee_object.size().getInfo()
+    if n == 0:
+        return _export_empty(filename, filetype, selectors, verbose, return_df, keep_zip)
+    pages = [(start, min(page_size, n - start)) for start in range(0, n, page_size)]
+
+    def download_page(start, count):
+        page = ee.FeatureCollection(ee_object.toList(count, start))
+        return _download_content(
+            page,
+            filetype,
+            selectors,
+            f"{name}_{start}",
+            timeout=timeout,
+            proxies=proxies,
+            max_retries=max_retries,
+        )
+
+    if verbose:
+        print(f"Downloading {n} features in {len(pages)} pages ...")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = _ordered_results(executor, download_page, pages, max_workers * 2)
+        if return_df:
+            return _concat_dfs([_content_to_df(c, filetype) for c in results])
+        elif filetype == "shp":
+            _concat_shapefile_pages(results, filename, keep_zip)
+        else:
+            writer = _ChunkWriter(filename, filetype)
+            try:
+                for done, content in enumerate(results, 1):
+                    writer.write(content)
+                    if verbose:
+                        print(f"Downloaded {done}/{len(pages)} pages", end="\r")
+            finally:
+                writer.close()
+
+    if verbose:
+        print(f"\nData downloaded to {filename}")
+
+
+def _concat_shapefile_pages(pages, filename, keep_zip=False):
+    """Merges zipped shapefile pages into one shapefile, and zips it if keep_zip is True."""
+    gdf = _concat_dfs([_content_to_df(content, "shp") for content in pages])
+    gdf.to_file(filename)
+    if keep_zip:
+        _zip_shapefile(filename)
+
+
+def _zip_shapefile(filename):
+    """Writes the files of a shapefile into a zip file next to it."""
+    stem = os.path.splitext(filename)[0]
+    with zipfile.ZipFile(f"{stem}.zip", "w", zipfile.ZIP_DEFLATED) as z:
+        for ext in (".shp", ".shx", ".dbf", ".prj", ".cpg"):
+            if os.path.exists(stem + ext):
+                z.write(stem + ext, os.path.basename(stem + ext))
+
+
+def _export_empty(filename, filetype, selectors, verbose=True, return_df=False, keep_zip=False):
+    """Writes or returns the export of an empty collection with the selected columns, like a single download would."""
+    import geopandas as gpd
+    import pandas as pd
+
+    columns = [c for c in selectors if c != ".geo"]
+    if filetype == "csv":
+        df = pd.DataFrame(columns=columns)
+    else:
+        df = gpd.GeoDataFrame(pd.DataFrame(columns=columns), geometry=[], crs="EPSG:4326")
+    if return_df:
+        return df
+
+    if filetype == "csv":
+        df.to_csv(filename, index=False)
+    elif filetype == "shp":
+        df.to_file(filename)
+        if keep_zip:
+            _zip_shapefile(filename)
+    else:
+        _ChunkWriter(filename, filetype).close()
+    if verbose:
+        print(f"The collection is empty. Data downloaded to {filename}")
+
+
+class _ChunkWriter:
+    """Appends csv or geojson chunks to a single output file."""
+
+    def __init__(self, filename, filetype):
+        self.filetype = filetype
+        self.count = 0
+        self.fd = open(filename, "wb")
+        if filetype == "geojson":
+            self.fd.write(b'{"type": "FeatureCollection", "features": [')
+
+    def write(self, content):
+        if self.filetype == "csv":
+            if self.count > 0:
+                # Drop the header of every chunk but the first
+                content = content.split(b"\n", 1)[1] if b"\n" in content else b""
+            if content and not content.endswith(b"\n"):
+                content += b"\n"
+            self.fd.write(content)
+            self.count += 1
+        else:
+            for feature in json.loads(content).get("features", []):
+                if self.count > 0:
+                    self.fd.write(b", ")
+                self.fd.write(json.dumps(feature).encode("utf-8"))
+                self.count += 1
+
+    def close(self):
+        if self.filetype == "geojson":
+            self.fd.write(b"]}")
+        self.fd.close()
+
+
+def _zonal_stats_batched(
+    in_value_raster,
+    in_zone_vector,
+    filename,
+    reducer,
+    scale,
+    crs,
+    tile_scale,
+    batch_size,
+    max_workers=4,
+    max_retries=3,
+    verbose=True,
+    timeout=300,
+    proxies=None,
+    return_df=False,
+):
+    """Computes zonal statistics in chunks of zones and streams the results into one file.
+
+    A chunk that fails is split in half and each half is retried with a doubled
+    tile_scale, up to max_retries times. If return_df is True, the chunks are
+    parsed in memory and returned as one DataFrame instead.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    basename = os.path.basename(filename)
+    name, ext = os.path.splitext(basename)
+    filetype = ext[1:].lower()
+
+    n = in_zone_vector.size().getInfo()
+    if n == 0:
+        raise ValueError("The zone collection is empty.")
+    chunks = [(start, min(batch_size, n - start)) for start in range(0, n, batch_size)]
+
+    def reduce_chunk(start, count, scale_factor):
+        zones = ee.FeatureCollection(in_zone_vector.toList(count, start))
+        return in_value_raster.reduceRegions(
+            collection=zones,
+            reducer=reducer,
+            scale=scale,
+            crs=crs,
+            tileScale=scale_factor,
+        )
+
+    # Use the same attributes for all chunks so that their columns line up
+    selectors = reduce_chunk(*chunks[0], tile_scale).first().propertyNames().getInfo()
+    if filetype == "geojson":
+        selectors = [".geo"] + selectors
+
+    def run_chunk(start, count, scale_factor, retries=0):
+        try:
+            result = reduce_chunk(start, count, scale_factor)
+            if filetype == "csv":
+                result = result.select([".*"], None, False)
+            return [
+                _download_content(result, filetype, selectors, name, timeout, proxies)
+            ]
+        except Exception as e:
+            if retries >= max_retries:
+                raise
+            if verbose:
+                print(f"Chunk {start}-{start + count} failed ({e}). Retrying ...")
+            if count == 1:
+                return run_chunk(start, count, scale_factor * 2, retries + 1)
+            half = count // 2
+            return run_chunk(start, half, scale_factor * 2, retries + 1) + run_chunk(
+                start + half, count - half, scale_factor * 2, retries + 1
+            )
+
+    if verbose:
+        print(f"Computing statistics for {n} zones in {len(chunks)} chunks ...")
+
+    chunk_args = [chunk + (tile_scale,) for chunk in chunks]
+    if return_df:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = _ordered_results(executor, run_chunk, chunk_args, max_workers * 2)
+            return _concat_dfs(
+                [_content_to_df(c, filetype) for contents in results for c in contents]
+            )
+
+    writer = _ChunkWriter(filename, filetype)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = _ordered_results(executor, run_chunk, chunk_args, max_workers * 2)
+            for done, contents in enumerate(results, 1):
+                for content in contents:
+                    writer.write(content)
+                if verbose:
+                    print(f"Finished {done}/{len(chunks)} chunks", end="\r")
+    finally:
+        writer.close()
+
+    if verbose:
+        print(f"\nData downloaded to {filename}")
+
+
 zonal_statistics = zonal_stats
\ No newline at end of file
@@ -0,0 +1,371 @@
+"""The export module writes maps to HTML with their GeoJSON layer data compressed, deduplicated and loaded lazily.
+
+It also caches the rendered HTML of maps by a hash of their content, so apps
+that rebuild the same map on every interaction, e.g., Streamlit scripts,
+render it once.
+"""
+import base64
+import gzip
+import hashlib
+import io
+import json
+import marshal
+import os
+import pickle
+import re
+import threading
+import types
+
+from .utility import LRUCache
+
+# Matches the script that folium.GeoJson renders to load data that is not embedded.
+_AJAX = re.compile(
+    r"\$\.ajax\((\"[^\"]*\"), \{dataType: 'json', async: false\}\)\s*\.done\((\w+)_add\);"
+)
+
+# Loads the data of a layer the first time it is shown on the map. The data
+# is gzip-compressed, either inline as base64 or in a file next to the page,
+# and is decompressed by the browser with DecompressionStream.
+_LOADER = """
+<script>
+var watergeoData = (function() {
+    var cache = {};
+    function bytes(id, url) {
+        if (url) {
+            return fetch(url).then(function(r) { return r.arrayBuffer(); });
+        }
+        var text = document.getElementById("watergeo-data-" + id).textContent.trim();
+        return fetch("data:application/octet-stream;base64," + text).then(function(r) { return r.arrayBuffer(); });
+    }
+    function parse(buffer) {
+        var head = new Uint8Array(buffer, 0, 2);
+        if (head[0] !== 0x1f || head[1] !== 0x8b) {
+            // Already decompressed by the server (Content-Encoding: gzip)
+            return JSON.parse(new TextDecoder().decode(buffer));
+        }
+        var stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream("gzip"));
+        return new Response(stream).json();
+    }
+    return function(id, url, layer, add) {
+        function load() {
+            if (!cache[id]) { cache[id] = bytes(id, url).then(parse); }
+            cache[id].then(add);
+        }
+        function watch() {
+            layer.once("add", function() {
+                setTimeout(function() { if (layer._map) { load(); } else { watch(); } }, 0);
+            });
+        }
+        watch();
+    };
+})();
+</script>
+"""
+
+
+def _given_name(element):
+    # folium names unnamed layers after their element, before or after its subclass sets _name.
+    name = getattr(element, "layer_name", None)
+    return name if name not in (element.get_name(), f"macro_element_{element._id}") else None
+
+
+def _iter_elements(element, group=None):
+    """Yields the elements of a folium map with the name of the nearest named layer containing them."""
+    name = _given_name(element) or group
+    yield element, name
+    for child in element._children.values():
+        yield from _iter_elements(child, name)
+
+
+def render_compact(m, mode="inline", data_dir="", min_bytes=10 * 1024):
+    """Renders a folium map to HTML with its GeoJSON layer data compressed and loaded lazily.
+
+    The data of every GeoJSON layer larger than min_bytes is gzip-compressed
+    and stored once per distinct dataset, so layers sharing data, e.g., the
+    outline on both sides of a split map, share one copy. The page decompresses
+    the data of a layer the first time the layer is shown.
+
+    Args:
+        m (folium.Map): The map.
+        mode (str, optional): "inline" to embed the compressed data in the page as base64, or "external"
+            to load it from .json.gz files. Defaults to "inline".
+        data_dir (str, optional): The URL of the directory of the external files relative to the page. Defaults to "".
+        min_bytes (int, optional): The size of the JSON data below which a layer stays embedded. Defaults to 10 KiB.
+
+    Returns:
+        tuple: The HTML, the compressed datasets keyed by id, and the size report, one dict per
+            GeoJSON layer with its name, the size of its JSON data, the size of its compressed data,
+            its dataset id, and whether the dataset is shared with other layers.
+    """
+    import folium
+
+    if mode not in ("inline", "external"):
+        raise ValueError("mode must be 'inline' or 'external'.")
+
+    datasets = {}
+    report = []
+    changed = []
+    names = {}
+    for element, name in _iter_elements(m):
+        if not isinstance(element, folium.GeoJson) or not element.embed:
+            continue
+        # Unnamed layers, e.g., the levels of detail of a group, are numbered within their group.
+        name = name or element.get_name()
+        names[name] = names.get(name, 0) + 1
+        if not _given_name(element):
+            name = f"{name} [{names[name]}]"
+        text = json.dumps(element.data, separators=(",", ":")).encode("utf-8")
+        entry = {"layer": name, "json_bytes": len(text)}
+        if len(text) < min_bytes:
+            report.append(dict(entry, compressed_bytes=None, dataset=None))
+            continue
+        digest = hashlib.sha1(text).hexdigest()[:16]
+        if digest not in datasets:
+            datasets[digest] = gzip.compress(text, compresslevel=9, mtime=0)
+        url = f"{data_dir}/{digest}.json.gz" if mode == "external" else ""
+        changed.append((element, element.embed_link))
+        element.embed = False
+        element.embed_link = f"{digest}|{url}"
+        report.append(dict(entry, compressed_bytes=len(datasets[digest]), dataset=digest))
+
+    try:
+        html = m.get_root().render()
+    finally:
+        for element, embed_link in changed:
+            element.embed = True
+            element.embed_link = embed_link
+
+    def lazy(match):
+        digest, url = json.loads(match.group(1)).split("|", 1)
+        name = match.group(2)
+        return f"watergeoData({json.dumps(digest)}, {json.dumps(url or None)}, {name}, {name}_add);"
+
+    html = _AJAX.sub(lazy, html)
+    if datasets:
+        blocks = [_LOADER]
+        if mode == "inline":
+            blocks += [
+                f'<script type="application/octet-stream" id="watergeo-data-{digest}">'
+                f"{base64.b64encode(content).decode('ascii')}</script>\n"
+                for digest, content in datasets.items()
+            ]
+        html = html.replace("<head>", "<head>" + "".join(blocks), 1)
+
+    counts = {}
+    for entry in report:
+        counts[entry["dataset"]] = counts.get(entry["dataset"], 0) + 1
+    for entry in report:
+        entry["shared"] = entry["dataset"] is not None and counts[entry["dataset"]] > 1
+    return html, datasets, report
+
+
+def export_folium(m, filename, mode="inline", min_bytes=10 * 1024, verbose=False):
+    """Saves a folium map to HTML with its GeoJSON layer data compressed and loaded lazily.
+
+    See render_compact(). In "external" mode, the data is written to
+    .json.gz files in the "<name>_files" directory next to the page, which
+    can only be loaded when the page is served over HTTP.
+
+    Args:
+        m (folium.Map): The map.
+        filename (str): The path of the HTML file.
+        mode (str, optional): "inline" or "external". Defaults to "inline".
+        min_bytes (int, optional): The size of the JSON data below which a layer stays embedded. Defaults to 10 KiB.
+        verbose (bool, optional): Whether to print the size report. Defaults to False.
+
+    Returns:
+        list: The size report, see render_compact().
+    """
+    filename = os.path.abspath(filename)
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    html, datasets, report = render_compact(m, mode, f"{stem}_files", min_bytes)
+
+    if mode == "external" and datasets:
+        data_dir = os.path.join(os.path.dirname(filename), f"{stem}_files")
+        os.makedirs(data_dir, exist_ok=True)
+        for digest, content in datasets.items():
+            with open(os.path.join(data_dir, f"{digest}.json.gz"), "wb") as f:
+                f.write(content)
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(html)
+
+    if verbose:
+        print_report(report, os.path.getsize(filename))
+    return report
+
+
+def widget_state_report(state):
+    """Returns the size of the data of each GeoJSON layer in the widget state of an ipyleaflet map.
+
+    Args:
+        state (dict): The widget state, e.g., from ipywidgets.embed.dependency_state().
+
+    Returns:
+        list: One dict per GeoJSON layer with its name and the size of its JSON data.
+    """
+    report = []
+    for model in state.values():
+        if model.get("model_name") == "LeafletGeoJSONModel":
+            data = model["state"].get("data", {})
+            report.append(
+                {
+                    "layer": model["state"].get("name", ""),
+                    "json_bytes": len(json.dumps(data, separators=(",", ":"))),
+                }
+            )
+    return report
+
+
+def print_report(report, total_bytes=None):
+    """Prints the size report of an export.
+
+    Args:
+        report (list): The report returned by export_folium() or widget_state_report().
+        total_bytes (int, optional): The size of the HTML file. Defaults to None.
+    """
+    for entry in report:
+        line = f"{entry['layer']}: {entry['json_bytes'] / 1024:,.1f} KiB JSON"
+        if entry.get("compressed_bytes") is not None:
+            line += f", {entry['compressed_bytes'] / 1024:,.1f} KiB compressed"
+            if entry["shared"]:
+                line += f" (shared dataset {entry['dataset']})"
+        print(line)
+    if total_bytes is not None:
+        print(f"HTML file: {total_bytes / 1024:,.1f} KiB")
+
+
+# Element and model ids, which differ every time a script builds the same map.
+_ID = re.compile(r"[0-9a-f]{32}")
+
+_html_cache = None
+_html_cache_lock = threading.Lock()
+
+
+def get_html_cache():
+    """Returns the cache of rendered map HTML shared by all sessions of the process.
+
+    Its number of entries can be set with the WATERGEO_HTML_CACHE_SIZE
+    environment variable and defaults to 32.
+
+    Returns:
+        utility.LRUCache: The cache.
+    """
+    global _html_cache
+    with _html_cache_lock:
+        if _html_cache is None:
+            _html_cache = LRUCache(maxsize=int(os.environ.get("WATERGEO_HTML_CACHE_SIZE", 32)))
+        return _html_cache
+
+
+# The attributes of folium elements that hold ids, the element tree or templates.
+_SKIP = {"_id", "_parent", "_children", "_env", "_template"}
+
+
+def _element_state(element):
+    return {
+        key: _ID.sub("", value) if isinstance(value, str) else value
+        for key, value in vars(element).items()
+        if key not in _SKIP
+    }
+
+
+class _StatePickler(pickle.Pickler):
+    """Pickles the state of a map, replacing the objects that pickle cannot handle by stable stand-ins.
+
+    Map elements and widgets are replaced by their position in the map, and
+    functions, e.g., style functions, by their code, defaults, closure and the
+    globals they use, so the same map built again gives the same bytes.
+    """
+
+    def __init__(self, file, positions):
+        from branca.element import Element
+
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.positions = positions
+        self.element_type = Element
+
+    def reducer_override(self, obj):
+        if id(obj) in self.positions:
+            return str, (f"element:{self.positions[id(obj)]}",)
+        if isinstance(obj, self.element_type):
+            # Elements outside the tree, e.g., the global switches of a map.
+            state = sorted(_element_state(obj).items(), key=lambda item: item[0])
+            return tuple, ((type(obj).__qualname__, state),)
+        if isinstance(obj, types.FunctionType):
+            code = obj.__code__
+            names = {name: obj.__globals__[name] for name in code.co_names if name in obj.__globals__}
+            cells = tuple(cell.cell_contents for cell in obj.__closure__ or ())
+            return tuple, ((marshal.dumps(code), obj.__defaults__, obj.__kwdefaults__, cells, names),)
+        if isinstance(obj, types.ModuleType):
+            return str, (f"module:{obj.__name__}",)
+        return NotImplemented
+
+
+def _map_nodes(m):
+    """Returns the elements of a folium map, or the widgets of an ipyleaflet map, with their state."""
+    try:
+        from ipywidgets import Widget
+    except ImportError:
+        Widget = ()
+
+    nodes = []
+    if isinstance(m, Widget):
+        stack, seen = [m], set()
+        while stack:
+            widget = stack.pop(0)
+            if id(widget) in seen:
+                continue
+            seen.add(id(widget))
+            state = {key: getattr(widget, key) for key in widget.keys if key != "_model_id"}
+            nodes.append((widget, state))
+            for value in state.values():
+                values = value if isinstance(value, (list, tuple)) else [value]
+                stack.extend(v for v in values if isinstance(v, Widget))
+        return nodes
+
+    return [(element, _element_state(element)) for element, _ in _iter_elements(m)]
+
+
+def map_fingerprint(m):
+    """Returns a content hash of the layers, controls and view state of a map.
+
+    Maps built the same way, e.g., by successive runs of a Streamlit script,
+    have the same hash although their element ids differ. The layer data is
+    hashed through pickle, which is several times faster than rendering it.
+
+    Args:
+        m (folium.Map | ipyleaflet.Map): The map.
+
+    Returns:
+        str: The hash, or None if the state of the map cannot be hashed.
+    """
+    nodes = _map_nodes(m)
+    positions = {id(node): index for index, (node, _) in enumerate(nodes)}
+    digest = hashlib.sha1()
+    try:
+        for node, state in nodes:
+            buffer = io.BytesIO()
+            pickler = _StatePickler(buffer, positions)
+            pickler.dump((type(node).__qualname__, sorted(state.items(), key=lambda item: item[0])))
+            digest.update(buffer.getbuffer())
+    except (pickle.PicklingError, TypeError, AttributeError, RecursionError, ValueError):
+        return None
+    return digest.hexdigest()
+
+
+def cached_html(m, render, *options):
+    """Returns the HTML of a map from the shared cache, rendering it only if the map changed.
+
+    Args:
+        m (folium.Map | ipyleaflet.Map): The map.
+        render (callable): The function that renders the HTML of the map.
+        *options: The rendering options that are part of the cache key, e.g., the size of the map.
+
+    Returns:
+        str: The HTML.
+    """
+    fingerprint = map_fingerprint(m)
+    if fingerprint is None:
+        return render()
+    key = (type(m).__module__, fingerprint) + options
+    return get_html_cache().get_or_set(key, render)
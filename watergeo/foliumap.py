@@ -1,40 +1,246 @@
 import folium
+import numpy as np
 from ipyleaflet import basemaps
 import ee
 from folium import plugins
 import geopandas as gpd
-import json
+from branca.element import MacroElement
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from jinja2 import Template
+from .common import ee_initialize, get_map_id, map_id_cache
+
+
+class _ZoomLevels(MacroElement):
+    """Shows only the layer of a group whose minimum zoom level matches the current map zoom.
+
+    Args:
+        group (folium.FeatureGroup): The group that contains the layers.
+        levels (list): A list of (min_zoom, layer) pairs in increasing order of min_zoom.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var group = {{ this.group.get_name() }};
+            var levels = [
+                {%- for zoom, layer in this.levels %}
+                [{{ zoom }}, {{ layer.get_name() }}],
+                {%- endfor %}
+            ];
+            function update() {
+                var zoom = map.getZoom();
+                var current = levels[0][1];
+                levels.forEach(function(level) {
+                    if (zoom >= level[0]) { current = level[1]; }
+                });
+                levels.forEach(function(level) {
+                    if (level[1] === current) {
+                        if (!group.hasLayer(level[1])) { group.addLayer(level[1]); }
+                    } else if (group.hasLayer(level[1])) {
+                        group.removeLayer(level[1]);
+                    }
+                });
+            }
+            map.on("zoomend", update);
+            update();
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, group, levels):
+        super().__init__()
+        self._name = "ZoomLevels"
+        self.group = group
+        self.levels = levels
+
+
+class _ColumnSwitcher(MacroElement):
+    """Adds a dropdown that restyles a GeoJSON layer with the precomputed classes of another column.
+
+    Args:
+        layer (folium.GeoJson): The layer. Its features have their position in the data as id.
+        styles (choropleth.ChoroplethStyles): The classes and colors of the features.
+        title (str): The title of the legend.
+        position (str): The position of the control.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var layer = {{ this.layer.get_name() }};
+            var columns = {{ this.columns|tojson }};
+            var classes = {{ this.classes|tojson }};
+            var legends = {{ this.legends|tojson }};
+            var nodata = {{ this.nodata_color|tojson }};
+            var control = L.control({position: {{ this.position|tojson }}});
+            control.onAdd = function() {
+                var div = L.DomUtil.create("div", "leaflet-bar");
+                div.style.background = "white";
+                div.style.padding = "6px";
+                var select = L.DomUtil.create("select", "", div);
+                var legend = L.DomUtil.create("div", "", div);
+                columns.forEach(function(column) {
+                    var option = L.DomUtil.create("option", "", select);
+                    option.value = option.text = column;
+                });
+                function show(column) {
+                    layer.eachLayer(function(feature) {
+                        var index = classes[column][feature.feature.id];
+                        feature.setStyle({fillColor: index < 0 ? nodata : legends[column][index][1]});
+                    });
+                    legend.innerHTML = "<b>" + {{ this.title|tojson }} + "</b>" + legends[column].map(function(item) {
+                        return "<div><i style='background:" + item[1] +
+                            ";width:12px;height:12px;display:inline-block;margin-right:4px'></i>" + item[0] + "</div>";
+                    }).join("");
+                }
+                select.onchange = function() { show(select.value); };
+                L.DomEvent.disableClickPropagation(div);
+                show(select.value);
+                return div;
+            };
+            control.addTo(map);
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, layer, styles, title, position="topright"):
+        super().__init__()
+        self._name = "ColumnSwitcher"
+        self.layer = layer
+        self.columns = styles.columns
+        self.classes = {column: styles.classes[column].tolist() for column in styles.columns}
+        self.legends = {column: styles.legend(column) for column in styles.columns}
+        self.nodata_color = styles.nodata_color
+        self.title = title
+        self.position = position
+
+
+class _ClusterLayer(MacroElement):
+    """Shows the clusters served by a points.ClusterSource for the current viewport in a layer group.
+
+    Args:
+        group (folium.FeatureGroup): The group that holds the markers.
+        url (str): The base URL of the source.
+        point_style (dict): The style of the circle markers of single points.
+        cluster_style (dict): The style of the circle markers of clusters.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var group = {{ this.group.get_name() }};
+            var pointStyle = {{ this.point_style|tojson }};
+            var clusterStyle = {{ this.cluster_style|tojson }};
+            var layer = L.geoJSON(null, {
+                pointToLayer: function(feature, latlng) {
+                    var props = feature.properties;
+                    var style = Object.assign({}, props.cluster ? clusterStyle : pointStyle, props.style || {});
+                    var marker = L.circleMarker(latlng, style);
+                    var rows = Object.keys(props).filter(function(key) { return key !== "style"; }).map(function(key) {
+                        return "<b>" + key + "</b>: " + props[key];
+                    });
+                    marker.bindPopup(rows.join("<br>"));
+                    if (props.cluster) {
+                        marker.bindTooltip(String(props.point_count), {permanent: true, direction: "center", className: "watergeo-cluster-count"});
+                    }
+                    return marker;
+                }
+            }).addTo(group);
+            var request = 0;
+            function update() {
+                var b = map.getBounds();
+                var id = ++request;
+                var url = {{ this.url|tojson }} + "/" + map.getZoom() + "/" +
+                    [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].join(",") + ".json";
+                fetch(url).then(function(r) { return r.json(); }).then(function(data) {
+                    if (id !== request) { return; }
+                    layer.clearLayers();
+                    layer.addData(data);
+                });
+            }
+            map.on("moveend", update);
+            update();
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, group, url, point_style, cluster_style):
+        super().__init__()
+        self._name = "ClusterLayer"
+        self.group = group
+        self.url = url
+        self.point_style = point_style
+        self.cluster_style = cluster_style
 
 
 class Map(folium.Map):
 
-    def __init__(self, center=[20, 0], zoom=2, **kwargs):
+    # The Earth Engine map ID cache shared by all maps. Use map_id_cache.info()
+    # to get the number of hits and misses.
+    map_id_cache = map_id_cache
+
+    def __init__(self, center=[20, 0], zoom=2, init_ee=True, **kwargs):
         super().__init__(location=center, zoom_start=zoom, **kwargs)
 
-        if not ee.data._initialized:
-            ee.Authenticate()
-            ee.Initialize()
+        # Maps built without Earth Engine layers, e.g., by batch jobs, need no credentials.
+        if init_ee:
+            ee_initialize(authenticate=True)
 
-    def add_raster(self, data, name="raster", zoom_to_layer=True, **kwargs):
+    def add_raster(
+        self,
+        data,
+        name="raster",
+        zoom_to_layer=True,
+        stream=True,
+        overviews="auto",
+        **kwargs,
+    ):
 
         """Adds a raster layer to the map.
 
+        The tiles are rendered by the raster pool shared by all maps in the
+        process (see raster.get_raster_pool()), which opens each raster once and
+        keeps the rendered tiles in memory. Remote Cloud-Optimized GeoTIFFs are
+        read with HTTP range requests through an on-disk block cache, and other
+        remote rasters are downloaded once into a persistent cache. The tiles are
+        served by the current Python process.
+
         Args:
-            data (str): The path to the raster file.
+            data (str): The path to the raster file or a URL.
             name (str, optional): The name of the layer. Defaults to "raster".
+            zoom_to_layer (bool, optional): Whether to zoom to the raster. Defaults to True.
+            stream (bool, optional): Whether to read remote rasters with range requests. Defaults to True.
+            overviews (bool | str, optional): Whether to build overviews of local rasters without them, so that
+                low-zoom tiles are fast. "auto" builds them for files over 64 MiB (raster.ensure_overviews()). Defaults to "auto".
+            **kwargs: The style of the raster (e.g., colormap, vmin, vmax, indexes) and tile layer options.
         """
+        from .raster import get_raster_pool, split_style
+        from .tileserver import get_tile_server
 
-        try:
-            from localtileserver import TileClient, get_folium_tile_layer
-        except ImportError:
-            raise ImportError("Please install the localtileserver package.")
-
-        client = TileClient(data)
-        layer = get_folium_tile_layer(client, name=name, **kwargs)
+        style, options = split_style(kwargs)
+        source, url = get_raster_pool().source(
+            data, stream=stream, overviews=overviews, **style
+        )
+        options.setdefault("attr", name)
+        layer = folium.TileLayer(tiles=url, name=name, overlay=True, **options)
+        layer.tile_source = source
+        get_tile_server().attach(layer, source.key)
         layer.add_to(self)
 
+        if zoom_to_layer:
+            self.fit_bounds(source.bounds())
 
-    def add_tile_layer(self, url, name, attribution="Custom Tile", **kwargs):
+
+    def add_tile_layer(self, url, name, attribution="Custom Tile", proxy=False, **kwargs):
         """
         Adds a tile layer to the current map.
 
@@ -42,21 +248,34 @@ class Map(folium.Map):
             url (str): The URL of the tile layer.
             name (str): The name of the layer.
             attribution (str, optional): The attribution text to be displayed for the layer. Defaults to "Custom Tile".
+            proxy (bool, optional): Whether to load the tiles through the local caching tile proxy
+                (tileproxy.proxy_tiles()), which keeps them in memory and on disk. Defaults to False.
             **kwargs: Arbitrary keyword arguments for additional layer options.
 
         Returns:
             None
         """
+        source = None
+        if proxy:
+            from .tileproxy import proxy_tiles
+            from .tileserver import get_tile_server
+
+            source, url = proxy_tiles(url)
         layer = folium.TileLayer(tiles=url, name=name, attr=attribution, **kwargs)
+        if source is not None:
+            layer.tile_source = source
+            get_tile_server().attach(layer, source.key)
         layer.add_to(self)
 
-    def add_basemap(self, name, overlay=True):
+    def add_basemap(self, name, overlay=True, proxy=False):
         """
         Adds a basemap to the current map.
 
         Args:
             name (str or object): The name of the basemap as a string, or an object representing the basemap.
             overlay (bool, optional): Whether the basemap is an overlay. Defaults to True.
+            proxy (bool, optional): Whether to load the tiles of a named basemap through the local
+                caching tile proxy. Defaults to False.
 
         Raises:
             TypeError: If the name is neither a string nor an object representing a basemap.
@@ -87,27 +306,50 @@ class Map(folium.Map):
         if isinstance(name, str):
             if name in basemaps:
                 url = basemaps[name]
-                self.add_tile_layer(url, name, overlay=overlay)
+                self.add_tile_layer(url, name, overlay=overlay, proxy=proxy)
             else:
                 print(f"Basemap '{name}' not found. Available basemaps are: {list(basemaps.keys())}")
         else:
             name.add_to(self)
 
-    def to_streamlit(self, width=700, height=500):
-        """
-        Converts the map to a streamlit component.
+    def to_html(self, filename=None, compact=False, mode="inline", min_bytes=10 * 1024, verbose=False):
+        """Exports the map to HTML.
+
+        With compact set, the data of the GeoJSON layers is gzip-compressed,
+        stored once per distinct dataset and loaded by the page when a layer is
+        first shown (see export.render_compact()). The size of each layer is
+        stored in the export_report attribute of the map.
 
         Args:
-            width (int, optional): The width of the map. Defaults to 700.
-            height (int, optional): The height of the map. Defaults to 500.
+            filename (str, optional): The path of the HTML file. Defaults to None (return the HTML).
+            compact (bool, optional): Whether to compress and lazily load the layer data. Defaults to False.
+            mode (str, optional): "inline" to embed the compressed data in the page, or "external" to write it
+                to files next to it, which requires serving the page over HTTP. Defaults to "inline".
+            min_bytes (int, optional): The size of the JSON data below which a layer stays embedded. Defaults to 10 KiB.
+            verbose (bool, optional): Whether to print the size of each layer. Defaults to False.
 
         Returns:
-            object: The streamlit component representing the map.
+            str: The HTML if filename is None.
         """
+        from .export import export_folium, print_report, render_compact
+
+        if not compact:
+            html = self.get_root().render()
+            self.export_report = None
+        elif filename is not None:
+            self.export_report = export_folium(self, filename, mode, min_bytes, verbose)
+            return None
+        elif mode == "external":
+            raise ValueError("A filename is required to write the layer data to external files.")
+        else:
+            html, _, self.export_report = render_compact(self, mode, min_bytes=min_bytes)
+            if verbose:
+                print_report(self.export_report, len(html.encode("utf-8")))
 
-        from streamlit_folium import folium_static
-
-        return folium_static(self, width=width, height=height)
+        if filename is None:
+            return html
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(html)
 
     def add_layer_control(self):
         """
@@ -119,7 +361,7 @@ class Map(folium.Map):
 
         folium.LayerControl().add_to(self)
 
-    def add_ee_layer(self, ee_object, vis_params, name):
+    def add_ee_layer(self, ee_object, vis_params, name, proxy=False):
         """
         Adds a Earth Engine layer to the current map.
 
@@ -127,60 +369,125 @@ class Map(folium.Map):
             ee_object (object): The Earth Engine object to be displayed.
             vis_params (dict): Visualization parameters as a dictionary.
             name (str): The name of the layer.
+            proxy (bool, optional): Whether to load the tiles through the local caching tile proxy. Defaults to False.
 
         Returns:
             None
         """
-        ee.Initialize()
+        ee_initialize()
         try:
             # Convert the Earth Engine layer to a TileLayer that can be added to a folium map.
-            map_id_dict = ee.Image(ee_object).getMapId(vis_params)
-            folium.raster_layers.TileLayer(
-                tiles=map_id_dict['tile_fetcher'].url_format,
-                attr='Map Data &copy; <a href="https://earthengine.google.com/">Google Earth Engine</a>',
-                name=name,
+            map_id_dict = get_map_id(ee_object, vis_params)
+            self.add_tile_layer(
+                map_id_dict['tile_fetcher'].url_format,
+                name,
+                attribution='Map Data &copy; <a href="https://earthengine.google.com/">Google Earth Engine</a>',
+                proxy=proxy,
                 overlay=True,
                 control=True
-            ).add_to(self)
+            )
         except Exception as e:
             print(f"Could not display {name}: {e}")
 
-    def add_geojson(self, data, name="geojson", **kwargs):
+    def add_geojson(self, data, name="geojson", lod=False, lod_zooms=None, **kwargs):
         """Adds a GeoJSON layer to the map.
 
         Args:
-            data (str | dict): The GeoJSON data as a string or a dictionary.
+            data (str | dict): The path to a GeoJSON or other vector file, read with vector.read_geojson(), or a dictionary.
             name (str, optional): The name of the layer. Defaults to "geojson".
+            lod (bool, optional): Whether to embed simplified, coordinate-quantized versions of the data
+                for bands of zoom levels and show the one matching the map zoom. The payload sizes of the
+                original data and of each level are stored in the layer's lod_report attribute. Defaults to False.
+            lod_zooms (tuple, optional): The zoom levels at which the levels of detail start. Defaults to
+                vector.DEFAULT_LOD_ZOOMS.
         """
         if isinstance(data, str):
-            with open(data) as f:
-                data = json.load(f)
+            from .vector import read_geojson
 
-        folium.GeoJson(data, name=name, **kwargs).add_to(self)
+            data = read_geojson(data)
 
-    def add_shp(self, data, name="shp", **kwargs):
+        if not lod:
+            folium.GeoJson(data, name=name, **kwargs).add_to(self)
+            return
+
+        from .vector import DEFAULT_LOD_ZOOMS, build_lod
+
+        levels, report = build_lod(data, lod_zooms or DEFAULT_LOD_ZOOMS)
+        group = folium.FeatureGroup(name=name)
+        group.lod_report = report
+        layers = []
+        for zoom, level in levels:
+            layer = folium.GeoJson(level, control=False, **kwargs)
+            layer.add_to(group)
+            layers.append((zoom, layer))
+        group.add_to(self)
+        _ZoomLevels(group, layers).add_to(self)
+
+    def add_shp(
+        self,
+        data,
+        name="shp",
+        columns=None,
+        bbox=None,
+        mask=None,
+        where=None,
+        cache=True,
+        **kwargs,
+    ):
         """
         Adds a shapefile to the current map.
 
         Args:
             data (str or dict): The path to the shapefile as a string, or a dictionary representing the shapefile.
             name (str, optional): The name of the layer. Defaults to "shp".
+            columns (list, optional): The attribute columns to read from a file. Defaults to None (all columns).
+            bbox (tuple, optional): Only read the features of a file intersecting (minx, miny, maxx, maxy),
+                in the CRS of the file. Defaults to None.
+            mask (object, optional): Only read the features of a file intersecting a shapely geometry
+                or a GeoDataFrame. Defaults to None.
+            where (str, optional): An SQL WHERE clause selecting the features to read from a file. Defaults to None.
+            cache (bool, optional): Whether to use the parsed-vector caches of vector.read_vector(). Defaults to True.
             **kwargs: Arbitrary keyword arguments.
         """
+        from .vector import read_vector
+
         if isinstance(data, str):
-            data = gpd.read_file(data).to_json()
+            data = read_vector(
+                data, columns=columns, bbox=bbox, mask=mask, where=where, cache=cache
+            ).__geo_interface__
 
         self.add_geojson(data, name, **kwargs)
 
 
-    def add_vector(self, data, name="vector", **kwargs):
+    def add_vector(
+        self,
+        data,
+        name="vector",
+        mode="geojson",
+        columns=None,
+        bbox=None,
+        mask=None,
+        where=None,
+        cache=True,
+        **kwargs,
+    ):
         """
         Adds a vector layer to the current map.
 
         Args:
-            data (str, GeoDataFrame, dict): The vector data as a string (path to file), GeoDataFrame, or a dictionary.
+            data (str, GeoDataFrame, dict): The vector data as a path to any file supported by
+                vector.read_vector() (e.g., shapefile, GeoJSON, GeoPackage), a GeoDataFrame, or a dictionary.
             name (str, optional): The name of the layer. Defaults to "vector".
-            **kwargs: Arbitrary keyword arguments.
+            mode (str, optional): "geojson" to embed the whole layer in the map, or "tiles" to serve it
+                as vector tiles cut on demand by a local tile server, for very large layers. Defaults to "geojson".
+            columns (list, optional): The attribute columns to read from a file. Defaults to None (all columns).
+            bbox (tuple, optional): Only read the features of a file intersecting (minx, miny, maxx, maxy),
+                in the CRS of the file. Defaults to None.
+            mask (object, optional): Only read the features of a file intersecting a shapely geometry
+                or a GeoDataFrame. Defaults to None.
+            where (str, optional): An SQL WHERE clause selecting the features to read from a file. Defaults to None.
+            cache (bool, optional): Whether to use the parsed-vector caches of vector.read_vector(). Defaults to True.
+            **kwargs: Arbitrary keyword arguments, passed to add_geojson() or add_vector_tiles().
 
         Raises:
             TypeError: If the data is not in a supported format.
@@ -188,55 +495,165 @@ class Map(folium.Map):
         Returns:
             None
         """
+        from .vector import read_vector
+
         if isinstance(data, str):
-            if data.lower().endswith(('.geojson', '.json')):
-                # Load GeoJSON directly
-                with open(data) as f:
-                    data = json.load(f)
-                folium.GeoJson(data, name=name, **kwargs).add_to(self)
-            elif data.lower().endswith(('.shp')):
-                # Read shapefile using GeoPandas and convert to GeoJSON
-                gdf = gpd.read_file(data)
-                folium.GeoJson(gdf.__geo_interface__, name=name, **kwargs).add_to(self)
-            else:
-                raise TypeError("Unsupported vector data format.")
-        elif isinstance(data, gpd.GeoDataFrame):
-            folium.GeoJson(data.__geo_interface__, name=name, **kwargs).add_to(self)
-        elif isinstance(data, dict):
-            folium.GeoJson(data, name=name, **kwargs).add_to(self)
+            data = read_vector(
+                data, columns=columns, bbox=bbox, mask=mask, where=where, cache=cache
+            )
+        elif not isinstance(data, (gpd.GeoDataFrame, dict)):
+            raise TypeError("Unsupported vector data format.")
+
+        if mode == "tiles":
+            self.add_vector_tiles(data, name, **kwargs)
+        elif mode == "geojson":
+            if isinstance(data, gpd.GeoDataFrame):
+                data = data.__geo_interface__
+            self.add_geojson(data, name, **kwargs)
         else:
-            raise TypeError("Unsupported vector data format.")   
-        
+            raise ValueError("mode must be 'geojson' or 'tiles'.")
+
+    def add_points(
+        self,
+        data,
+        latitude="latitude",
+        longitude="longitude",
+        name="points",
+        aggregate=None,
+        columns=None,
+        radius=40,
+        max_zoom=16,
+        point_style=None,
+        cluster_style=None,
+    ):
+        """Adds a layer of clustered points, e.g., gauges or wells, to the map.
+
+        The points are indexed once with a hierarchical cluster index (see
+        points.ClusterIndex) and served by the current Python process. The map
+        requests the clusters and points of the viewport whenever it is panned
+        or zoomed, so only those are sent to the browser.
+
+        Args:
+            data (str | pd.DataFrame | gpd.GeoDataFrame): The path to a CSV file or the points.
+            latitude (str, optional): The latitude column. Defaults to "latitude".
+            longitude (str, optional): The longitude column. Defaults to "longitude".
+            name (str, optional): The name of the layer. Defaults to "points".
+            aggregate (dict, optional): The attributes aggregated per cluster, e.g., {"discharge": "max"}.
+                Defaults to None.
+            columns (list, optional): The columns kept as properties of single points. Defaults to None (all columns).
+            radius (int, optional): The cluster radius in pixels. Defaults to 40.
+            max_zoom (int, optional): The highest zoom level with clusters. Defaults to 16.
+            point_style (dict, optional): The style of the markers of single points. Defaults to None.
+            cluster_style (dict, optional): The style of the markers of clusters. Their radius grows
+                with the number of points. Defaults to None.
+        """
+        from .points import ClusterIndex, ClusterSource
+        from .tileserver import get_tile_server
+
+        if isinstance(data, str):
+            from .utility import csv_to_df
+
+            data = csv_to_df(data)
+
+        index = ClusterIndex(
+            data, latitude, longitude, aggregate, columns, radius=radius, max_zoom=max_zoom
+        )
+        source = ClusterSource(index)
+        server = get_tile_server()
+
+        if point_style is None:
+            point_style = {"radius": 5, "color": "white", "weight": 1, "fillColor": "#3388ff", "fillOpacity": 0.8}
+        if cluster_style is None:
+            cluster_style = {"color": "white", "weight": 1, "fillColor": "#f03b20", "fillOpacity": 0.7}
+        group = folium.FeatureGroup(name=name)
+        group.cluster_source = source
+        key = server.register(source, layer=group)
+        group.add_to(self)
+        _ClusterLayer(group, server.source_url(key), point_style, cluster_style).add_to(self)
+
+    def add_vector_tiles(self, data, name="vector", style=None, **kwargs):
+        """Adds a vector layer served as Mapbox Vector Tiles by the local tile server.
+
+        Tiles are cut from the data when the map requests them, so only the
+        features in view are sent to the browser. The tiles are served by the
+        current Python process, so the map only shows the layer while it is running.
+
+        Args:
+            data (GeoDataFrame | dict): The vector data.
+            name (str, optional): The name of the layer. Defaults to "vector".
+            style (dict, optional): The Leaflet path style of the features. Defaults to None.
+            **kwargs: Keyword arguments passed to vector.VectorTileSource.
+        """
+        from .tileserver import get_tile_server
+        from .vector import VectorTileSource
+
+        if style is None:
+            style = {"color": "blue", "weight": 1, "fill": False}
+
+        source = VectorTileSource(data, **kwargs)
+        server = get_tile_server()
+        key = server.register(source)
+        layer = plugins.VectorGridProtobuf(
+            server.tile_url(key),
+            name,
+            {"vectorTileLayerStyles": {source.layer_name: style}},
+        )
+        layer.tile_source = source
+        server.attach(layer, key)
+        layer.add_to(self)
 
-    def add_time_slider(self, ee_image_collection, vis_params, name_prefix):
+    def add_time_slider(
+        self,
+        ee_image_collection,
+        vis_params,
+        name_prefix,
+        max_workers=8,
+        progress=False,
+    ):
         """
         Adds a time slider to the map.
 
+        The image dates are fetched in a single request, and the map IDs of the
+        images are generated concurrently.
+
         Args:
             ee_image_collection (object): The Earth Engine ImageCollection to be displayed.
             vis_params (dict): Visualization parameters as a dictionary.
             name_prefix (str): The prefix of the name of the layers.
+            max_workers (int, optional): The maximum number of concurrent getMapId requests. Defaults to 8.
+            progress (bool | callable, optional): Whether to print the progress. If a callable is given,
+                it is called with the number of finished layers and the total number of layers. Defaults to False.
 
         Returns:
             None
         """
         try:
-            # Convert the Earth Engine ImageCollection to a list of Images
-            image_list = ee_image_collection.toList(ee_image_collection.size())
-
-            # Get the number of images
-            n = image_list.size().getInfo()
+            # Get the dates of all images in one round trip
+            dates = (
+                ee_image_collection.map(
+                    lambda image: image.set("_date", image.date().format("YYYY-MM-dd"))
+                )
+                .aggregate_array("_date")
+                .getInfo()
+            )
+            n = len(dates)
 
-            for i in range(n):
-                # Get the i-th image in the list
-                image = ee.Image(image_list.get(i))
+            # Convert the Earth Engine ImageCollection to a list of Images
+            image_list = ee_image_collection.toList(n)
 
-                # Get the date of the image
-                date = image.date().format('YYYY-MM-dd').getInfo()
+            def map_id(i):
+                return get_map_id(ee.Image(image_list.get(i)), vis_params)
 
-                # Convert the Earth Engine layer to a TileLayer that can be added to a folium map.
-                map_id_dict = image.getMapId(vis_params)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(map_id, i) for i in range(n)]
+                for done, _ in enumerate(as_completed(futures), 1):
+                    if callable(progress):
+                        progress(done, n)
+                    elif progress:
+                        print(f"Generated {done}/{n} layers", end="\r")
+                map_id_dicts = [future.result() for future in futures]
 
+            for date, map_id_dict in zip(dates, map_id_dicts):
                 # Add the layer to the map
                 folium.raster_layers.TileLayer(
                     tiles=map_id_dict['tile_fetcher'].url_format,
@@ -267,8 +684,8 @@ class Map(folium.Map):
         image2 = ee.Image(layer2)
 
         # Get the map ID dictionaries
-        map_id_dict1 = image1.getMapId(vis_params1)
-        map_id_dict2 = image2.getMapId(vis_params2)
+        map_id_dict1 = get_map_id(image1, vis_params1)
+        map_id_dict2 = get_map_id(image2, vis_params2)
 
         # Create the tile layers
         tile_layer1 = folium.TileLayer(
@@ -297,7 +714,7 @@ class Map(folium.Map):
             outline_image = ee.Image(outline_layer)
 
             # Get the map ID dictionary
-            outline_map_id_dict = outline_image.getMapId()
+            outline_map_id_dict = get_map_id(outline_image)
 
             # Create the outline tile layer
             outline_tile_layer = folium.TileLayer(
@@ -314,32 +731,83 @@ class Map(folium.Map):
         # Return the split map
         return m
 
-    def add_choropleth(self, geo_data, data, columns, key_on, fill_color='YlGn', fill_opacity=0.7, line_opacity=0.2, legend_name='Legend'):
+    def add_choropleth(
+        self,
+        geo_data,
+        data=None,
+        columns=None,
+        key_on=None,
+        fill_color='YlGn',
+        fill_opacity=0.7,
+        line_opacity=0.2,
+        legend_name='Legend',
+        scheme="equal_interval",
+        k=6,
+        bins=None,
+        name="choropleth",
+        nodata_color="#cccccc",
+        position="topright",
+    ):
         """
         Add a choropleth layer to the map.
 
+        The values of all columns are classified up front with NumPy (see
+        choropleth.ChoroplethStyles). The geometries are embedded once, with the
+        fill colors of every column, and a dropdown on the map switches the
+        column shown by restyling the features in the browser.
+
         Parameters:
-        geo_data (str or dict): URL, file path, or data (json/dict) that represents the geojson geometries.
-        data (DataFrame): Pandas dataframe containing the data.
-        columns (list): The columns in the dataframe that contain the key and values.
-        key_on (str): Variable in the `geo_data` file that contains the key.
-        fill_color (str, optional): Area fill color. Defaults to 'YlGn'.
+        geo_data (str or dict): URL, file path, or data (json/dict/GeoDataFrame) that represents the geojson geometries.
+            Remote files are downloaded once into the download cache.
+        data (DataFrame, optional): Pandas dataframe containing the data. If None, the columns are properties of geo_data.
+        columns (list): The key column and the value columns of `data`, or the value columns of `geo_data` if `data` is None.
+        key_on (str): Variable in the `geo_data` file that contains the key, e.g., "feature.id" or
+            "feature.properties.FIPS".
+        fill_color (str or list, optional): The ColorBrewer color scheme or a list of colors. Defaults to 'YlGn'.
         fill_opacity (float, optional): Area fill opacity. Defaults to 0.7.
         line_opacity (float, optional): Line opacity. Defaults to 0.2.
         legend_name (str, optional): Legend title. Defaults to 'Legend'.
+        scheme (str, optional): The classification scheme, one of "quantiles", "equal_interval" and
+            "natural_breaks". Defaults to "equal_interval".
+        k (int, optional): The number of classes. Defaults to 6.
+        bins (list, optional): The upper bounds of custom classes, used instead of the scheme. Defaults to None.
+        name (str, optional): The name of the layer. Defaults to "choropleth".
+        nodata_color (str, optional): The color of the features without a value. Defaults to "#cccccc".
+        position (str, optional): The position of the column dropdown and legend. Defaults to "topright".
         """
-
-        # Add the choropleth layer to the map
-        folium.Choropleth(
-            geo_data=geo_data,
-            data=data,
-            columns=columns,
-            key_on=key_on,
-            fill_color=fill_color,
-            fill_opacity=fill_opacity,
-            line_opacity=line_opacity,
-            legend_name=legend_name
-        ).add_to(self)
+        from .choropleth import ChoroplethStyles, key_column, read_geodata
+
+        gdf = read_geodata(geo_data, key_on)
+        prop = key_column(key_on) if key_on else None
+        if isinstance(columns, str):
+            columns = [columns]
+        if data is not None:
+            key, columns = columns[0], list(columns[1:])
+            values = data.drop_duplicates(key).set_index(key)
+            gdf = gdf.assign(**{column: gdf[prop].map(values[column]) for column in columns})
+
+        styles = ChoroplethStyles(gdf, columns, scheme, k, bins, fill_color, nodata_color)
+        first = styles.colors[columns[0]].tolist()
+
+        properties = [prop] if prop else []
+        features = gdf[properties + ["geometry"]].__geo_interface__
+        for index, feature in enumerate(features["features"]):
+            feature["id"] = index
+
+        layer = folium.GeoJson(
+            features,
+            name=name,
+            style_function=lambda feature: {
+                "fillColor": first[feature["id"]],
+                "fillOpacity": fill_opacity,
+                "color": "black",
+                "weight": 1,
+                "opacity": line_opacity,
+            },
+        )
+        layer.choropleth_styles = styles
+        layer.add_to(self)
+        _ColumnSwitcher(layer, styles, legend_name, position).add_to(self)
 
         return self
     
@@ -347,6 +815,10 @@ class Map(folium.Map):
         """
         Converts the map to a streamlit component.
 
+        Streamlit runs the whole script again on every interaction, so the
+        rendered HTML is cached by the content of the map (see
+        export.cached_html()) and an unchanged map is not rendered again.
+
         Args:
             width (int, optional): The width of the map. Defaults to 700.
             height (int, optional): The height of the map. Defaults to 500.
@@ -355,27 +827,82 @@ class Map(folium.Map):
             object: The streamlit component representing the map.
         """
 
-        from streamlit_folium import folium_static
-
-        return folium_static(self, width=width, height=height)
-    
-    def add_heatmap(self, data, name="heatmap", radius=25, blur=15, gradient=None, min_opacity=0, max_zoom=18):
+        try:
+            import streamlit.components.v1 as components
+        except ImportError:
+            raise ImportError("Please install streamlit using 'pip install streamlit'.")
+
+        from .export import cached_html
+
+        html = cached_html(self, lambda: self.get_root().render())
+        return components.html(html, width=width, height=height)
+
+    def add_heatmap(
+        self,
+        data,
+        name="heatmap",
+        radius=25,
+        blur=15,
+        gradient=None,
+        min_opacity=0,
+        max_zoom=18,
+        latitude="latitude",
+        longitude="longitude",
+        value=None,
+        aggregate=None,
+        cell_size=16,
+        zooms=None,
+    ):
         """
         Adds a heatmap to the map.
 
+        With aggregate set, the points are binned with NumPy into a grid for
+        each zoom level (see points.heatmap_pyramid()) and only the weighted
+        cells are embedded. The map shows the level matching its zoom, so
+        millions of points render as a few thousand cells.
+
         Args:
-            data (list): List of points to generate the heatmap.
+            data (list | np.ndarray | pd.DataFrame): Rows of [lat, lon] or [lat, lon, weight], or a DataFrame.
             name (str, optional): The name of the heatmap layer. Defaults to "heatmap".
             radius (int, optional): The radius of influence of each point (in pixels). Defaults to 25.
             blur (int, optional): The intensity of the heatmap. Defaults to 15.
             gradient (dict, optional): The color gradient config. Defaults to None.
             min_opacity (float, optional): The minimum opacity of the heatmap. Defaults to 0.
             max_zoom (int, optional): The maximum zoom level where the points are rendered. Defaults to 18.
+            latitude (str, optional): The latitude column of a DataFrame. Defaults to "latitude".
+            longitude (str, optional): The longitude column of a DataFrame. Defaults to "longitude".
+            value (str, optional): The weight column of a DataFrame. Defaults to None.
+            aggregate (str, optional): The shape of the aggregation cells, "square" or "hex". Defaults to None
+                (the points are embedded as they are).
+            cell_size (int, optional): The width of the aggregation cells in screen pixels. Defaults to 16.
+            zooms (tuple, optional): The zoom levels at which the aggregated levels start. Defaults to
+                points.DEFAULT_HEATMAP_ZOOMS.
         """
-        # Create the heatmap layer
-        heatmap = plugins.HeatMap(data, name=name, radius=radius, blur=blur, gradient=gradient, min_opacity=min_opacity, max_zoom=max_zoom)
+        from .points import DEFAULT_HEATMAP_ZOOMS, heatmap_pyramid, point_arrays
+
+        lat, lon, weight = point_arrays(data, latitude, longitude, value)
+        options = dict(radius=radius, blur=blur, gradient=gradient, min_opacity=min_opacity)
 
-        # Add the heatmap layer to the map
-        self.add_child(heatmap)
+        if aggregate is None:
+            heatmap = plugins.HeatMap(
+                np.column_stack([lat, lon, weight]).tolist(), name=name, max_zoom=max_zoom, **options
+            )
+            self.add_child(heatmap)
+            return self
+
+        levels = heatmap_pyramid(lat, lon, weight, zooms or DEFAULT_HEATMAP_ZOOMS, cell_size, aggregate)
+        group = folium.FeatureGroup(name=name)
+        group.cell_counts = {}
+        layers = []
+        for zoom, cell_lat, cell_lon, cell_weight in levels:
+            # Each level is scaled to full intensity at its own zoom.
+            scale = np.abs(cell_weight).max() if len(cell_weight) else 1
+            cells = np.column_stack([cell_lat, cell_lon, cell_weight / (scale or 1)]).round(6)
+            layer = plugins.HeatMap(cells.tolist(), control=False, max_zoom=zoom, **options)
+            layer.add_to(group)
+            layers.append((zoom, layer))
+            group.cell_counts[zoom] = len(cells)
+        group.add_to(self)
+        _ZoomLevels(group, layers).add_to(self)
 
-        return self
\ No newline at end of file
+        return self
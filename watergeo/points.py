@@ -0,0 +1,369 @@
+"""The points module aggregates large point datasets, e.g., gauge and sensor readings, for display on the map.
+"""
+import json
+import math
+
+import numpy as np
+
+from .tileserver import TileSource
+
+DEFAULT_HEATMAP_ZOOMS = tuple(range(0, 10))
+
+
+def point_arrays(data, latitude="latitude", longitude="longitude", value=None):
+    """Returns the coordinates and weights of points as NumPy arrays.
+
+    Args:
+        data (np.ndarray | pd.DataFrame | gpd.GeoDataFrame | list): An array or list of [lat, lon]
+            or [lat, lon, weight] rows, a DataFrame with coordinate columns, or a GeoDataFrame of points.
+        latitude (str, optional): The latitude column of a DataFrame. Defaults to "latitude".
+        longitude (str, optional): The longitude column of a DataFrame. Defaults to "longitude".
+        value (str, optional): The weight column of a DataFrame. Defaults to None (all weights are 1).
+
+    Returns:
+        tuple: The latitudes, longitudes and weights.
+    """
+    import pandas as pd
+
+    if isinstance(data, pd.DataFrame):
+        if hasattr(data, "geometry") and latitude not in data.columns:
+            lat, lon = data.geometry.y.to_numpy(), data.geometry.x.to_numpy()
+        else:
+            lat, lon = data[latitude].to_numpy(), data[longitude].to_numpy()
+        weight = data[value].to_numpy() if value is not None else None
+    else:
+        array = np.asarray(data, dtype="float64")
+        if array.ndim != 2 or array.shape[1] not in (2, 3):
+            raise ValueError("The points must be rows of [lat, lon] or [lat, lon, weight].")
+        lat, lon = array[:, 0], array[:, 1]
+        weight = array[:, 2] if array.shape[1] == 3 else None
+
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    weight = np.ones(len(lat)) if weight is None else np.asarray(weight, dtype="float64")
+    valid = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(weight)
+    return lat[valid], lon[valid], weight[valid]
+
+
+def pixel_coordinates(lat, lon, zoom):
+    """Returns the Web Mercator pixel coordinates of points at a zoom level.
+
+    Args:
+        lat (np.ndarray): The latitudes.
+        lon (np.ndarray): The longitudes.
+        zoom (int): The zoom level.
+
+    Returns:
+        tuple: The x and y pixel coordinates.
+    """
+    size = 256 * 2**zoom
+    lat = np.radians(np.clip(lat, -85.0511, 85.0511))
+    x = (lon + 180) / 360 * size
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * size
+    return x, y
+
+
+def _hex_cells(x, y, size):
+    """Returns the axial coordinates of the pointy-top hexagons of width size that contain the points."""
+    radius = size / math.sqrt(3)
+    q = (math.sqrt(3) / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+    # Round the cube coordinates (q, r, -q - r) to the nearest hexagon.
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype("int64"), rr.astype("int64")
+
+
+def bin_points(lat, lon, weight, zoom, cell_size=16, shape="square"):
+    """Aggregates points into the cells of a square or hexagonal grid at a zoom level.
+
+    Args:
+        lat (np.ndarray): The latitudes.
+        lon (np.ndarray): The longitudes.
+        weight (np.ndarray): The weights.
+        zoom (int): The zoom level.
+        cell_size (int, optional): The width of the cells in screen pixels. Defaults to 16.
+        shape (str, optional): The shape of the cells, "square" or "hex". Defaults to "square".
+
+    Returns:
+        tuple: The latitudes and longitudes of the weighted centroids of the points in each
+            non-empty cell, and the total weight of each cell.
+    """
+    x, y = pixel_coordinates(lat, lon, zoom)
+    if shape == "square":
+        col, row = np.floor(x / cell_size).astype("int64"), np.floor(y / cell_size).astype("int64")
+    elif shape == "hex":
+        col, row = _hex_cells(x, y, cell_size)
+    else:
+        raise ValueError(f"Unknown cell shape {shape!r}. Use 'square' or 'hex'.")
+
+    keys = (col - col.min()) * (row.max() - row.min() + 1) + (row - row.min()) if len(col) else col
+    cells, index = np.unique(keys, return_inverse=True)
+    total = np.bincount(index, weights=weight, minlength=len(cells))
+    # Points with a zero weight still pull the centroid of their cell.
+    mass = np.where(weight != 0, np.abs(weight), 1e-12)
+    norm = np.bincount(index, weights=mass, minlength=len(cells))
+    cell_lat = np.bincount(index, weights=lat * mass, minlength=len(cells)) / norm
+    cell_lon = np.bincount(index, weights=lon * mass, minlength=len(cells)) / norm
+    return cell_lat, cell_lon, total
+
+
+def heatmap_pyramid(lat, lon, weight, zooms=DEFAULT_HEATMAP_ZOOMS, cell_size=16, shape="square"):
+    """Aggregates points into a grid for each zoom level.
+
+    The levels are built from the most detailed one down, each from the cells
+    of the previous level, so only the first pass touches every point.
+
+    Args:
+        lat (np.ndarray): The latitudes.
+        lon (np.ndarray): The longitudes.
+        weight (np.ndarray): The weights.
+        zooms (tuple, optional): The zoom levels. Defaults to DEFAULT_HEATMAP_ZOOMS (0 to 9).
+        cell_size (int, optional): The width of the cells in screen pixels. Defaults to 16.
+        shape (str, optional): The shape of the cells, "square" or "hex". Defaults to "square".
+
+    Returns:
+        list: (zoom, lat, lon, weight) tuples of the cells in increasing order of zoom.
+    """
+    levels = []
+    for zoom in sorted(zooms, reverse=True):
+        lat, lon, weight = bin_points(lat, lon, weight, zoom, cell_size, shape)
+        levels.append((zoom, lat, lon, weight))
+    return levels[::-1]
+
+
+class ClusterIndex:
+    """A hierarchical index of point clusters for every zoom level, in the spirit of supercluster.
+
+    The points are projected to Web Mercator once. Each zoom level, from
+    max_zoom down to min_zoom, groups the points and clusters of the level
+    above it into cells about radius pixels wide, so building the index is
+    a few NumPy passes over shrinking arrays. The items of each level are
+    sorted by x, so a viewport query is a binary search followed by a filter
+    on y over a thin slab.
+
+    Args:
+        data (pd.DataFrame | gpd.GeoDataFrame | np.ndarray): The points, see point_arrays().
+        latitude (str, optional): The latitude column of a DataFrame. Defaults to "latitude".
+        longitude (str, optional): The longitude column of a DataFrame. Defaults to "longitude".
+        aggregate (dict, optional): The attributes aggregated per cluster, as {column: function} with
+            function one of "sum", "mean", "min" and "max", e.g., {"discharge": "max"}. Defaults to None.
+        columns (list, optional): The columns kept as properties of single points. Defaults to None (all columns).
+        radius (int, optional): The cluster radius in pixels. Defaults to 40.
+        min_zoom (int, optional): The lowest zoom level of the index. Defaults to 0.
+        max_zoom (int, optional): The highest zoom level with clusters. Above it, the points are
+            returned individually. Defaults to 16.
+    """
+
+    FUNCTIONS = ("sum", "mean", "min", "max")
+
+    def __init__(
+        self,
+        data,
+        latitude="latitude",
+        longitude="longitude",
+        aggregate=None,
+        columns=None,
+        radius=40,
+        min_zoom=0,
+        max_zoom=16,
+    ):
+        import pandas as pd
+
+        self.aggregate = dict(aggregate or {})
+        for column, function in self.aggregate.items():
+            if function not in self.FUNCTIONS:
+                raise ValueError(
+                    f"Unknown aggregate function {function!r} for {column!r}. Use one of {self.FUNCTIONS}."
+                )
+        self.radius = radius
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+
+        if isinstance(data, pd.DataFrame):
+            data = data.reset_index(drop=True)
+            lat, lon = point_arrays(data, latitude, longitude)[:2]
+            valid = np.flatnonzero(self._valid(data, latitude, longitude))
+            geometry = getattr(data, "_geometry_column_name", None)
+            if columns is None:
+                columns = [c for c in data.columns if c not in (latitude, longitude, geometry)]
+            self.properties = json.loads(data.iloc[valid][list(columns)].to_json(orient="records"))
+            values = {
+                c: pd.to_numeric(data[c], errors="coerce").to_numpy("float64")[valid]
+                for c in self.aggregate
+            }
+        else:
+            lat, lon, _ = point_arrays(data)
+            self.properties = [{} for _ in range(len(lat))]
+            values = {}
+
+        x, y = pixel_coordinates(lat, lon, 0)
+        level = {
+            "x": x / 256,
+            "y": y / 256,
+            "count": np.ones(len(x)),
+            "point": np.arange(len(x)),
+        }
+        for column, function in self.aggregate.items():
+            if function in ("sum", "mean"):
+                level[column] = np.nan_to_num(values[column], nan=0.0)
+            else:
+                level[column] = values[column]
+            if function == "mean":
+                # Means are divided by the number of values, which excludes missing ones
+                level[("count", column)] = np.isfinite(values[column]).astype("float64")
+
+        self.levels = {max_zoom + 1: self._sorted(level)}
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            level = self._cluster(level, zoom)
+            self.levels[zoom] = self._sorted(level)
+
+    @staticmethod
+    def _valid(data, latitude, longitude):
+        if hasattr(data, "geometry") and latitude not in data.columns:
+            lat, lon = data.geometry.y.to_numpy(), data.geometry.x.to_numpy()
+        else:
+            lat, lon = data[latitude].to_numpy("float64"), data[longitude].to_numpy("float64")
+        return np.isfinite(lat) & np.isfinite(lon)
+
+    @staticmethod
+    def _sorted(level):
+        order = np.argsort(level["x"], kind="stable")
+        return {key: value[order] for key, value in level.items()}
+
+    def _cluster(self, level, zoom):
+        """Groups the items of the level above zoom into cells radius pixels wide."""
+        cell = self.radius / (256 * 2**zoom)
+        cells = int(np.ceil(1 / cell)) + 1
+        col = np.floor(level["x"] / cell).astype("int64")
+        keys = col * cells + np.floor(level["y"] / cell).astype("int64")
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        sizes = np.diff(np.r_[starts, len(keys)])
+
+        def sorted_(name):
+            return level[name][order]
+
+        count = np.add.reduceat(sorted_("count"), starts)
+        clustered = {
+            "x": np.add.reduceat(sorted_("x") * sorted_("count"), starts) / count,
+            "y": np.add.reduceat(sorted_("y") * sorted_("count"), starts) / count,
+            "count": count,
+            # A cell with a single item keeps it, whether it is a point or a cluster.
+            "point": np.where(sizes == 1, sorted_("point")[starts], -1),
+        }
+        for column, function in self.aggregate.items():
+            values = sorted_(column)
+            if function in ("sum", "mean"):
+                clustered[column] = np.add.reduceat(values, starts)
+            else:
+                ufunc = np.fmax if function == "max" else np.fmin
+                clustered[column] = ufunc.reduceat(values, starts)
+            if function == "mean":
+                clustered[("count", column)] = np.add.reduceat(sorted_(("count", column)), starts)
+        return clustered
+
+    def __len__(self):
+        return len(self.properties)
+
+    def clusters(self, bounds=None, zoom=0):
+        """Returns the level and the positions of its items in a viewport.
+
+        Args:
+            bounds (tuple, optional): The viewport as ((south, west), (north, east)). Defaults to None (the whole world).
+            zoom (float, optional): The zoom level of the map. Defaults to 0.
+
+        Returns:
+            tuple: The zoom level of the index used and the positions of its items in the viewport.
+        """
+        zoom = int(min(max(np.floor(zoom), self.min_zoom), self.max_zoom + 1))
+        level = self.levels[zoom]
+        if not bounds:
+            return zoom, np.arange(len(level["x"]))
+        (south, west), (north, east) = bounds
+        (x0, x1), (y0, y1) = pixel_coordinates(np.array([north, south]), np.array([west, east]), 0)
+        x0, x1, y0, y1 = x0 / 256, x1 / 256, y0 / 256, y1 / 256
+        if east - west >= 360:
+            x0, x1 = 0, 1
+        lo, hi = np.searchsorted(level["x"], [x0, x1])
+        return zoom, lo + np.flatnonzero((level["y"][lo:hi] >= y0) & (level["y"][lo:hi] <= y1))
+
+    def query(self, bounds=None, zoom=0):
+        """Returns the clusters and points in a viewport at a zoom level as a GeoJSON FeatureCollection.
+
+        Clusters have the properties cluster (True), point_count, the aggregated attributes,
+        and a style with the radius of their marker. Single points have the properties of their row.
+
+        Args:
+            bounds (tuple, optional): The viewport as ((south, west), (north, east)), like the bounds
+                of an ipyleaflet map. Defaults to None (the whole world).
+            zoom (float, optional): The zoom level of the map. Defaults to 0.
+
+        Returns:
+            dict: The GeoJSON FeatureCollection.
+        """
+        zoom, indices = self.clusters(bounds, zoom)
+        level = self.levels[zoom]
+        count = level["count"][indices]
+        lon = (level["x"][indices] * 360 - 180).tolist()
+        lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * level["y"][indices])))).tolist()
+        points = level["point"][indices].tolist()
+        radius = np.round(5 + 4 * np.log10(count), 1).tolist()
+        aggregates = {}
+        for column, function in self.aggregate.items():
+            values = level[column][indices]
+            if function == "mean":
+                with np.errstate(invalid="ignore"):
+                    values = values / level[("count", column)][indices]
+            aggregates[column] = [None if v != v else v for v in values.tolist()]
+
+        features = []
+        for i, point in enumerate(points):
+            if point >= 0:
+                properties = dict(self.properties[point])
+            else:
+                properties = {"cluster": True, "point_count": int(count[i])}
+                for column, values in aggregates.items():
+                    properties[column] = values[i]
+                properties["style"] = {"radius": radius[i]}
+            features.append(
+                {
+                    "type": "Feature",
+                    "properties": properties,
+                    "geometry": {"type": "Point", "coordinates": [lon[i], lat[i]]},
+                }
+            )
+        return {"type": "FeatureCollection", "features": features}
+
+
+class ClusterSource(TileSource):
+    """Serves the clusters of a ClusterIndex in a viewport as GeoJSON.
+
+    Requests for "{zoom}/{west},{south},{east},{north}.json" below the URL prefix of
+    the source return ClusterIndex.query() for that viewport.
+
+    Args:
+        index (ClusterIndex): The cluster index.
+    """
+
+    content_type = "application/json"
+    extension = "json"
+
+    def __init__(self, index):
+        self.index = index
+
+    def handle(self, path, headers, method="GET"):
+        try:
+            zoom, bbox = path.split("/")
+            west, south, east, north = [float(v) for v in bbox.rsplit(".", 1)[0].split(",")]
+            zoom = float(zoom)
+        except ValueError:
+            return 404, {}, b""
+        data = self.index.query(((south, west), (north, east)), zoom)
+        return 200, {"Content-Type": self.content_type}, json.dumps(data).encode("utf-8")
@@ -0,0 +1,828 @@
+"""The raster module contains functions for preparing raster data for display on the map.
+"""
+import contextlib
+import contextvars
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from .tileserver import TileSource, get_tile_server
+from .utility import DiskCache, LRUCache, cache_dir
+
+# The size of the blocks fetched from remote rasters with range requests.
+RANGE_BLOCK_SIZE = 256 * 1024
+
+_caches = {}
+_caches_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_cache(name, env, default_bytes):
+    with _caches_lock:
+        if name not in _caches:
+            max_bytes = int(os.environ.get(env, default_bytes))
+            _caches[name] = DiskCache(cache_dir(name), max_bytes)
+        return _caches[name]
+
+
+def get_block_cache():
+    """Returns the on-disk cache of the blocks fetched from remote rasters.
+
+    Its size limit in bytes can be set with the WATERGEO_BLOCK_CACHE_BYTES
+    environment variable and defaults to 1 GiB.
+
+    Returns:
+        utility.DiskCache: The cache.
+    """
+    return _get_cache("blocks", "WATERGEO_BLOCK_CACHE_BYTES", 1024**3)
+
+
+def get_download_cache():
+    """Returns the on-disk cache of the rasters downloaded by cached_download().
+
+    Its size limit in bytes can be set with the WATERGEO_DOWNLOAD_CACHE_BYTES
+    environment variable and defaults to 4 GiB.
+
+    Returns:
+        utility.DiskCache: The cache.
+    """
+    return _get_cache("downloads", "WATERGEO_DOWNLOAD_CACHE_BYTES", 4 * 1024**3)
+
+
+def is_url(data):
+    """Returns True if data is an HTTP(S) URL."""
+    return isinstance(data, str) and data.startswith(("http://", "https://"))
+
+
+def _remote_version(response, size=None):
+    """Returns a string that changes whenever the remote file changes."""
+    headers = response.headers
+    return "|".join(
+        [
+            headers.get("ETag", ""),
+            headers.get("Last-Modified", ""),
+            headers.get("Content-Length", "") if size is None else str(size),
+        ]
+    )
+
+
+def _remote_info(session, url, timeout=60):
+    """Returns the size and version of a remote file, and whether its server supports range requests.
+
+    The file is probed with a HEAD request. Servers that refuse HEAD requests,
+    e.g., presigned S3 URLs, are probed with a GET request of its first byte,
+    and the size is read from the Content-Range header.
+
+    Args:
+        session (requests.Session | module): The session, or the requests module.
+        url (str): The URL of the file.
+        timeout (int, optional): The timeout of the requests in seconds. Defaults to 60.
+
+    Returns:
+        tuple: The size in bytes (-1 if unknown), the version (see _remote_version()),
+            and whether the server supports range requests.
+    """
+    response = session.head(url, allow_redirects=True, timeout=timeout)
+    if response.ok:
+        size = int(response.headers.get("Content-Length", -1))
+        supports_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        return size, _remote_version(response), supports_ranges and size > 0
+
+    with session.get(
+        url, headers={"Range": "bytes=0-0"}, stream=True, allow_redirects=True, timeout=timeout
+    ) as response:
+        response.raise_for_status()
+        if response.status_code == 206:
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            size = int(total) if total.isdigit() else -1
+            return size, _remote_version(response, size), size > 0
+        size = int(response.headers.get("Content-Length", -1))
+        return size, _remote_version(response), False
+
+
+class RangeReader:
+    """Reads a remote file with HTTP range requests through the block cache.
+
+    Reads are rounded to blocks of block_size bytes. Missing blocks are fetched
+    with one range request per run of consecutive blocks and stored in the
+    block cache, so only the parts of a file that are read are downloaded, once
+    across calls and sessions. The cache key includes the ETag, Last-Modified
+    and Content-Length of the remote file, so a changed file is fetched again.
+
+    Args:
+        url (str): The URL of the file.
+        block_size (int, optional): The size of the cached blocks in bytes. Defaults to 256 KiB.
+        cache (utility.DiskCache, optional): The block cache. Defaults to get_block_cache().
+        timeout (int, optional): The timeout of the requests in seconds. Defaults to 60.
+        memory_blocks (int, optional): The number of recently read blocks also kept in memory. Defaults to 64.
+    """
+
+    def __init__(
+        self, url, block_size=RANGE_BLOCK_SIZE, cache=None, timeout=60, memory_blocks=64
+    ):
+        import requests
+
+        self.url = url
+        self.block_size = block_size
+        self.cache = cache or get_block_cache()
+        self.memory = LRUCache(maxsize=memory_blocks)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.requests = 0
+
+        self.size, self.version, self.supports_ranges = _remote_info(self.session, url, timeout)
+
+    def _block_key(self, index):
+        return f"{self.url}|{self.version}|{self.block_size}|{index}"
+
+    def _fetch(self, first, last):
+        """Fetches blocks first to last with a single range request and caches them."""
+        start = first * self.block_size
+        end = min((last + 1) * self.block_size, self.size) - 1
+        response = self.session.get(
+            self.url, headers={"Range": f"bytes={start}-{end}"}, timeout=self.timeout
+        )
+        self.requests += 1
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise ValueError(f"{self.url} does not support range requests.")
+        content = response.content
+        if len(content) != end - start + 1:
+            raise ValueError(
+                f"Expected {end - start + 1} bytes of {self.url} from offset {start}, got {len(content)}."
+            )
+        blocks = {}
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            blocks[index] = content[offset : offset + self.block_size]
+            self.cache.set(self._block_key(index), blocks[index])
+            self.memory.set(index, blocks[index])
+        return blocks
+
+    def read(self, start, end):
+        """Returns bytes start to end (inclusive) of the remote file.
+
+        Args:
+            start (int): The offset of the first byte.
+            end (int): The offset of the last byte.
+
+        Returns:
+            bytes: The content.
+        """
+        end = min(end, self.size - 1)
+        if start > end:
+            return b""
+        first, last = start // self.block_size, end // self.block_size
+
+        blocks = {}
+        missing = []
+        for index in range(first, last + 1):
+            block = self.memory.get(index)
+            if block is None:
+                block = self.cache.get(self._block_key(index))
+                if block is not None:
+                    self.memory.set(index, block)
+            if block is None:
+                missing.append(index)
+            else:
+                blocks[index] = block
+
+        # Fetch runs of consecutive missing blocks with one request each
+        run_start = None
+        for i, index in enumerate(missing):
+            if run_start is None:
+                run_start = index
+            if i + 1 == len(missing) or missing[i + 1] != index + 1:
+                blocks.update(self._fetch(run_start, index))
+                run_start = None
+
+        content = b"".join(blocks[index] for index in range(first, last + 1))
+        offset = first * self.block_size
+        return content[start - offset : end - offset + 1]
+
+
+class _RangeFile(io.RawIOBase):
+    """A read-only file object over a RangeReader."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.reader.size + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        content = self.reader.read(self.position, self.position + len(buffer) - 1)
+        buffer[: len(content)] = content
+        self.position += len(content)
+        return len(content)
+
+
+def _range_opener(reader):
+    """Returns a rasterio opener that serves the URL of reader through it."""
+    from rasterio.abc import FileContainer
+
+    class RangeOpener(FileContainer):
+        def open(self, path, mode="r", **kwargs):
+            return _RangeFile(reader)
+
+        def isfile(self, path):
+            return path == reader.url
+
+        def isdir(self, path):
+            return False
+
+        def ls(self, path):
+            return []
+
+        def mtime(self, path):
+            return 0
+
+        def size(self, path):
+            return reader.size
+
+        def rm(self, path):
+            raise OSError("Read-only file system.")
+
+    return RangeOpener()
+
+
+def open_remote(url, **kwargs):
+    """Opens a remote raster with rasterio, reading it with range requests through the block cache.
+
+    Only the header and the blocks of a Cloud-Optimized GeoTIFF that are read
+    are downloaded. Requires rasterio 1.4 or later.
+
+    Args:
+        url (str): The URL of the raster.
+        **kwargs: Keyword arguments passed to RangeReader.
+
+    Returns:
+        rasterio.io.DatasetReader: The open dataset, or None if the server does not support range requests.
+    """
+    import rasterio
+
+    reader = RangeReader(url, **kwargs)
+    if not reader.supports_ranges:
+        return None
+    dataset = rasterio.open(url, opener=_range_opener(reader))
+    dataset.range_reader = reader
+    return dataset
+
+
+def cached_download(url, chunk_size=1024 * 1024, timeout=60, verbose=False):
+    """Downloads a remote file into the download cache and returns its local path.
+
+    The file is only downloaded again if its ETag, Last-Modified or
+    Content-Length headers change. Nothing is left behind in the temporary directory.
+
+    Args:
+        url (str): The URL of the file.
+        chunk_size (int, optional): The size of the chunks written to disk in bytes. Defaults to 1 MiB.
+        timeout (int, optional): The timeout of the requests in seconds. Defaults to 60.
+        verbose (bool, optional): Whether to print the progress. Defaults to False.
+
+    Returns:
+        str: The path of the cached file.
+    """
+    import requests
+
+    cache = get_download_cache()
+    key = f"{url}|{_remote_info(requests, url, timeout)[1]}"
+    path = cache.get_path(key)
+    if path is not None:
+        return path
+
+    def write(file):
+        if verbose:
+            print(f"Downloading {url} ...")
+        with requests.get(url, stream=True, timeout=timeout) as r:
+            r.raise_for_status()
+            with open(file, "wb") as f:
+                for chunk in r.iter_content(chunk_size):
+                    f.write(chunk)
+
+    return cache.put_file(key, write)
+
+
+def raster_source(data, stream=True):
+    """Returns what the tile renderer should open for a raster.
+
+    Local paths are returned unchanged. Remote rasters are opened with
+    open_remote() when their server supports range requests, and downloaded
+    with cached_download() otherwise.
+
+    Args:
+        data (str): The path or URL of the raster.
+        stream (bool, optional): Whether to stream remote rasters with range requests. Defaults to True.
+
+    Returns:
+        str | rasterio.io.DatasetReader: The path of the raster or an open dataset.
+    """
+    if not is_url(data):
+        return data
+    if stream:
+        try:
+            dataset = open_remote(data)
+        except ImportError:
+            dataset = None
+        if dataset is not None:
+            return dataset
+    return cached_download(data)
+
+
+# The file size in bytes above which add_raster() builds overviews for rasters without them.
+OVERVIEW_THRESHOLD = 64 * 1024**2
+
+
+def get_overview_cache():
+    """Returns the on-disk cache of the tiled copies with overviews built by build_overviews().
+
+    Its size limit in bytes can be set with the WATERGEO_OVERVIEW_CACHE_BYTES
+    environment variable and defaults to 8 GiB.
+
+    Returns:
+        utility.DiskCache: The cache.
+    """
+    with _caches_lock:
+        if "overviews" not in _caches:
+            max_bytes = int(os.environ.get("WATERGEO_OVERVIEW_CACHE_BYTES", 8 * 1024**3))
+            _caches["overviews"] = DiskCache(cache_dir("overviews"), max_bytes, ".tif")
+        return _caches["overviews"]
+
+
+def overview_factors(width, height, tile_size=256):
+    """Returns the decimation factors of the overviews needed to display a raster at every zoom level.
+
+    Factors are powers of two, up to the first one at which the raster fits in one tile.
+
+    Args:
+        width (int): The width of the raster in pixels.
+        height (int): The height of the raster in pixels.
+        tile_size (int, optional): The size of the tiles in pixels. Defaults to 256.
+
+    Returns:
+        list: The factors, e.g., [2, 4, 8].
+    """
+    factors = []
+    factor = 2
+    while max(width, height) / (factor / 2) > tile_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def _remove_stale_overviews(path):
+    ovr = path + ".ovr"
+    if os.path.exists(ovr) and os.path.getmtime(ovr) < os.path.getmtime(path):
+        try:
+            os.remove(ovr)
+        except OSError:
+            pass
+
+
+def build_overviews(
+    path, resampling="average", location="auto", num_threads="ALL_CPUS", verbose=False
+):
+    """Builds reduced-resolution overviews of a local raster so that low-zoom tiles are fast to render.
+
+    Without overviews, every low-zoom tile resamples the full-resolution data.
+    The overviews are written to an external .ovr file next to the raster,
+    which GDAL picks up automatically, leaving the raster itself untouched. If
+    the directory is not writable, a tiled copy of the raster with internal
+    overviews is written to the overview cache instead (get_overview_cache()),
+    keyed by the path, size and modification time of the raster. The levels
+    are resampled by GDAL with num_threads threads working on blocks in parallel.
+
+    Args:
+        path (str): The path of the raster.
+        resampling (str, optional): The resampling method, e.g., "average", "nearest", "mode". Defaults to "average".
+        location (str, optional): "external" for an .ovr file next to the raster, "cache" for a tiled
+            copy in the overview cache, or "auto" to try "external" first. Defaults to "auto".
+        num_threads (int | str, optional): The number of threads resampling blocks (GDAL_NUM_THREADS). Defaults to "ALL_CPUS".
+        verbose (bool, optional): Whether to print a message when overviews are built. Defaults to False.
+
+    Returns:
+        str: The path to open to use the overviews: the raster itself or its cached copy.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+
+    if location not in ("auto", "external", "cache"):
+        raise ValueError("location must be 'auto', 'external' or 'cache'.")
+    resampling = Resampling[resampling]
+    _remove_stale_overviews(path)
+    with rasterio.open(path) as src:
+        if src.overviews(1):
+            return path
+        factors = overview_factors(src.width, src.height)
+    if not factors:
+        return path
+
+    env = {"GDAL_NUM_THREADS": str(num_threads), "COMPRESS_OVERVIEW": "DEFLATE"}
+    if location in ("auto", "external"):
+        try:
+            if verbose:
+                print(f"Building overviews of {path} ...")
+            with rasterio.Env(TIFF_USE_OVR=True, **env):
+                with rasterio.open(path, "r+") as dst:
+                    dst.build_overviews(factors, resampling)
+            return path
+        except (OSError, rasterio.errors.RasterioIOError):
+            if location == "external":
+                raise
+
+    cache = get_overview_cache()
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{resampling.name}"
+    cached = cache.get_path(key)
+    if cached is not None:
+        return cached
+
+    def write(file):
+        from rasterio.shutil import copy
+
+        if verbose:
+            print(f"Building a tiled copy of {path} with overviews ...")
+        with rasterio.Env(**env):
+            copy(
+                path,
+                file,
+                driver="GTiff",
+                tiled=True,
+                blockxsize=512,
+                blockysize=512,
+                compress="deflate",
+                BIGTIFF="IF_SAFER",
+                NUM_THREADS=str(num_threads),
+            )
+            with rasterio.open(file, "r+") as dst:
+                dst.build_overviews(factors, resampling)
+
+    return cache.put_file(key, write)
+
+
+def ensure_overviews(path, threshold=None, **kwargs):
+    """Builds overviews of a local raster without overviews if it is larger than a threshold.
+
+    Args:
+        path (str): The path of the raster.
+        threshold (int, optional): The file size in bytes above which overviews are built.
+            Defaults to the WATERGEO_OVERVIEW_THRESHOLD_BYTES environment variable or 64 MiB.
+        **kwargs: Keyword arguments passed to build_overviews().
+
+    Returns:
+        str: The path to open to use the overviews.
+    """
+    if threshold is None:
+        threshold = int(os.environ.get("WATERGEO_OVERVIEW_THRESHOLD_BYTES", OVERVIEW_THRESHOLD))
+    if os.path.getsize(path) < threshold:
+        return path
+    return build_overviews(path, **kwargs)
+
+
+# The keyword arguments of localtileserver's tile() that define the style of a raster.
+STYLE_KEYS = ("indexes", "colormap", "vmin", "vmax", "nodata", "expression", "stretch")
+
+
+def split_style(kwargs):
+    """Splits keyword arguments into the style of a raster and the options of its tile layer.
+
+    Args:
+        kwargs (dict): The keyword arguments.
+
+    Returns:
+        tuple: The style and the layer options.
+    """
+    style = {key: value for key, value in kwargs.items() if key in STYLE_KEYS}
+    options = {key: value for key, value in kwargs.items() if key not in STYLE_KEYS}
+    return style, options
+
+
+def style_key(style):
+    """Returns a string that identifies the style of a raster."""
+    return json.dumps(style, sort_keys=True, default=str)
+
+
+class RasterReader:
+    """Renders PNG tiles of a raster with localtileserver, one tile at a time.
+
+    Args:
+        data (str | rasterio.io.DatasetReader): The path of the raster, or a dataset returned by open_remote().
+        key (str, optional): The identity of the raster in the tile cache. Defaults to None (the path or URL).
+    """
+
+    def __init__(self, data, key=None):
+        try:
+            from localtileserver.client import TilerInterface
+        except ImportError:
+            raise ImportError("Please install the localtileserver package.")
+
+        if isinstance(data, str):
+            self.tiler = TilerInterface(data)
+        else:
+            from rio_tiler.io import Reader
+
+            self.tiler = TilerInterface(Reader(data.name, dataset=data))
+        self.key = key or self.tiler.filename
+        self._lock = threading.Lock()
+        self._memoize_statistics()
+        # rasterio registers the openers of remote datasets in a context
+        # variable, so tiles are rendered in the context the dataset was opened in
+        self._context = contextvars.copy_context()
+
+    def _memoize_statistics(self):
+        """Computes the statistics of the raster once instead of for every tile.
+
+        localtileserver rescales non-byte tiles with the statistics of the
+        whole raster, which it recomputes from a decimated read for every tile.
+        """
+        reader = self.tiler.reader
+        statistics = reader.statistics
+        results = {}
+
+        def memoized(*args, **kwargs):
+            key = json.dumps([args, kwargs], sort_keys=True, default=str)
+            if key not in results:
+                results[key] = statistics(*args, **kwargs)
+            return results[key]
+
+        try:
+            reader.statistics = memoized
+        except (AttributeError, TypeError):
+            pass
+
+    def _run(self, func, *args, **kwargs):
+        # Datasets must not be read by several threads at once
+        with self._lock:
+            return self._context.run(func, *args, **kwargs)
+
+    def render(self, z, x, y, **style):
+        """Returns the PNG tile, or None if the tile is outside the raster."""
+        from rio_tiler.errors import TileOutsideBounds
+
+        try:
+            return bytes(self._run(self.tiler.tile, z, x, y, **style))
+        except TileOutsideBounds:
+            return None
+
+    def center(self):
+        """Returns the center of the raster as (lat, lon)."""
+        return self._run(self.tiler.center)
+
+    def bounds(self):
+        """Returns the bounds of the raster as [[south, west], [north, east]]."""
+        south, north, west, east = self._run(self.tiler.bounds)
+        return [[south, west], [north, east]]
+
+    @property
+    def default_zoom(self):
+        """The zoom level at which the whole raster is displayed."""
+        return self._run(lambda: self.tiler.default_zoom)
+
+
+class RasterTileSource(TileSource):
+    """Serves the tiles of a raster in one style, through the rendered-tile cache of a pool.
+
+    Args:
+        reader (RasterReader): The raster.
+        style (dict, optional): The style of the tiles, e.g., colormap, vmin, vmax, indexes, nodata. Defaults to None.
+        pool (RasterPool, optional): The pool whose cache and statistics are used. Defaults to None (a new pool).
+        key (str, optional): The key of the source in the pool and on the tile server. Defaults to None.
+    """
+
+    def __init__(self, reader, style=None, pool=None, key=None):
+        self.reader = reader
+        self.style = style or {}
+        self.pool = pool or RasterPool()
+        self.key = key
+        self._style_key = style_key(self.style)
+
+    def tile(self, z, x, y):
+        key = (self.reader.key, z, x, y, self._style_key)
+        return self.pool.tile_cache.get_or_set(
+            key, lambda: self.pool._timed_render(self.reader, z, x, y, self.style)
+        )
+
+    def center(self):
+        """Returns the center of the raster as (lat, lon)."""
+        return self.reader.center()
+
+    def bounds(self):
+        """Returns the bounds of the raster as [[south, west], [north, east]]."""
+        return self.reader.bounds()
+
+    @property
+    def default_zoom(self):
+        """The zoom level at which the whole raster is displayed."""
+        return self.reader.default_zoom
+
+    def close(self):
+        """Removes the source from its pool, called when it is unregistered from the tile server."""
+        self.pool.release(self)
+
+
+class RasterPool:
+    """Serves many rasters from the shared tile server with one cache of rendered tiles.
+
+    Each raster is opened once per process, and each combination of raster and
+    style is registered with the tile server once, so maps that display the
+    same raster share the open dataset, the tile URL and the cached tiles.
+    A source is released when the last layer that displays it goes away (see
+    tileserver.TileServer.attach()), and a raster is closed with its last source.
+    Local rasters are identified by their path, size and modification time,
+    so a changed file is opened again. Rasters are opened, downloaded and
+    given overviews outside the lock of the pool, so a slow raster does not
+    block the other maps.
+
+    Args:
+        cache_size (int, optional): The maximum number of rendered tiles kept in memory.
+            Defaults to the WATERGEO_TILE_CACHE_SIZE environment variable or 4096.
+        latency_window (int, optional): The number of recent render times kept for the statistics. Defaults to 1000.
+    """
+
+    def __init__(self, cache_size=None, latency_window=1000):
+        if cache_size is None:
+            cache_size = int(os.environ.get("WATERGEO_TILE_CACHE_SIZE", 4096))
+        self.tile_cache = LRUCache(maxsize=cache_size)
+        self.readers = {}
+        self.sources = {}
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._opening = {}
+        self._released = deque()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds the lock of the pool, first removing the sources released in the meantime."""
+        with self._lock:
+            self._remove_released()
+            yield
+
+    def _remove_released(self):
+        while self._released:
+            source = self._released.popleft()
+            if self.sources.get(source.key) is not source:
+                continue
+            del self.sources[source.key]
+            reader = source.reader
+            if not any(s.reader is reader for s in list(self.sources.values())):
+                self.readers.pop(reader.key, None)
+
+    def _timed_render(self, reader, z, x, y, style):
+        start = time.perf_counter()
+        content = reader.render(z, x, y, **style)
+        self._latencies.append(time.perf_counter() - start)
+        return content
+
+    def reader(self, data, stream=True, overviews="auto"):
+        """Returns the shared RasterReader of a raster, opening it on first use.
+
+        Args:
+            data (str): The path or URL of the raster.
+            stream (bool, optional): Whether to stream remote rasters with range requests. Defaults to True.
+            overviews (bool | str, optional): Whether to build overviews of local rasters without them
+                with build_overviews(). "auto" builds them for files larger than the threshold of
+                ensure_overviews(). Defaults to "auto".
+
+        Returns:
+            RasterReader: The reader.
+        """
+        if is_url(data):
+            key = f"{data}|{stream}"
+        else:
+            path = os.path.abspath(data)
+            stat = os.stat(path)
+            key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+        with self._locked():
+            if key in self.readers:
+                return self.readers[key]
+            future = self._opening.get(key)
+            opening = future is None
+            if opening:
+                future = self._opening[key] = Future()
+        if not opening:
+            # Another thread is opening the raster
+            return future.result()
+
+        try:
+            source = raster_source(data, stream=stream)
+            if isinstance(source, str) and overviews == "auto":
+                source = ensure_overviews(source, verbose=True)
+            elif isinstance(source, str) and overviews:
+                source = build_overviews(source, verbose=True)
+            reader = RasterReader(source, key)
+        except BaseException as e:
+            with self._locked():
+                del self._opening[key]
+            future.set_exception(e)
+            raise
+        with self._locked():
+            self.readers[key] = reader
+            del self._opening[key]
+        future.set_result(reader)
+        return reader
+
+    def source(self, data, stream=True, overviews="auto", **style):
+        """Returns the tile source of a raster in a style and its tile URL.
+
+        Args:
+            data (str): The path or URL of the raster.
+            stream (bool, optional): Whether to stream remote rasters with range requests. Defaults to True.
+            overviews (bool | str, optional): Whether to build overviews of local rasters, see reader(). Defaults to "auto".
+            **style: The style of the tiles, e.g., colormap, vmin, vmax, indexes, nodata.
+
+        Returns:
+            tuple: The RasterTileSource and the XYZ URL template of its tiles.
+        """
+        reader = self.reader(data, stream=stream, overviews=overviews)
+        server = get_tile_server()
+        key = hashlib.sha1(f"{reader.key}|{style_key(style)}".encode("utf-8")).hexdigest()
+        with self._locked():
+            if key not in self.sources:
+                self.sources[key] = RasterTileSource(reader, style, self, key)
+                server.register(self.sources[key], key)
+            source = self.sources[key]
+        return source, server.tile_url(key)
+
+    def release(self, source):
+        """Removes a tile source from the pool, and its raster if no other source uses it.
+
+        Sources are released by the finalizers of their layers, which may run in
+        a thread that holds the lock, so the source is queued and removed when
+        the lock is next available.
+
+        Args:
+            source (RasterTileSource): The tile source.
+        """
+        self._released.append(source)
+        if self._lock.acquire(blocking=False):
+            try:
+                self._remove_released()
+            finally:
+                self._lock.release()
+
+    def stats(self):
+        """Returns the cache and latency statistics of the pool.
+
+        Returns:
+            dict: The number of open rasters and registered layers, the statistics of the
+                rendered-tile cache, and the count, mean, median, 95th percentile and maximum
+                of the recent render times in milliseconds.
+        """
+        latencies = sorted(self._latencies)
+        render = {"count": len(latencies)}
+        if latencies:
+            render.update(
+                mean_ms=1000 * sum(latencies) / len(latencies),
+                p50_ms=1000 * latencies[len(latencies) // 2],
+                p95_ms=1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                max_ms=1000 * latencies[-1],
+            )
+        with self._locked():
+            rasters, layers = len(self.readers), len(self.sources)
+        return {
+            "rasters": rasters,
+            "layers": layers,
+            "tiles": self.tile_cache.info(),
+            "render": render,
+        }
+
+    def clear(self):
+        """Empties the rendered-tile cache and resets the statistics."""
+        self.tile_cache.clear()
+        self._latencies.clear()
+
+
+def get_raster_pool():
+    """Returns the raster pool shared by the process.
+
+    Returns:
+        RasterPool: The shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RasterPool()
+        return _pool
@@ -0,0 +1,243 @@
+"""The tileproxy module serves remote XYZ tiles, e.g., basemaps and Earth Engine layers, through a local caching proxy.
+
+The layers of a map point at the tile server of the current process (see
+tileserver.get_tile_server()), which fetches each tile from the remote server
+once and keeps it in memory and in an on-disk cache shared by all sessions.
+The memory cache and the HTTP session are shared by all proxied URLs, so the
+Earth Engine layers, whose tile URLs change with every map ID, do not each
+hold their own.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .tileserver import TileSource, get_tile_server
+from .utility import DiskCache, LRUCache, cache_dir
+
+_disk_cache = None
+_cache_lock = threading.Lock()
+_memory_cache = None
+_session = None
+_sources = {}
+_sources_lock = threading.Lock()
+
+# The content types of tiles recognized by their first bytes.
+_SIGNATURES = (
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8", "image/jpeg"),
+    (b"RIFF", "image/webp"),
+    (b"GIF8", "image/gif"),
+)
+
+
+def get_tile_cache():
+    """Returns the on-disk cache of the tiles fetched through the proxy.
+
+    The cache is stored in the "tiles" directory of utility.cache_dir(). Its
+    size limit in bytes can be set with the WATERGEO_TILE_PROXY_CACHE_BYTES
+    environment variable and defaults to 2 GiB.
+
+    Returns:
+        utility.DiskCache: The cache.
+    """
+    global _disk_cache
+    with _cache_lock:
+        if _disk_cache is None:
+            max_bytes = int(os.environ.get("WATERGEO_TILE_PROXY_CACHE_BYTES", 2 * 1024**3))
+            _disk_cache = DiskCache(cache_dir("tiles"), max_bytes)
+        return _disk_cache
+
+
+def get_memory_cache():
+    """Returns the in-memory cache of the tiles fetched through the proxy, shared by all proxy sources.
+
+    Its size in tiles can be set with the WATERGEO_TILE_PROXY_CACHE_SIZE
+    environment variable and defaults to 4096.
+
+    Returns:
+        utility.LRUCache: The cache.
+    """
+    global _memory_cache
+    with _cache_lock:
+        if _memory_cache is None:
+            maxsize = int(os.environ.get("WATERGEO_TILE_PROXY_CACHE_SIZE", 4096))
+            _memory_cache = LRUCache(maxsize=maxsize)
+        return _memory_cache
+
+
+def _get_session():
+    global _session
+    with _cache_lock:
+        if _session is None:
+            import requests
+
+            _session = requests.Session()
+        return _session
+
+
+def content_type(content):
+    """Returns the content type of an image tile from its first bytes.
+
+    Args:
+        content (bytes): The tile content.
+
+    Returns:
+        str: The content type, "application/octet-stream" if unknown.
+    """
+    for signature, name in _SIGNATURES:
+        if content.startswith(signature):
+            return name
+    return "application/octet-stream"
+
+
+def tile_range(bounds, zoom):
+    """Returns the range of the tiles that cover a bounding box at a zoom level.
+
+    Args:
+        bounds (list): The bounding box as [[south, west], [north, east]].
+        zoom (int): The zoom level.
+
+    Returns:
+        tuple: The first and last tile columns and rows, (x0, x1, y0, y1).
+    """
+    (south, west), (north, east) = bounds
+    n = 2**zoom
+
+    def column(lon):
+        return min(n - 1, max(0, int((lon + 180) / 360 * n)))
+
+    def row(lat):
+        lat = math.radians(max(-85.0511, min(85.0511, lat)))
+        y = (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n
+        return min(n - 1, max(0, int(y)))
+
+    return column(west), column(east), row(north), row(south)
+
+
+class ProxyTileSource(TileSource):
+    """Serves the tiles of a remote XYZ URL template from a memory and disk cache.
+
+    Args:
+        url (str): The URL template, e.g., "https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png".
+            The {s} subdomain and the {r} retina suffix of Leaflet templates are supported.
+        subdomains (str, optional): The subdomains substituted for {s}. Defaults to "abc".
+        memory (utility.LRUCache, optional): The in-memory cache. Defaults to get_memory_cache().
+        disk_cache (utility.DiskCache, optional): The on-disk cache. Defaults to get_tile_cache().
+        timeout (int, optional): The timeout of the requests in seconds. Defaults to 30.
+    """
+
+    def __init__(self, url, subdomains="abc", memory=None, disk_cache=None, timeout=30):
+        self.url = url
+        self.subdomains = subdomains
+        self.memory = memory if memory is not None else get_memory_cache()
+        self.disk_cache = disk_cache or get_tile_cache()
+        self.timeout = timeout
+        self.session = _get_session()
+        self.key = None
+        self.requests = 0
+        self._lock = threading.Lock()
+        name = url.split("?")[0].rsplit("/", 1)[-1]
+        extension = name.rsplit(".", 1)[-1] if "." in name else ""
+        self.extension = extension if extension.isalpha() else "png"
+
+    def tile_url(self, z, x, y):
+        """Returns the remote URL of a tile."""
+        url = self.url.replace("{r}", "")
+        if "{s}" in url:
+            url = url.replace("{s}", self.subdomains[(x + y) % len(self.subdomains)])
+        return url.replace("{z}", str(z)).replace("{x}", str(x)).replace("{y}", str(y))
+
+    def _key(self, z, x, y):
+        # The subdomains serve the same tiles, so they share cache entries.
+        return f"{self.url}|{z}|{x}|{y}"
+
+    def _fetch(self, z, x, y):
+        key = self._key(z, x, y)
+        content = self.disk_cache.get(key)
+        if content is not None:
+            return content
+        response = self.session.get(self.tile_url(z, x, y), timeout=self.timeout)
+        with self._lock:
+            self.requests += 1
+        if response.status_code in (204, 404):
+            return b""
+        response.raise_for_status()
+        content = response.content
+        self.disk_cache.set(key, content)
+        return content
+
+    def tile(self, z, x, y):
+        content = self.memory.get_or_set(self._key(z, x, y), lambda: self._fetch(z, x, y))
+        return content or None
+
+    def close(self):
+        """Removes the source from the sources of proxy_tiles(), called when it is unregistered from the tile server."""
+        with _sources_lock:
+            if _sources.get(self.key) is self:
+                del _sources[self.key]
+
+    def handle(self, path, headers, method="GET"):
+        status, headers, body = super().handle(path, headers, method)
+        if status == 200:
+            headers["Content-Type"] = content_type(body)
+            headers["Cache-Control"] = "max-age=86400"
+        return status, headers, body
+
+    def seed(self, bounds, zooms, max_workers=8, verbose=False):
+        """Fetches the tiles of a bounding box into the cache ahead of time.
+
+        Args:
+            bounds (list): The bounding box as [[south, west], [north, east]].
+            zooms (list | range): The zoom levels to fetch, e.g., range(0, 12).
+            max_workers (int, optional): The maximum number of concurrent requests. Defaults to 8.
+            verbose (bool, optional): Whether to print the progress. Defaults to False.
+
+        Returns:
+            int: The number of tiles in the cache for the bounding box and zoom levels.
+        """
+        tiles = []
+        for z in zooms:
+            x0, x1, y0, y1 = tile_range(bounds, z)
+            tiles.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+        if verbose:
+            print(f"Seeding {len(tiles)} tiles of {self.url}...")
+
+        def fetch(tile):
+            return bool(self._fetch(*tile))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            count = sum(executor.map(fetch, tiles))
+        if verbose:
+            print(f"Seeded {count} tiles with {self.requests} requests.")
+        return count
+
+
+def proxy_tiles(url, **kwargs):
+    """Returns the proxy source of a remote URL template and its local tile URL.
+
+    The sources are shared by all maps in the process, so a basemap added to
+    several maps is fetched once. Attach the layers that display a source to
+    it with tileserver.TileServer.attach(), so that it is unregistered when
+    they go away; otherwise it stays registered for the life of the process.
+
+    Args:
+        url (str): The remote URL template.
+        **kwargs: Keyword arguments passed to ProxyTileSource. A URL proxied with other
+            arguments gets a source of its own.
+
+    Returns:
+        tuple: The ProxyTileSource and the XYZ URL template of the proxied tiles.
+    """
+    server = get_tile_server()
+    identity = json.dumps([url, kwargs], sort_keys=True, default=repr)
+    key = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+    with _sources_lock:
+        if key not in _sources:
+            _sources[key] = ProxyTileSource(url, **kwargs)
+            _sources[key].key = key
+            server.register(_sources[key], key)
+        source = _sources[key]
+    return source, server.tile_url(key)
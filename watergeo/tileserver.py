@@ -0,0 +1,262 @@
+"""The tileserver module runs a local, in-process HTTP server that serves tiles and files generated by watergeo.
+
+A single server is shared by all maps in the process. Data sources are
+registered with the server and served under their own URL prefix, and are
+unregistered when the map layers attached to them go away.
+"""
+import contextlib
+import os
+import threading
+import uuid
+import weakref
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+_server_lock = threading.Lock()
+_server = None
+
+
+class TileSource:
+    """The base class of the data sources served by TileServer.
+
+    Subclasses implement tile() to serve {z}/{x}/{y} tiles, or override handle()
+    to serve arbitrary paths.
+    """
+
+    content_type = "image/png"
+    extension = "png"
+
+    def tile(self, z, x, y):
+        """Returns the content of a tile, or None if the tile is empty.
+
+        Args:
+            z (int): The zoom level.
+            x (int): The tile column.
+            y (int): The tile row.
+
+        Returns:
+            bytes: The tile content.
+        """
+        raise NotImplementedError
+
+    def handle(self, path, headers, method="GET"):
+        """Handles a request for a path below the source's URL prefix.
+
+        Args:
+            path (str): The request path relative to the source, e.g., "3/4/2.png".
+            headers (dict): The request headers.
+            method (str, optional): The request method, "GET" or "HEAD". The body of HEAD responses
+                is not sent, and their Content-Length header may be set explicitly. Defaults to "GET".
+
+        Returns:
+            tuple: The HTTP status, a dictionary of response headers, and the body.
+        """
+        try:
+            z, x, y = path.split("/")
+            z, x, y = int(z), int(x), int(y.split(".")[0])
+        except ValueError:
+            return 404, {}, b""
+        content = self.tile(z, x, y)
+        if content is None:
+            return 204, {}, b""
+        return 200, {"Content-Type": self.content_type}, content
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        path = urlsplit(self.path).path.lstrip("/")
+        key, _, rest = path.partition("/")
+        source = self.server.sources.get(key)
+        if source is None:
+            status, headers, body = 404, {}, b""
+        else:
+            try:
+                status, headers, body = source.handle(rest, dict(self.headers), self.command)
+            except Exception as e:
+                status, headers, body = 500, {"Content-Type": "text/plain"}, str(e).encode()
+
+        self.send_response(status)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if "Content-Length" not in headers:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer:
+    """A threaded HTTP server running in a background thread of the current process.
+
+    Args:
+        host (str, optional): The host to bind to. Defaults to "127.0.0.1".
+        port (int, optional): The port to bind to. Defaults to 0 (any free port).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.sources = {}
+        self._layers = {}
+        self._finalizers = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._released = deque()
+        self.host, self.port = self._httpd.server_address[:2]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        """The base URL of the server as seen by the browser.
+
+        Set the WATERGEO_TILESERVER_PREFIX environment variable, e.g., to
+        "/proxy/{port}" when using jupyter-server-proxy, to serve tiles through a proxy.
+        """
+        prefix = os.environ.get("WATERGEO_TILESERVER_PREFIX")
+        if prefix:
+            return prefix.format(port=self.port).rstrip("/")
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def sources(self):
+        """The registered sources keyed by their URL prefix."""
+        return self._httpd.sources
+
+    def register(self, source, key=None, layer=None):
+        """Registers a data source and returns its key.
+
+        Args:
+            source (TileSource): The data source.
+            key (str, optional): The URL prefix of the source. Defaults to None (a random key).
+            layer (object, optional): The map layer that displays the source, see attach(). Defaults to None
+                (the source stays registered until unregister() is called).
+
+        Returns:
+            str: The key of the source.
+        """
+        key = key or uuid.uuid4().hex
+        with self._locked():
+            if self._httpd.sources.get(key) is not source:
+                self._layers.pop(key, None)
+            self._httpd.sources[key] = source
+        if layer is not None:
+            self.attach(layer, key)
+        return key
+
+    def attach(self, layer, key):
+        """Ties a registered source to a map layer that displays it.
+
+        The source is unregistered once every layer attached to it has been
+        garbage collected or detached with detach().
+
+        Args:
+            layer (object): The map layer, e.g., a folium or ipyleaflet layer.
+            key (str): The key of the source.
+        """
+        with self._locked():
+            source = self._httpd.sources[key]
+            self._layers[key] = self._layers.get(key, 0) + 1
+            finalizer = weakref.finalize(layer, self._release, key, source)
+            finalizer.atexit = False
+            self._finalizers.setdefault(layer, []).append(finalizer)
+
+    def detach(self, layer):
+        """Releases the sources attached to a layer, e.g., when it is removed from a map.
+
+        Args:
+            layer (object): The map layer.
+        """
+        with self._locked():
+            finalizers = self._finalizers.pop(layer, [])
+        for finalizer in finalizers:
+            finalizer()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds the lock of the server, first releasing the sources of the layers released in the meantime."""
+        closed = []
+        try:
+            with self._lock:
+                closed = self._remove_released()
+                yield
+        finally:
+            for source in closed:
+                source.close()
+
+    def _release(self, key, source):
+        # Called by the finalizers of layers, which may run in a thread that
+        # holds the lock, so the release is queued and done when the lock is
+        # next available.
+        self._released.append((key, source))
+        if self._lock.acquire(blocking=False):
+            try:
+                closed = self._remove_released()
+            finally:
+                self._lock.release()
+            for source in closed:
+                source.close()
+
+    def _remove_released(self):
+        closed = []
+        while self._released:
+            key, source = self._released.popleft()
+            if self._httpd.sources.get(key) is not source:
+                # The source was unregistered, or replaced under the same key
+                continue
+            count = self._layers.get(key, 0) - 1
+            if count > 0:
+                self._layers[key] = count
+                continue
+            self._layers.pop(key, None)
+            del self._httpd.sources[key]
+            if hasattr(source, "close"):
+                closed.append(source)
+        return closed
+
+    def unregister(self, key):
+        """Removes a data source from the server, and closes it if it has a close() method."""
+        with self._locked():
+            source = self._httpd.sources.pop(key, None)
+            self._layers.pop(key, None)
+        if hasattr(source, "close"):
+            source.close()
+
+    def source_url(self, key):
+        """Returns the base URL of a registered source."""
+        return f"{self.url}/{key}"
+
+    def tile_url(self, key, extension=None):
+        """Returns the XYZ URL template of a registered source."""
+        extension = extension or self.sources[key].extension
+        return f"{self.url}/{key}/{{z}}/{{x}}/{{y}}.{extension}"
+
+    def shutdown(self):
+        """Stops the server."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def get_tile_server():
+    """Returns the tile server shared by the process, starting it on first use.
+
+    Returns:
+        TileServer: The shared tile server.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = TileServer()
+        return _server
@@ -1,5 +1,303 @@
 """This is the utility module that contains utility functions for the watergeo package.
 """
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A thread-safe, bounded cache with least-recently-used eviction and an optional time-to-live.
+
+    Args:
+        maxsize (int, optional): The maximum number of entries. Defaults to 128.
+        ttl (float, optional): The number of seconds an entry stays valid. Defaults to None (no expiry).
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data and not self._expired(key)
+
+    def _expired(self, key):
+        expires = self._data[key][1]
+        return expires is not None and expires <= time.monotonic()
+
+    def get(self, key, default=None):
+        """Returns the value for key and marks it as recently used.
+
+        Args:
+            key (hashable): The cache key.
+            default (object, optional): The value to return on a miss. Defaults to None.
+
+        Returns:
+            object: The cached value or default.
+        """
+        with self._lock:
+            if key in self._data and not self._expired(key):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self._data.pop(key, None)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Adds or replaces an entry, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (hashable): The cache key.
+            value (object): The value to cache.
+            ttl (float, optional): Overrides the default time-to-live for this entry. Defaults to None.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, func):
+        """Returns the cached value for key, computing it with func() on a miss.
+
+        func() is called outside the lock, so slow computations do not block
+        other threads. Two threads missing the same key may both compute it.
+
+        Args:
+            key (hashable): The cache key.
+            func (callable): A function without arguments that returns the value.
+
+        Returns:
+            object: The cached or newly computed value.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        """Removes an entry and returns its value."""
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        """Removes all entries and resets the hit and miss counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Returns the cache statistics.
+
+        Returns:
+            dict: The number of hits, misses, current size, and maximum size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+def cache_dir(*parts):
+    """Returns a directory of the watergeo cache, creating it if needed.
+
+    The cache lives in the directory set by the WATERGEO_CACHE_DIR environment
+    variable, or in ~/.cache/watergeo.
+
+    Args:
+        *parts (str): The subdirectory names.
+
+    Returns:
+        str: The path of the directory.
+    """
+    root = os.environ.get("WATERGEO_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "watergeo"
+    )
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class DiskCache:
+    """A size-bounded cache of files on disk with least-recently-used eviction.
+
+    Entries are stored in files named after the SHA-1 hash of their key.
+    Reading an entry updates its modification time, and the entries with the
+    oldest modification times are deleted when the cache grows beyond max_bytes.
+    Entries are written to a temporary file first, so concurrent readers, in
+    this or other processes, never see partial entries.
+
+    Args:
+        directory (str): The directory of the cache.
+        max_bytes (int, optional): The maximum total size of the entries in bytes. Defaults to 1 GiB.
+        suffix (str, optional): The file extension of the entries, e.g., ".parquet". Defaults to "".
+    """
+
+    def __init__(self, directory, max_bytes=1024**3, suffix=""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """Returns the file path of the entry for key, whether it exists or not."""
+        digest = hashlib.sha1(str(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + self.suffix)
+
+    def get_path(self, key):
+        """Returns the file path of the entry for key and marks it as recently used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The file path, or None if the entry does not exist.
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put_file(self, key, write):
+        """Adds or replaces an entry written by a function.
+
+        Args:
+            key (str): The cache key.
+            write (callable): A function that writes the entry to the file path it is given.
+
+        Returns:
+            str: The file path of the entry.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(tmp)
+            size = os.path.getsize(tmp)
+            with self._lock:
+                # A replaced entry no longer counts towards the size of the cache
+                try:
+                    size -= os.path.getsize(path)
+                except OSError:
+                    pass
+                os.replace(tmp, path)
+                if self._size is not None:
+                    self._size += size
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+        return path
+
+    def get(self, key):
+        """Returns the content of the entry for key, or None if it does not exist."""
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, value):
+        """Adds or replaces an entry with the given bytes."""
+
+        def write(path):
+            with open(path, "wb") as f:
+                f.write(value)
+
+        self.put_file(key, write)
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return entries
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+            entries = self._entries()
+            size = sum(entry[1] for entry in entries)
+            for _, entry_size, path in sorted(entries):
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                size -= entry_size
+            self._size = size
+
+    def clear(self):
+        """Deletes all entries and resets the hit and miss counters."""
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Returns the cache statistics.
+
+        Returns:
+            dict: The number of hits, misses, entries, total size in bytes, and maximum size in bytes.
+        """
+        with self._lock:
+            entries = self._entries()
+            self._size = sum(entry[1] for entry in entries)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "files": len(entries),
+                "size": self._size,
+                "max_bytes": self.max_bytes,
+            }
 
 
 def csv_to_df(csv_file):
@@ -13,4 +311,4 @@ def csv_to_df(csv_file):
     """
     import pandas as pd
 
-    return pd.read_csv(csv_file)
\ No newline at end of file
+    return pd.read_csv(csv_file)
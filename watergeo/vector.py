@@ -0,0 +1,560 @@
+"""The vector module contains functions for preparing vector data for display on the map.
+"""
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from .tileserver import TileSource
+from .utility import DiskCache, LRUCache, cache_dir
+
+# The zoom levels at which the levels of detail built by build_lod() start.
+DEFAULT_LOD_ZOOMS = (0, 6, 9, 12)
+
+# The files that make up a shapefile besides the .shp file.
+SHAPEFILE_SIDECARS = (".shx", ".dbf", ".prj", ".cpg")
+
+# The parsed layers of the most recently read vector files.
+vector_cache = LRUCache(maxsize=8)
+
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+
+def to_gdf(data, crs="EPSG:4326"):
+    """Converts GeoJSON or a GeoDataFrame to a GeoDataFrame in the given CRS.
+
+    Args:
+        data (dict | geopandas.GeoDataFrame): A GeoJSON FeatureCollection or a GeoDataFrame.
+        crs (str, optional): The CRS of the output. Defaults to "EPSG:4326".
+
+    Returns:
+        geopandas.GeoDataFrame: The GeoDataFrame.
+    """
+    import geopandas as gpd
+
+    if isinstance(data, gpd.GeoDataFrame):
+        gdf = data
+    elif isinstance(data, dict):
+        features = data.get("features", [data] if data.get("type") == "Feature" else [])
+        gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    else:
+        raise TypeError("Unsupported vector data format.")
+
+    if gdf.crs is None:
+        return gdf.set_crs(crs)
+    elif gdf.crs != crs:
+        return gdf.to_crs(crs)
+    return gdf
+
+
+def get_vector_disk_cache():
+    """Returns the on-disk cache of parsed vector files.
+
+    The cache is stored in the "vector" directory of utility.cache_dir(). Its
+    size limit in bytes can be set with the WATERGEO_VECTOR_CACHE_BYTES
+    environment variable and defaults to 2 GiB. Layers are stored as GeoParquet
+    if pyarrow is installed, and as pickles otherwise.
+
+    Returns:
+        utility.DiskCache: The cache.
+    """
+    global _disk_cache
+    with _disk_cache_lock:
+        if _disk_cache is None:
+            max_bytes = int(os.environ.get("WATERGEO_VECTOR_CACHE_BYTES", 2 * 1024**3))
+            suffix = ".parquet" if _has_pyarrow() else ".pkl"
+            _disk_cache = DiskCache(cache_dir("vector"), max_bytes, suffix)
+        return _disk_cache
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def source_key(path, **options):
+    """Returns a cache key that changes whenever a vector file or its reading options change.
+
+    The key is made of the absolute path, the size and the modification time of
+    the file, and of the sidecar files of shapefiles.
+
+    Args:
+        path (str): The path of the vector file.
+        **options: The options used to read the file.
+
+    Returns:
+        str: The cache key.
+    """
+    path = os.path.abspath(path)
+    files = [path]
+    if path.lower().endswith(".shp"):
+        stem = path[:-4]
+        files += [stem + ext for ext in SHAPEFILE_SIDECARS if os.path.exists(stem + ext)]
+    stats = []
+    for file in files:
+        stat = os.stat(file)
+        stats.append([file, stat.st_size, stat.st_mtime_ns])
+    return json.dumps({"files": stats, "options": options}, sort_keys=True, default=str)
+
+
+def read_vector(path, columns=None, bbox=None, mask=None, where=None, cache=True):
+    """Reads a vector file into a GeoDataFrame, using the parsed-vector caches.
+
+    The file is read with pyogrio, through Arrow if pyarrow is installed, and
+    the filters are applied by GDAL while reading, so the features and columns
+    that are left out are never parsed. Without pyogrio, geopandas.read_file()
+    is used with the same filters.
+
+    Parsed layers are kept in memory (vector_cache) and on disk
+    (get_vector_disk_cache()), keyed by the path, size and modification time of
+    the file and by the filters, so reading the same unchanged file again, in
+    this or a later session, skips parsing it.
+
+    Args:
+        path (str): The path of the vector file.
+        columns (list, optional): The names of the attribute columns to read. Defaults to None (all columns).
+        bbox (tuple, optional): Only read the features intersecting (minx, miny, maxx, maxy),
+            in the CRS of the file. Defaults to None.
+        mask (shapely.Geometry | geopandas.GeoDataFrame | geopandas.GeoSeries, optional): Only read the
+            features intersecting the geometry. A shapely geometry must be in the CRS of the file.
+            Cannot be combined with bbox. Defaults to None.
+        where (str, optional): An SQL WHERE clause selecting the features to read, e.g., "STATE = 'OH'".
+            Defaults to None.
+        cache (bool, optional): Whether to use the caches. Defaults to True.
+
+    Returns:
+        geopandas.GeoDataFrame: The GeoDataFrame.
+    """
+    if bbox is not None and mask is not None:
+        raise ValueError("bbox and mask cannot be combined.")
+    if mask is not None:
+        mask = _mask_geometry(path, mask)
+    if columns is not None:
+        columns = list(columns)
+    if bbox is not None:
+        bbox = tuple(float(b) for b in bbox)
+
+    if not cache:
+        return _read_file(path, columns, bbox, mask, where)
+
+    import shapely
+
+    key = source_key(
+        path,
+        columns=columns,
+        bbox=bbox,
+        mask=None if mask is None else shapely.to_wkb(mask, hex=True),
+        where=where,
+    )
+    gdf = vector_cache.get(key)
+    if gdf is None:
+        disk_cache = get_vector_disk_cache()
+        gdf = _read_cached_layer(disk_cache, key)
+        if gdf is None:
+            gdf = _read_file(path, columns, bbox, mask, where)
+            try:
+                disk_cache.put_file(
+                    key, lambda file: _write_cached_layer(gdf, file, disk_cache.suffix)
+                )
+            except Exception as e:
+                print(f"Could not cache {path}: {e}")
+        vector_cache.set(key, gdf)
+    return gdf.copy()
+
+
+def read_geojson(path):
+    """Reads a vector file into a GeoJSON dictionary for a GeoJSON layer.
+
+    GeoJSON files are loaded as they are, so feature ids and list properties
+    are kept. Other formats are read with read_vector() without the caches,
+    as the dictionary is embedded in the map anyway.
+
+    Args:
+        path (str): The path of the vector file.
+
+    Returns:
+        dict: The GeoJSON FeatureCollection.
+    """
+    if path.lower().endswith((".geojson", ".json")):
+        with open(path) as f:
+            return json.load(f)
+    return json.loads(read_vector(path, cache=False).to_json())
+
+
+def _mask_geometry(path, mask):
+    """Returns a mask as a single shapely geometry in the CRS of the file."""
+    if not hasattr(mask, "geometry") and not hasattr(mask, "union_all"):
+        return mask
+    import pyproj
+
+    crs = _file_crs(path)
+    if crs is not None and mask.crs is not None and not pyproj.CRS(crs).equals(mask.crs):
+        mask = mask.to_crs(crs)
+    return mask.union_all() if hasattr(mask, "union_all") else mask.geometry.union_all()
+
+
+def _file_crs(path):
+    try:
+        import pyogrio
+    except ImportError:
+        import geopandas as gpd
+
+        return gpd.read_file(path, rows=0).crs
+    return pyogrio.read_info(path)["crs"]
+
+
+def _read_file(path, columns, bbox, mask, where):
+    """Reads a vector file with the filters applied by the reader."""
+    import geopandas as gpd
+
+    try:
+        import pyogrio
+    except ImportError:
+        kwargs = {"bbox": bbox, "mask": mask}
+        if columns is not None:
+            kwargs["include_fields"] = columns
+        if where is not None:
+            kwargs["where"] = where
+        return gpd.read_file(path, **kwargs)
+
+    return pyogrio.read_dataframe(
+        path,
+        columns=columns,
+        bbox=bbox,
+        mask=mask,
+        where=where,
+        use_arrow=_has_pyarrow(),
+    )
+
+
+def _read_cached_layer(disk_cache, key):
+    import geopandas as gpd
+    import pandas as pd
+
+    file = disk_cache.get_path(key)
+    if file is None:
+        return None
+    try:
+        if file.endswith(".parquet"):
+            return gpd.read_parquet(file)
+        return pd.read_pickle(file)
+    except Exception:
+        return None
+
+
+def _write_cached_layer(gdf, file, suffix):
+    if suffix == ".parquet":
+        gdf.to_parquet(file)
+    else:
+        gdf.to_pickle(file)
+
+
+def pixel_size(zoom):
+    """Returns the width in degrees of one 256-pixel-tile pixel at the equator at the given zoom level."""
+    return 360.0 / (256 * 2**zoom)
+
+
+def payload_size(data):
+    """Returns the size in bytes of data serialized as JSON."""
+    return len(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def quantize(geometries, decimals):
+    """Rounds the coordinates of geometries to the given number of decimals.
+
+    Args:
+        geometries (numpy.ndarray): An array of shapely geometries.
+        decimals (int): The number of decimals to keep.
+
+    Returns:
+        numpy.ndarray: The rounded geometries.
+    """
+    import shapely
+
+    return shapely.transform(geometries, lambda coords: np.round(coords, decimals))
+
+
+def simplify(geometries, tolerance):
+    """Simplifies geometries, keeping shared boundaries of polygon coverages intact.
+
+    If the geometries form a valid polygon coverage (like counties or watersheds),
+    shapely.coverage_simplify() is used so that neighbors keep sharing their edges.
+    Otherwise, every geometry is simplified on its own with preserve_topology=True.
+
+    Args:
+        geometries (numpy.ndarray): An array of shapely geometries.
+        tolerance (float): The simplification tolerance in the units of the geometries.
+
+    Returns:
+        numpy.ndarray: The simplified geometries.
+    """
+    import shapely
+
+    types = set(shapely.get_type_id(geometries).tolist())
+    polygonal = types <= {3, 6}  # Polygon, MultiPolygon
+    if polygonal and hasattr(shapely, "coverage_simplify"):
+        try:
+            if shapely.coverage_is_valid(geometries):
+                return shapely.coverage_simplify(geometries, tolerance)
+        except shapely.errors.GEOSException:
+            pass
+    return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+
+def build_lod(data, zooms=DEFAULT_LOD_ZOOMS, decimals=6):
+    """Builds simplified, coordinate-quantized versions of vector data for bands of zoom levels.
+
+    The level starting at zooms[i] is simplified with a tolerance of about one
+    pixel at the highest zoom of its band and its coordinates are rounded to
+    match. The last level keeps every vertex, rounded to `decimals` decimals.
+
+    Args:
+        data (dict | geopandas.GeoDataFrame): The GeoJSON FeatureCollection or GeoDataFrame.
+        zooms (tuple, optional): The zoom levels at which the levels start, in increasing order. Defaults to (0, 6, 9, 12).
+        decimals (int, optional): The number of decimals of the last level. Defaults to 6 (about 0.1 m).
+
+    Returns:
+        tuple: A list of (min_zoom, GeoJSON dict) pairs and a report dictionary with the
+            payload size in bytes of the original data and of each level.
+    """
+    original = data if isinstance(data, dict) else data.__geo_interface__
+    gdf = to_gdf(data)
+    geometries = np.asarray(gdf.geometry.values, dtype=object)
+
+    levels = []
+    report = {"original": payload_size(original)}
+    for i, zoom in enumerate(zooms):
+        if i == len(zooms) - 1:
+            level_geometries = geometries
+            level_decimals = decimals
+        else:
+            tolerance = pixel_size(zooms[i + 1] - 1)
+            level_geometries = simplify(geometries, tolerance)
+            level_decimals = min(decimals, max(0, math.ceil(-math.log10(tolerance)) + 1))
+        level = gdf.set_geometry(quantize(level_geometries, level_decimals))
+        geojson = level.__geo_interface__
+        levels.append((zoom, geojson))
+        report[zoom] = payload_size(geojson)
+    return levels, report
+
+
+def lod_index(levels, zoom):
+    """Returns the index of the level of detail to display at the given zoom level.
+
+    Args:
+        levels (list): The (min_zoom, data) pairs returned by build_lod().
+        zoom (float): The zoom level of the map.
+
+    Returns:
+        int: The index of the level in levels.
+    """
+    index = 0
+    for i, (min_zoom, _) in enumerate(levels):
+        if zoom >= min_zoom:
+            index = i
+    return index
+
+
+def viewport_boxes(south, west, north, east):
+    """Returns the boxes covering a map viewport in longitudes from -180 to 180.
+
+    Leaflet does not wrap the bounds of a map panned across the antimeridian,
+    e.g., west=170 and east=190, so the viewport is split into a box on each side.
+
+    Args:
+        south (float): The southern latitude of the viewport.
+        west (float): The western longitude of the viewport.
+        north (float): The northern latitude of the viewport.
+        east (float): The eastern longitude of the viewport.
+
+    Returns:
+        numpy.ndarray: One or two shapely boxes.
+    """
+    import shapely
+
+    if east - west >= 360:
+        return np.array([shapely.box(-180, south, 180, north)])
+    width = east - west if east >= west else east - west + 360
+    west = (west + 180) % 360 - 180
+    east = west + width
+    if east <= 180:
+        return np.array([shapely.box(west, south, east, north)])
+    return np.array([shapely.box(west, south, 180, north), shapely.box(-180, south, east - 360, north)])
+
+
+class ViewportIndex:
+    """A spatial index that returns the features of a layer intersecting the map viewport.
+
+    Features are indexed once with an STRtree, so a query only touches the
+    features in view. When more features than the budget are in view, the
+    ones with the largest bounding boxes are kept.
+
+    Args:
+        data (geopandas.GeoDataFrame | dict): The vector data.
+        max_features (int, optional): The maximum number of features returned by a query. Defaults to 2000.
+    """
+
+    def __init__(self, data, max_features=2000):
+        import shapely
+
+        gdf = to_gdf(data)
+        self.max_features = max_features
+        self.geometries = np.asarray(gdf.geometry.values, dtype=object)
+        self.tree = shapely.STRtree(self.geometries)
+        columns = [c for c in gdf.columns if c != gdf.geometry.name]
+        self.properties = json.loads(gdf[columns].to_json(orient="records"))
+        bounds = shapely.bounds(self.geometries)
+        self.extent = (bounds[:, 2] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 1])
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def query(self, bounds=None, zoom=None):
+        """Returns the features intersecting a viewport as a GeoJSON FeatureCollection.
+
+        Args:
+            bounds (tuple, optional): The viewport as ((south, west), (north, east)), like the bounds
+                of an ipyleaflet map. Defaults to None (the whole layer).
+            zoom (float, optional): The zoom level of the map. If given, the features are simplified
+                to about one pixel at that zoom level. Defaults to None.
+
+        Returns:
+            dict: The GeoJSON FeatureCollection.
+        """
+        import shapely
+
+        if bounds:
+            (south, west), (north, east) = bounds
+            indices = np.unique(self.tree.query(viewport_boxes(south, west, north, east))[1])
+        else:
+            indices = np.arange(len(self.geometries))
+
+        if len(indices) > self.max_features:
+            largest = np.argpartition(-self.extent[indices], self.max_features - 1)
+            indices = indices[largest[: self.max_features]]
+        indices = np.sort(indices)
+
+        geometries = self.geometries[indices]
+        if zoom is not None:
+            geometries = shapely.simplify(geometries, pixel_size(zoom), preserve_topology=True)
+
+        features = [
+            {
+                "type": "Feature",
+                "id": int(index),
+                "properties": self.properties[index],
+                "geometry": json.loads(shapely.to_geojson(geometry)),
+            }
+            for index, geometry in zip(indices, geometries)
+        ]
+        return {"type": "FeatureCollection", "features": features}
+
+
+# Half the width of the Web Mercator world in meters
+_MERCATOR_HALF_WORLD = 20037508.342789244
+
+
+def mercator_tile_bounds(z, x, y):
+    """Returns the Web Mercator bounds (minx, miny, maxx, maxy) of an XYZ tile."""
+    size = 2 * _MERCATOR_HALF_WORLD / 2**z
+    minx = -_MERCATOR_HALF_WORLD + x * size
+    maxy = _MERCATOR_HALF_WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _tile_property(value):
+    """Converts a property value to a type supported by vector tiles, or None to drop it."""
+    if value is None:
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class VectorTileSource(TileSource):
+    """Cuts a GeoDataFrame into Mapbox Vector Tiles on demand.
+
+    Tiles are generated when they are requested and kept in an LRU cache, so
+    the browser only receives the features of the tiles it displays.
+
+    Args:
+        data (geopandas.GeoDataFrame | dict): The vector data.
+        layer_name (str, optional): The name of the layer inside the tiles. Defaults to "layer".
+        extent (int, optional): The tile extent in tile coordinates. Defaults to 4096.
+        buffer (int, optional): The buffer around each tile in tile coordinates, which avoids seams. Defaults to 64.
+        cache_size (int, optional): The maximum number of tiles to cache. Defaults to 1024.
+    """
+
+    content_type = "application/x-protobuf"
+    extension = "pbf"
+
+    def __init__(self, data, layer_name="layer", extent=4096, buffer=64, cache_size=1024):
+        import shapely
+
+        try:
+            import mapbox_vector_tile  # noqa: F401
+        except ImportError:
+            raise ImportError("Please install the mapbox-vector-tile package.")
+
+        gdf = to_gdf(data, crs="EPSG:3857")
+        self.layer_name = layer_name
+        self.extent = extent
+        self.buffer = buffer
+        self.geometries = np.asarray(gdf.geometry.values, dtype=object)
+        self.tree = shapely.STRtree(self.geometries)
+        columns = [c for c in gdf.columns if c != gdf.geometry.name]
+        self.properties = gdf[columns].to_dict("records")
+        self.cache = LRUCache(maxsize=cache_size)
+
+    def tile(self, z, x, y):
+        """Returns the encoded vector tile, or None if no feature intersects the tile."""
+        return self.cache.get_or_set((z, x, y), lambda: self._render(z, x, y))
+
+    def _render(self, z, x, y):
+        import mapbox_vector_tile
+        import shapely
+
+        bounds = mercator_tile_bounds(z, x, y)
+        margin = (bounds[2] - bounds[0]) * self.buffer / self.extent
+        clip_box = (
+            bounds[0] - margin,
+            bounds[1] - margin,
+            bounds[2] + margin,
+            bounds[3] + margin,
+        )
+        indices = np.sort(self.tree.query(shapely.box(*clip_box)))
+        if len(indices) == 0:
+            return None
+
+        # Drop detail finer than one tile unit before clipping
+        unit = (bounds[2] - bounds[0]) / self.extent
+        geometries = shapely.simplify(self.geometries[indices], unit, preserve_topology=True)
+        geometries = shapely.clip_by_rect(geometries, *clip_box)
+
+        features = []
+        for index, geometry in zip(indices, geometries):
+            if geometry is None or geometry.is_empty:
+                continue
+            properties = {}
+            for key, value in self.properties[index].items():
+                value = _tile_property(value)
+                if value is not None:
+                    properties[str(key)] = value
+            features.append({"geometry": geometry, "properties": properties, "id": int(index)})
+        if not features:
+            return None
+
+        return mapbox_vector_tile.encode(
+            {"name": self.layer_name, "features": features},
+            default_options={"quantize_bounds": bounds, "extents": self.extent},
+        )
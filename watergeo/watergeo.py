@@ -1,18 +1,74 @@
 """Main module."""
+import anywidget
 import ipyleaflet
 from ipyleaflet import basemaps
 import ipywidgets as widgets
+import traitlets
 import ee
 import geopandas as gpd
 import json
-import requests
-import os
-import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from ipyleaflet import WidgetControl
 import pandas as pd
 from ipywidgets import interact
+from .common import ee_check_object, ee_initialize, get_map_id, map_id_cache
 
 
+class _ColumnDropdown(anywidget.AnyWidget):
+    """A dropdown that restyles a choropleth layer with the precomputed classes of another column.
+
+    The features of the layer carry their class in every column as the "classes"
+    property, so switching the column only sends the column name to the browser,
+    which sets the fill colors of the displayed features.
+
+    Args:
+        layer (ipyleaflet.GeoJSON): The layer.
+        palettes (dict): The colors of the classes of each column, followed by the color of the features without a value.
+    """
+
+    _esm = """
+    export default {
+        async render({ model, el }) {
+            const select = document.createElement("select");
+            select.style.width = "200px";
+            for (const column of model.get("columns")) {
+                const option = document.createElement("option");
+                option.value = option.text = column;
+                select.appendChild(option);
+            }
+            select.onchange = () => {
+                model.set("value", select.value);
+                model.save_changes();
+            };
+            el.appendChild(select);
+
+            const layer = await model.widget_manager.get_model(model.get("layer").slice("IPY_MODEL_".length));
+            async function show() {
+                const column = model.get("value");
+                const index = model.get("columns").indexOf(column);
+                const palette = model.get("palettes")[column];
+                select.value = column;
+                for (const view of await Promise.all(Object.values(layer.views || {}))) {
+                    view.obj?.eachLayer((feature) => {
+                        const properties = feature.feature.properties;
+                        const k = properties.classes[index];
+                        // The style is kept in the features, as Leaflet resets it on mouseout
+                        properties.style.fillColor = palette[k < 0 ? palette.length - 1 : k];
+                        feature.setStyle({ fillColor: properties.style.fillColor });
+                    });
+                }
+            }
+            model.on("change:value", show);
+            await show();
+        },
+    };
+    """
+    layer = traitlets.Instance(ipyleaflet.GeoJSON).tag(sync=True, **widgets.widget_serialization)
+    columns = traitlets.List().tag(sync=True)
+    palettes = traitlets.Dict().tag(sync=True)
+    value = traitlets.Unicode().tag(sync=True)
+
 
 class Map(ipyleaflet.Map):
     """This is the map class that inherits from ipyleaflet.Map.
@@ -21,6 +77,10 @@ class Map(ipyleaflet.Map):
         ipyleaflet (Map): The ipyleaflet.Map class.
     """
 
+    # The Earth Engine map ID cache shared by all maps. Use map_id_cache.info()
+    # to get the number of hits and misses.
+    map_id_cache = map_id_cache
+
     def __init__(self, center=[20, 0], zoom=2, **kwargs):
         """Initialize the map.
 
@@ -43,17 +103,51 @@ class Map(ipyleaflet.Map):
             self.add_layers_control()
         
         self.basemap_gui_control = None
+        self.observe(self._release_removed_layers, names="layers")
+
+    def _release_removed_layers(self, change):
+        """Unregisters the tile server sources of the layers removed from the map.
+
+        Widgets stay alive until they are closed, so removed layers are not
+        garbage collected and their sources are released here instead.
+        """
+        from .tileserver import get_tile_server
+
+        for layer in set(change["old"]) - set(change["new"]):
+            if hasattr(layer, "tile_source"):
+                get_tile_server().detach(layer)
+
+    def add_tile_layer(self, url, name, proxy=False, **kwargs):
+        """
+        Adds a tile layer to the current map.
+
+        Args:
+            url (str): The URL template of the tile layer.
+            name (str): The name of the layer.
+            proxy (bool, optional): Whether to load the tiles through the local caching tile proxy
+                (tileproxy.proxy_tiles()), which keeps them in memory and on disk. Defaults to False.
+            **kwargs: Arbitrary keyword arguments for additional layer options.
+        """
+        source = None
+        if proxy:
+            from .tileproxy import proxy_tiles
+            from .tileserver import get_tile_server
 
-    def add_tile_layer(self, url, name, **kwargs):
+            source, url = proxy_tiles(url)
         layer = ipyleaflet.TileLayer(url=url, name=name, **kwargs)
+        if source is not None:
+            layer.tile_source = source
+            get_tile_server().attach(layer, source.key)
         self.add(layer)
 
-    def add_basemap(self, name):
+    def add_basemap(self, name, proxy=False):
         """
         Adds a basemap to the current map.
 
         Args:
             name (str or object): The name of the basemap as a string, or an object representing the basemap.
+            proxy (bool, optional): Whether to load the tiles of a named basemap through the local
+                caching tile proxy. Defaults to False.
 
         Raises:
             TypeError: If the name is neither a string nor an object representing a basemap.
@@ -64,7 +158,7 @@ class Map(ipyleaflet.Map):
 
         if isinstance(name, str):
             url = eval(f"basemaps.{name}").build_url()
-            self.add_tile_layer(url, name)
+            self.add_tile_layer(url, name, proxy=proxy)
         else:
             self.add(name)
 
@@ -76,18 +170,22 @@ class Map(ipyleaflet.Map):
         """
         self.add_control(ipyleaflet.LayersControl(position=position))
 
-    def add_geojson(self, data, name="geojson", **kwargs):
+    def add_geojson(self, data, name="geojson", lod=False, lod_zooms=None, **kwargs):
         """Adds a GeoJSON layer to the map.
 
         Args:
-            data (str | dict): The GeoJSON data as a string or a dictionary.
+            data (str | dict): The path to a GeoJSON or other vector file, read with vector.read_geojson(), or a dictionary.
             name (str, optional): The name of the layer. Defaults to "geojson".
+            lod (bool, optional): Whether to build simplified, coordinate-quantized versions of the data
+                for bands of zoom levels and swap between them as the map zoom changes. The payload sizes
+                of the original data and of each level are stored in the layer's lod_report attribute. Defaults to False.
+            lod_zooms (tuple, optional): The zoom levels at which the levels of detail start. Defaults to
+                vector.DEFAULT_LOD_ZOOMS.
         """
-        import json
-
         if isinstance(data, str):
-            with open(data) as f:
-                data = json.load(f)
+            from .vector import read_geojson
+
+            data = read_geojson(data)
 
         if "style" not in kwargs:
             kwargs["style"] = {"color": "blue", "weight": 1, "fillOpacity": 0}
@@ -95,16 +193,52 @@ class Map(ipyleaflet.Map):
         if "hover_style" not in kwargs:
             kwargs["hover_style"] = {"fillColor": "#ff0000", "fillOpacity": 0.5}
 
-        layer = ipyleaflet.GeoJSON(data=data, name=name, **kwargs)
+        if not lod:
+            layer = ipyleaflet.GeoJSON(data=data, name=name, **kwargs)
+            self.add(layer)
+            return
+
+        from .vector import DEFAULT_LOD_ZOOMS, build_lod, lod_index
+
+        levels, report = build_lod(data, lod_zooms or DEFAULT_LOD_ZOOMS)
+        current = lod_index(levels, self.zoom)
+        layer = ipyleaflet.GeoJSON(data=levels[current][1], name=name, **kwargs)
+        layer.lod_report = report
+
+        def update_level(change):
+            nonlocal current
+            index = lod_index(levels, change["new"])
+            if index != current:
+                current = index
+                layer.data = levels[index][1]
+
+        self.observe(update_level, "zoom")
         self.add(layer)
 
-    def add_shp(self, data, name="shp", **kwargs):
+    def add_shp(
+        self,
+        data,
+        name="shp",
+        columns=None,
+        bbox=None,
+        mask=None,
+        where=None,
+        cache=True,
+        **kwargs,
+    ):
         """
         Adds a shapefile to the current map.
 
         Args:
             data (str or dict): The path to the shapefile as a string, or a dictionary representing the shapefile.
             name (str, optional): The name of the layer. Defaults to "shp".
+            columns (list, optional): The attribute columns to read from a file. Defaults to None (all columns).
+            bbox (tuple, optional): Only read the features of a file intersecting (minx, miny, maxx, maxy),
+                in the CRS of the file. Defaults to None.
+            mask (object, optional): Only read the features of a file intersecting a shapely geometry
+                or a GeoDataFrame. Defaults to None.
+            where (str, optional): An SQL WHERE clause selecting the features to read from a file. Defaults to None.
+            cache (bool, optional): Whether to use the parsed-vector caches of vector.read_vector(). Defaults to True.
             **kwargs: Arbitrary keyword arguments.
 
         Raises:
@@ -113,12 +247,12 @@ class Map(ipyleaflet.Map):
         Returns:
             None
         """
-        import shapefile
-        import json
+        from .vector import read_vector
 
         if isinstance(data, str):
-            with shapefile.Reader(data) as shp:
-                data = shp.__geo_interface__
+            data = read_vector(
+                data, columns=columns, bbox=bbox, mask=mask, where=where, cache=cache
+            ).__geo_interface__
 
         self.add_geojson(data, name, **kwargs)
 
@@ -134,39 +268,47 @@ class Map(ipyleaflet.Map):
         self.add(layer)
 
 
-    def add_raster(self, data, name="raster", zoom_to_layer=True, **kwargs):
+    def add_raster(
+        self,
+        data,
+        name="raster",
+        zoom_to_layer=True,
+        stream=True,
+        overviews="auto",
+        **kwargs,
+    ):
         """Adds a raster layer to the map.
 
+        The tiles are rendered by the raster pool shared by all maps in the
+        process (see raster.get_raster_pool()), which opens each raster once and
+        keeps the rendered tiles in memory. Remote Cloud-Optimized GeoTIFFs are
+        read with HTTP range requests through an on-disk block cache, and other
+        remote rasters are downloaded once into a persistent cache.
+
         Args:
         data (str): The path to the raster file or a URL.
         name (str, optional): The name of the layer. Defaults to "raster".
+        zoom_to_layer (bool, optional): Whether to zoom to the raster. Defaults to True.
+        stream (bool, optional): Whether to read remote rasters with range requests. Defaults to True.
+        overviews (bool | str, optional): Whether to build overviews of local rasters without them, so that
+            low-zoom tiles are fast. "auto" builds them for files over 64 MiB (raster.ensure_overviews()). Defaults to "auto".
+        **kwargs: The style of the raster (e.g., colormap, vmin, vmax, indexes) and tile layer options.
         """
+        from .raster import get_raster_pool, split_style
+        from .tileserver import get_tile_server
 
-        try:
-            from localtileserver import TileClient, get_leaflet_tile_layer
-        except ImportError:
-            raise ImportError("Please install the localtileserver package.")
-
-        if data.startswith('http://') or data.startswith('https://'):
-            response = requests.get(data, stream=True)
-            if response.status_code == 200:
-                with tempfile.NamedTemporaryFile(delete=False) as fp:
-                    for chunk in response.iter_content(1024):
-                        fp.write(chunk)
-                    data = fp.name
-            else:
-                raise ValueError(f"Failed to download {data}")
-
-        client = TileClient(data)
-        layer = get_leaflet_tile_layer(client, name=name, **kwargs)
+        style, options = split_style(kwargs)
+        source, url = get_raster_pool().source(
+            data, stream=stream, overviews=overviews, **style
+        )
+        layer = ipyleaflet.TileLayer(url=url, name=name, **options)
+        layer.tile_source = source
+        get_tile_server().attach(layer, source.key)
         self.add(layer)
 
         if zoom_to_layer:
-            self.center = client.center()
-            self.zoom = client.default_zoom
-
-        if data.startswith('http://') or data.startswith('https://'):
-            os.unlink(data)
+            self.center = source.center()
+            self.zoom = source.default_zoom
 
     def add_zoom_slider(
         self, description="Zoom level", min=0, max=24, value=10, position="topright"
@@ -195,13 +337,37 @@ class Map(ipyleaflet.Map):
         self.add(control)
 
     
-    def add_vector(self, data, name="vector", **kwargs):
+    def add_vector(
+        self,
+        data,
+        name="vector",
+        mode="geojson",
+        columns=None,
+        bbox=None,
+        mask=None,
+        where=None,
+        cache=True,
+        lazy=False,
+        **kwargs,
+    ):
         """
         Adds a vector layer to the current map.
 
         Args:
-            data (str, GeoDataFrame, dict): The vector data as a string (path to file), GeoDataFrame, or a dictionary.
+            data (str, GeoDataFrame, dict): The vector data as a path to any file supported by
+                vector.read_vector() (e.g., shapefile, GeoJSON, GeoPackage), a GeoDataFrame, or a dictionary.
             name (str, optional): The name of the layer. Defaults to "vector".
+            mode (str, optional): "geojson" to send the whole layer to the browser, or "tiles" to serve it
+                as vector tiles cut on demand by a local tile server, for very large layers. Defaults to "geojson".
+            columns (list, optional): The attribute columns to read from a file. Defaults to None (all columns).
+            bbox (tuple, optional): Only read the features of a file intersecting (minx, miny, maxx, maxy),
+                in the CRS of the file. Defaults to None.
+            mask (object, optional): Only read the features of a file intersecting a shapely geometry
+                or a GeoDataFrame. Defaults to None.
+            where (str, optional): An SQL WHERE clause selecting the features to read from a file. Defaults to None.
+            cache (bool, optional): Whether to use the parsed-vector caches of vector.read_vector(). Defaults to True.
+            lazy (bool, optional): Whether to only send the features in the current viewport to the
+                browser and update them as the map is panned and zoomed. See add_lazy_vector(). Defaults to False.
             **kwargs: Arbitrary keyword arguments.
 
         Raises:
@@ -210,25 +376,176 @@ class Map(ipyleaflet.Map):
         Returns:
             None
         """
+        from .vector import read_vector
+
         if isinstance(data, str):
-            if data.lower().endswith(('.geojson', '.json')):
-                # Load GeoJSON directly
-                with open(data) as f:
-                    data = json.load(f)
-                self.add_geojson(data, name, **kwargs)
-            elif data.lower().endswith(('.shp')):
-                # Read shapefile using GeoPandas and convert to GeoJSON
-                gdf = gpd.read_file(data)
-                self.add_geojson(gdf.__geo_interface__, name, **kwargs)
-            else:
-                raise TypeError("Unsupported vector data format.")
-        elif isinstance(data, gpd.GeoDataFrame):
-            self.add_geojson(data.__geo_interface__, name, **kwargs)
-        elif isinstance(data, dict):
+            data = read_vector(
+                data, columns=columns, bbox=bbox, mask=mask, where=where, cache=cache
+            )
+        elif not isinstance(data, (gpd.GeoDataFrame, dict)):
+            raise TypeError("Unsupported vector data format.")
+
+        if lazy:
+            self.add_lazy_vector(data, name, **kwargs)
+        elif mode == "tiles":
+            self.add_vector_tiles(data, name, **kwargs)
+        elif mode == "geojson":
+            if isinstance(data, gpd.GeoDataFrame):
+                data = data.__geo_interface__
             self.add_geojson(data, name, **kwargs)
         else:
-            raise TypeError("Unsupported vector data format.")
-    
+            raise ValueError("mode must be 'geojson' or 'tiles'.")
+
+    def add_lazy_vector(
+        self, data, name="vector", max_features=2000, debounce=0.25, **kwargs
+    ):
+        """Adds a vector layer that only holds the features in the current viewport.
+
+        The features are indexed with an STRtree. Whenever the map is panned or
+        zoomed, the features intersecting the new viewport, simplified for the
+        zoom level, replace the data of the layer, so the amount of data sent to
+        the browser does not depend on the size of the layer.
+
+        Args:
+            data (GeoDataFrame | dict): The vector data.
+            name (str, optional): The name of the layer. Defaults to "vector".
+            max_features (int, optional): The maximum number of features shown at once. When more
+                features are in view, the largest ones are shown. Defaults to 2000.
+            debounce (float, optional): The number of seconds to wait after the last pan or zoom
+                before updating the layer. Defaults to 0.25.
+            **kwargs: Keyword arguments passed to ipyleaflet.GeoJSON.
+        """
+        from .vector import ViewportIndex
+
+        if "style" not in kwargs:
+            kwargs["style"] = {"color": "blue", "weight": 1, "fillOpacity": 0}
+
+        index = ViewportIndex(data, max_features=max_features)
+        layer = ipyleaflet.GeoJSON(
+            data=index.query(self.bounds or None, self.zoom), name=name, **kwargs
+        )
+        layer.viewport_index = index
+
+        def update_features():
+            layer.data = index.query(self.bounds or None, self.zoom)
+
+        self._observe_viewport(update_features, debounce)
+        self.add(layer)
+
+    def _observe_viewport(self, callback, debounce=0.25):
+        """Calls callback after the map is panned or zoomed, once the viewport has settled.
+
+        Args:
+            callback (callable): The function to call without arguments.
+            debounce (float, optional): The number of seconds to wait after the last pan or zoom.
+                If zero or less, callback is called on every change. Defaults to 0.25.
+        """
+        timer = None
+        lock = threading.Lock()
+
+        def schedule_update(change):
+            nonlocal timer
+            if debounce <= 0:
+                callback()
+                return
+            with lock:
+                if timer is not None:
+                    timer.cancel()
+                timer = threading.Timer(debounce, callback)
+                timer.daemon = True
+                timer.start()
+
+        self.observe(schedule_update, names=["bounds", "zoom"])
+
+    def add_points(
+        self,
+        data,
+        latitude="latitude",
+        longitude="longitude",
+        name="points",
+        aggregate=None,
+        columns=None,
+        radius=40,
+        max_zoom=16,
+        debounce=0.25,
+        **kwargs,
+    ):
+        """Adds a layer of clustered points, e.g., gauges or wells, to the map.
+
+        The points are indexed once with a hierarchical cluster index (see
+        points.ClusterIndex). Whenever the map is panned or zoomed, the clusters
+        and points in the new viewport at the new zoom level replace the data of
+        the layer.
+
+        Args:
+            data (str | pd.DataFrame | gpd.GeoDataFrame): The path to a CSV file or the points.
+            latitude (str, optional): The latitude column. Defaults to "latitude".
+            longitude (str, optional): The longitude column. Defaults to "longitude".
+            name (str, optional): The name of the layer. Defaults to "points".
+            aggregate (dict, optional): The attributes aggregated per cluster, e.g., {"discharge": "max"}.
+                Defaults to None.
+            columns (list, optional): The columns kept as properties of single points. Defaults to None (all columns).
+            radius (int, optional): The cluster radius in pixels. Defaults to 40.
+            max_zoom (int, optional): The highest zoom level with clusters. Defaults to 16.
+            debounce (float, optional): The number of seconds to wait after the last pan or zoom
+                before updating the layer. Defaults to 0.25.
+            **kwargs: Keyword arguments passed to ipyleaflet.GeoJSON, e.g., point_style.
+        """
+        from .points import ClusterIndex
+
+        if isinstance(data, str):
+            from .utility import csv_to_df
+
+            data = csv_to_df(data)
+
+        kwargs.setdefault(
+            "point_style",
+            {"radius": 5, "color": "white", "weight": 1, "fillColor": "#3388ff", "fillOpacity": 0.8},
+        )
+        index = ClusterIndex(
+            data, latitude, longitude, aggregate, columns, radius=radius, max_zoom=max_zoom
+        )
+        layer = ipyleaflet.GeoJSON(
+            data=index.query(self.bounds or None, self.zoom), name=name, **kwargs
+        )
+        layer.cluster_index = index
+
+        def update_points():
+            layer.data = index.query(self.bounds or None, self.zoom)
+
+        self._observe_viewport(update_points, debounce)
+        self.add(layer)
+
+    def add_vector_tiles(self, data, name="vector", style=None, **kwargs):
+        """Adds a vector layer served as Mapbox Vector Tiles by the local tile server.
+
+        Tiles are cut from the data when the map requests them, so only the
+        features in view are sent to the browser.
+
+        Args:
+            data (GeoDataFrame | dict): The vector data.
+            name (str, optional): The name of the layer. Defaults to "vector".
+            style (dict, optional): The Leaflet path style of the features. Defaults to None.
+            **kwargs: Keyword arguments passed to vector.VectorTileSource.
+        """
+        from .tileserver import get_tile_server
+        from .vector import VectorTileSource
+
+        if style is None:
+            style = {"color": "blue", "weight": 1, "fill": False}
+
+        source = VectorTileSource(data, **kwargs)
+        server = get_tile_server()
+        key = server.register(source)
+        layer = ipyleaflet.VectorTileLayer(
+            url=server.tile_url(key),
+            name=name,
+            vector_tile_layer_styles={source.layer_name: style},
+        )
+        layer.tile_source = source
+        server.attach(layer, key)
+        self.add(layer)
+
     def add_opacity_slider(
         self, layer_index=-1, description="Opacity", position="topright"
     ):
@@ -415,7 +732,7 @@ class Map(ipyleaflet.Map):
         for tool in grid.children:
             tool.on_click(toolbar_callback)
 
-    def add_ee_layer(self, ee_object, vis_params={}, name="Layer untitled", shown=True, opacity=1.0):
+    def add_ee_layer(self, ee_object, vis_params={}, name="Layer untitled", shown=True, opacity=1.0, proxy=False):
         """
         Adds Earth Engine data layers to the map.
     
@@ -425,11 +742,11 @@ class Map(ipyleaflet.Map):
             name (str, optional): The name of the layer. Defaults to "Layer untitled".
             shown (bool, optional): Whether to show the layer initially. Defaults to True.
             opacity (float, optional): The opacity of the layer (between 0 and 1). Defaults to 1.0.
+            proxy (bool, optional): Whether to load the tiles through the local caching tile proxy. Defaults to False.
         """
         try:
-            import ee  # Import ee here
-            ee.Initialize()  # Initialize Earth Engine
-            ee_object.getInfo()  # Check if the object is valid
+            ee_initialize()
+            ee_check_object(ee_object)
         except Exception as e:
             print("Error adding Earth Engine layer:", e)
             return
@@ -438,20 +755,18 @@ class Map(ipyleaflet.Map):
             ee_object = ee_object.mosaic()
 
         # Generate a URL for fetching the tiles from Earth Engine
-        map_id_dict = ee.Image(ee_object).getMapId(vis_params)
+        map_id_dict = get_map_id(ee_object, vis_params)
     
         # Create a new tile layer
         tiles_url = map_id_dict['tile_fetcher'].url_format
-        layer = ipyleaflet.TileLayer(
-            url=tiles_url,
+        self.add_tile_layer(
+            tiles_url,
+            name,
+            proxy=proxy,
             attribution='Google Earth Engine',
-            name=name,
             opacity=opacity,
             visible=shown
         )
-    
-        # Add the layer to the map
-        self.add_layer(layer)
 
     
     def add_split_map(self, left_layer, right_layer, left_vis_params={}, right_vis_params={}, left_layer_name='Left Layer', right_layer_name='Right Layer'):
@@ -467,10 +782,9 @@ class Map(ipyleaflet.Map):
         right_layer_name (str, optional): The name of the right layer. Defaults to 'Right Layer'.
         """
         try:
-            import ee  # Import ee here
-            ee.Initialize()  # Initialize Earth Engine
-            left_layer.getInfo()  # Check if the left layer object is valid
-            right_layer.getInfo()  # Check if the right layer object is valid
+            ee_initialize()
+            ee_check_object(left_layer)
+            ee_check_object(right_layer)
         except Exception as e:
             print("Error adding Earth Engine layer:", e)
             return
@@ -482,8 +796,8 @@ class Map(ipyleaflet.Map):
             right_layer = right_layer.mosaic()
 
         # Generate URLs for fetching the tiles from Earth Engine
-        left_map_id_dict = ee.Image(left_layer).getMapId(left_vis_params)
-        right_map_id_dict = ee.Image(right_layer).getMapId(right_vis_params)
+        left_map_id_dict = get_map_id(left_layer, left_vis_params)
+        right_map_id_dict = get_map_id(right_layer, right_vis_params)
 
         # Create new tile layers
         left_tiles_url = left_map_id_dict['tile_fetcher'].url_format
@@ -527,9 +841,55 @@ class Map(ipyleaflet.Map):
         split_control = ipyleaflet.SplitMapControl(left_layer=left_tile_layer, right_layer=right_tile_layer)
         self.add_control(split_control) 
         
+    def to_html(self, filename=None, title="watergeo map", width="100%", height="600px", verbose=False):
+        """Exports the map and its widget state to a standalone HTML page.
+
+        The size of the data of each GeoJSON layer is stored in the export_report
+        attribute of the map. Unlike foliumap.Map.to_html(), the layer data stays
+        in the widget state, which the page needs in full when it loads.
+
+        Args:
+            filename (str, optional): The path of the HTML file. Defaults to None (return the HTML).
+            title (str, optional): The title of the page. Defaults to "watergeo map".
+            width (str, optional): The width of the map. Defaults to "100%".
+            height (str, optional): The height of the map. Defaults to "600px".
+            verbose (bool, optional): Whether to print the size of each layer. Defaults to False.
+
+        Returns:
+            str: The HTML if filename is None.
+        """
+        import io
+
+        from ipywidgets.embed import dependency_state, embed_minimal_html
+
+        from .export import print_report, widget_state_report
+
+        before = (self.layout.width, self.layout.height)
+        self.layout.width, self.layout.height = width, height
+        try:
+            state = dependency_state([self], drop_defaults=True)
+            output = io.StringIO()
+            embed_minimal_html(
+                output, views=[self], title=title, state=state, drop_defaults=True, indent=None
+            )
+        finally:
+            self.layout.width, self.layout.height = before
+
+        html = output.getvalue()
+        self.export_report = widget_state_report(state)
+        if verbose:
+            print_report(self.export_report, len(html.encode("utf-8")))
+        if filename is None:
+            return html
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(html)
+
     def to_streamlit(self, width=None, height=600, scrolling=False, **kwargs):
         """Renders map figure in a Streamlit app.
 
+        The HTML of the map is cached by its content (see export.cached_html()),
+        so the reruns of the script that leave the map unchanged do not render it again.
+
         Args:
             width (int, optional): Width of the map. Defaults to None.
             height (int, optional): Height of the map. Defaults to 600.
@@ -550,76 +910,173 @@ class Map(ipyleaflet.Map):
             #     </style>
             #     """
             #     st.markdown(make_map_responsive, unsafe_allow_html=True)
-            return components.html(
-                self.to_html(), width=width, height=height, scrolling=scrolling
-            )
+            from .export import cached_html
+
+            html = cached_html(self, self.to_html)
+            return components.html(html, width=width, height=height, scrolling=scrolling)
 
         except Exception as e:
             raise Exception(e)
         
 
 
-    def add_time_slider(self, image_collection, vis_params):
+    def add_time_slider(
+        self,
+        image_collection,
+        vis_params,
+        reuse_overlay=True,
+        prefetch=2,
+        max_workers=4,
+    ):
+        """Adds a slider to step through the images of an Earth Engine ImageCollection.
+
+        By default, a single ImageOverlay is added to the map and its URL is
+        swapped when the slider moves. Thumbnail URLs are cached, and the URLs
+        of the next and previous `prefetch` frames are requested in the background.
+
+        Args:
+            image_collection (object): The ee.ImageCollection to display.
+            vis_params (dict): Visualization parameters.
+            reuse_overlay (bool, optional): Whether to keep one overlay and swap its URL. If False,
+                the layers of the map are cleared and a new overlay is added on every move. Defaults to True.
+            prefetch (int, optional): The number of frames to prefetch on each side of the current one. Defaults to 2.
+            max_workers (int, optional): The maximum number of concurrent thumbnail requests. Defaults to 4.
+        """
         # Convert the ImageCollection to a list
         image_list = image_collection.toList(image_collection.size())
+        n = image_collection.size().getInfo()
 
         # Create a slider
-        slider = widgets.IntSlider(min=0, max=image_collection.size().getInfo() - 1, step=1, value=0)
+        slider = widgets.IntSlider(min=0, max=n - 1, step=1, value=0)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        lock = threading.Lock()
+        frames = {}
+        overlay = None
+
+        def thumb_url(index):
+            # Apply the visualization parameters to the selected image
+            image = ee.Image(image_list.get(index)).visualize(**vis_params)
+            return image.getThumbURL({'dimensions': '512x512', 'format': 'png'})
+
+        def request(index):
+            with lock:
+                if index not in frames:
+                    frames[index] = executor.submit(thumb_url, index)
+                return frames[index]
+
+        def frame_url(index):
+            try:
+                return request(index).result()
+            except Exception:
+                # Do not cache failed requests so that they can be retried
+                with lock:
+                    frames.pop(index, None)
+                raise
 
         # Define a function to update the map
         def update_map(index):
-            # Get the selected image
-            image = ee.Image(image_list.get(index))
-
-            # Apply the visualization parameters
-            image = image.visualize(**vis_params)
-
-            # Generate a URL for the image
-            url = image.getThumbURL({'dimensions': '512x512', 'format': 'png'})
-
-            # Create an ImageOverlay
-            overlay = ipyleaflet.ImageOverlay(url=url, bounds=self.bounds)
-
-            # Clear all layers from the map
-            self.clear_layers()
-
-            # Add the new layer to the map
-            self.add_layer(overlay)
+            nonlocal overlay
+
+            request(index)
+            for offset in range(1, prefetch + 1):
+                for i in (index + offset, index - offset):
+                    if 0 <= i < n:
+                        request(i)
+            url = frame_url(index)
+
+            if not reuse_overlay:
+                self.clear_layers()
+                self.add_layer(ipyleaflet.ImageOverlay(url=url, bounds=self.bounds))
+            elif overlay is None:
+                overlay = ipyleaflet.ImageOverlay(
+                    url=url, bounds=self.bounds, name="Time slider"
+                )
+                self.add_layer(overlay)
+            else:
+                overlay.bounds = self.bounds
+                overlay.url = url
 
         # Link the slider and the update function
         interact(update_map, index=slider)
-    
-    def add_choropleth(self, data, columns, key_on, name="choropleth", **kwargs):
-        import requests
-        import json
-    
+
+    def add_choropleth(
+        self,
+        data,
+        columns,
+        key_on=None,
+        name="choropleth",
+        scheme="quantiles",
+        k=5,
+        bins=None,
+        cmap="YlGn",
+        nodata_color="#cccccc",
+        position="topright",
+        **kwargs,
+    ):
         """Adds a choropleth layer to the map.
-    
+
+        The values of all columns are classified up front with NumPy (see
+        choropleth.ChoroplethStyles) and the fill color of every feature is
+        stored with it. With several columns, a dropdown switches the column
+        shown. The classes of all columns are sent to the browser with the
+        features, so switching only sends the column name and the browser sets
+        the fill colors, without sending the geometries again.
+
         Args:
-            data (str | dict): The GeoJSON data as a string or a dictionary.
-            columns (list): The columns to use for the choropleth.
-            key_on (str): The key to use to match GeoJSON features with data.
+            data (str | dict | gpd.GeoDataFrame): The URL or path of a vector file, GeoJSON or a GeoDataFrame.
+                Remote files are downloaded once into the download cache.
+            columns (str | list): The column, or the columns to switch between.
+            key_on (str, optional): The property identifying the features, e.g., "FIPS", or "id" for the
+                feature ids, kept in the feature properties of the layer. Defaults to None.
             name (str, optional): The name of the layer. Defaults to "choropleth".
+            scheme (str, optional): The classification scheme, one of "quantiles", "equal_interval" and
+                "natural_breaks". Defaults to "quantiles".
+            k (int, optional): The number of classes. Defaults to 5.
+            bins (list, optional): The upper bounds of custom classes, used instead of the scheme. Defaults to None.
+            cmap (str | list, optional): The name of a ColorBrewer color scheme or a list of colors. Defaults to "YlGn".
+            nodata_color (str, optional): The color of the features without a value. Defaults to "#cccccc".
+            position (str, optional): The position of the column dropdown. Defaults to "topright".
+            **kwargs: Keyword arguments passed to ipyleaflet.GeoJSON, e.g., style and hover_style.
         """
-    
-        # If data is a URL, fetch the data from the URL
-        if isinstance(data, str) and data.startswith('http'):
-            response = requests.get(data)
-            data = json.loads(response.text)
-    
-        if isinstance(data, str):
-            with open(data) as f:
-                data = json.load(f)
-    
-        if "style" not in kwargs:
-            kwargs["style"] = {
-                "fillColor": "green",
-                "fillOpacity": 0.5,
-                "color": "black",
-                "weight": 1,
-            }
-    
-        layer = ipyleaflet.Choropleth(
-            data=data, columns=columns, key_on=key_on, name=name, **kwargs
+        from .choropleth import ChoroplethStyles, key_column, read_geodata
+
+        if isinstance(columns, str):
+            columns = [columns]
+        gdf = read_geodata(data, key_on)
+        styles = ChoroplethStyles(gdf, columns, scheme, k, bins, cmap, nodata_color)
+
+        style = {"fillOpacity": 0.7, "color": "black", "weight": 1}
+        style.update(kwargs.pop("style", {}))
+        kwargs.setdefault("hover_style", {"fillOpacity": 0.9, "weight": 2})
+        properties = [key_column(key_on)] if key_on else []
+        features = json.loads(gdf[properties + ["geometry"]].to_json(drop_id=True))["features"]
+        classes = zip(*(styles.classes[column].tolist() for column in columns))
+        for feature, feature_classes, color in zip(features, classes, styles.colors[columns[0]].tolist()):
+            feature["properties"]["classes"] = list(feature_classes)
+            feature["properties"]["style"] = {**style, "fillColor": color}
+
+        layer = ipyleaflet.GeoJSON(
+            data={"type": "FeatureCollection", "features": features}, name=name, **kwargs
         )
-        self.add(layer)
\ No newline at end of file
+        layer.choropleth_styles = styles
+        layer.column = columns[0]
+        self.add(layer)
+
+        dropdown = None
+        if len(columns) > 1:
+            palettes = {column: styles.palettes[column] + [nodata_color] for column in columns}
+            dropdown = _ColumnDropdown(
+                layer=layer, columns=columns, palettes=palettes, value=columns[0]
+            )
+            dropdown.observe(lambda change: setattr(layer, "column", change["new"]), "value")
+            self.add(WidgetControl(widget=dropdown, position=position))
+
+        def show_column(column):
+            if column not in columns:
+                raise ValueError(f"{column!r} is not one of the columns {columns}.")
+            layer.column = column
+            if dropdown is not None:
+                dropdown.value = column
+
+        layer.show_column = show_column
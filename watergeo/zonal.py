@@ -0,0 +1,858 @@
+"""The zonal module computes zonal statistics for local rasters and vector files without Earth Engine.
+"""
+import os
+
+import numpy as np
+
+# The statistic types accepted by zonal_stats_local(), with the output columns they produce.
+# The column names follow the property names of the Earth Engine reducers used by common.zonal_stats().
+STAT_COLUMNS = {
+    "COUNT": ["count"],
+    "MEAN": ["mean"],
+    "MEAN_UNWEIGHTED": ["mean"],
+    "MAXIMUM": ["max"],
+    "MEDIAN": ["median"],
+    "MINIMUM": ["min"],
+    "MODE": ["mode"],
+    "STD": ["stdDev"],
+    "MIN_MAX": ["min", "max"],
+    "SUM": ["sum"],
+    "VARIANCE": ["variance"],
+    "HIST": ["histogram"],
+    "FIXED_HIST": ["histogram"],
+}
+
+
+def _check_stat_types(stat_type):
+    """Converts stat_type to a list of upper-case statistic names."""
+    if isinstance(stat_type, str):
+        stat_type = [stat_type]
+    stat_types = [s.upper() for s in stat_type]
+    for s in stat_types:
+        if s not in STAT_COLUMNS:
+            raise ValueError(
+                "The statistics type must be one of the following: {}".format(
+                    ", ".join(STAT_COLUMNS.keys())
+                )
+            )
+    return stat_types
+
+
+def _zone_starts(counts):
+    """Returns the index of the first element of each zone in label-sorted order."""
+    return np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+
+def zone_statistics(
+    labels,
+    values,
+    n_zones,
+    stat_type="MEAN",
+    max_buckets=256,
+    min_bucket_width=None,
+    hist_min=1.0,
+    hist_max=100.0,
+    hist_steps=10,
+):
+    """Computes statistics of values grouped by zone label in one vectorized pass.
+
+    Args:
+        labels (numpy.ndarray): A 1-D integer array of zone indices between 0 and n_zones - 1.
+        values (numpy.ndarray): A 1-D array of pixel values of the same length as labels.
+        n_zones (int): The number of zones.
+        stat_type (str | list, optional): One or more statistic types, see STAT_COLUMNS. Defaults to "MEAN".
+        max_buckets (int, optional): The number of buckets of the "HIST" histograms. Defaults to 256.
+        min_bucket_width (float, optional): The minimum bucket width of the "HIST" histograms. Defaults to None.
+        hist_min (float, optional): The lower (inclusive) bound of the first "FIXED_HIST" bucket. Defaults to 1.0.
+        hist_max (float, optional): The upper (exclusive) bound of the last "FIXED_HIST" bucket. Defaults to 100.0.
+        hist_steps (int, optional): The number of "FIXED_HIST" buckets. Defaults to 10.
+
+    Returns:
+        dict: A dictionary of output column name to a list or array with one entry per zone.
+            Zones without pixels get NaN (or None for histograms).
+    """
+    stat_types = _check_stat_types(stat_type)
+    labels = np.asarray(labels, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+
+    counts = np.bincount(labels, minlength=n_zones)
+    has_data = counts > 0
+    results = {}
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sums = np.bincount(labels, weights=values, minlength=n_zones)
+        means = np.where(has_data, sums / counts, np.nan)
+
+        if {"STD", "VARIANCE"} & set(stat_types):
+            deviations = (values - means[labels]) ** 2
+            variance = np.bincount(labels, weights=deviations, minlength=n_zones)
+            variance = np.where(has_data, variance / counts, np.nan)
+
+    need_sort = {"MEDIAN", "MODE", "MINIMUM", "MAXIMUM", "MIN_MAX", "HIST"}
+    if need_sort & set(stat_types):
+        # Sort by zone, then by value, so that every zone is a contiguous, ordered run
+        order = np.lexsort((values, labels))
+        sorted_values = values[order]
+        starts = _zone_starts(counts)
+        ends = starts + counts - 1
+        minimum = np.full(n_zones, np.nan)
+        maximum = np.full(n_zones, np.nan)
+        minimum[has_data] = sorted_values[starts[has_data]]
+        maximum[has_data] = sorted_values[ends[has_data]]
+
+    for s in stat_types:
+        if s == "COUNT":
+            results["count"] = counts
+        elif s in ("MEAN", "MEAN_UNWEIGHTED"):
+            results["mean"] = means
+        elif s == "SUM":
+            results["sum"] = np.where(has_data, sums, np.nan)
+        elif s == "VARIANCE":
+            results["variance"] = variance
+        elif s == "STD":
+            results["stdDev"] = np.sqrt(variance)
+        elif s == "MINIMUM":
+            results["min"] = minimum
+        elif s == "MAXIMUM":
+            results["max"] = maximum
+        elif s == "MIN_MAX":
+            results["min"] = minimum
+            results["max"] = maximum
+        elif s == "MEDIAN":
+            median = np.full(n_zones, np.nan)
+            lower = starts + (counts - 1) // 2
+            upper = starts + counts // 2
+            median[has_data] = (
+                sorted_values[lower[has_data]] + sorted_values[upper[has_data]]
+            ) / 2
+            results["median"] = median
+        elif s == "MODE":
+            results["mode"] = _zone_mode(labels[order], sorted_values, n_zones)
+        elif s == "FIXED_HIST":
+            results["histogram"] = _fixed_histogram(
+                labels, values, n_zones, hist_min, hist_max, hist_steps
+            )
+        elif s == "HIST":
+            results["histogram"] = _auto_histogram(
+                labels, values, n_zones, minimum, maximum, max_buckets, min_bucket_width
+            )
+
+    return results
+
+
+def _zone_mode(sorted_labels, sorted_values, n_zones):
+    """Returns the most frequent value of each zone, preferring the smallest value on ties."""
+    mode = np.full(n_zones, np.nan)
+    if len(sorted_values) == 0:
+        return mode
+    # Find runs of identical (zone, value) pairs
+    change = np.ones(len(sorted_values), dtype=bool)
+    change[1:] = (sorted_labels[1:] != sorted_labels[:-1]) | (
+        sorted_values[1:] != sorted_values[:-1]
+    )
+    run_starts = np.flatnonzero(change)
+    run_lengths = np.diff(np.append(run_starts, len(sorted_values)))
+    run_labels = sorted_labels[run_starts]
+    run_values = sorted_values[run_starts]
+    # Longest run first within each zone; runs are already ordered by value
+    order = np.lexsort((run_values, -run_lengths, run_labels))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = run_labels[order][1:] != run_labels[order][:-1]
+    best = order[first]
+    mode[run_labels[best]] = run_values[best]
+    return mode
+
+
+def _fixed_histogram(labels, values, n_zones, hist_min, hist_max, hist_steps):
+    """Returns a list of [bucket_start, count] pairs per zone, like ee.Reducer.fixedHistogram()."""
+    width = (hist_max - hist_min) / hist_steps
+    buckets = np.floor((values - hist_min) / width).astype(np.int64)
+    inside = (buckets >= 0) & (buckets < hist_steps)
+    counts = np.bincount(
+        labels[inside] * hist_steps + buckets[inside], minlength=n_zones * hist_steps
+    ).reshape(n_zones, hist_steps)
+    starts = hist_min + width * np.arange(hist_steps)
+    return [
+        [[float(start), int(count)] for start, count in zip(starts, row)]
+        for row in counts
+    ]
+
+
+def _auto_histogram(labels, values, n_zones, minimum, maximum, max_buckets, min_bucket_width):
+    """Returns a histogram dictionary per zone spanning the zone's value range, like ee.Reducer.histogram()."""
+    span = np.where(np.isnan(maximum), 0, maximum - minimum)
+    widths = span / max_buckets
+    widths = np.where(widths > 0, widths, 1.0)
+    if min_bucket_width is not None:
+        widths = np.maximum(widths, min_bucket_width)
+    buckets = np.floor((values - minimum[labels]) / widths[labels]).astype(np.int64)
+    buckets = np.clip(buckets, 0, max_buckets - 1)
+    counts = np.bincount(
+        labels * max_buckets + buckets, minlength=n_zones * max_buckets
+    ).reshape(n_zones, max_buckets)
+
+    histograms = []
+    for i in range(n_zones):
+        if np.isnan(minimum[i]):
+            histograms.append(None)
+            continue
+        used = int(min(max_buckets, np.floor(span[i] / widths[i]) + 1))
+        histograms.append(
+            {
+                "bucketMin": float(minimum[i]),
+                "bucketWidth": float(widths[i]),
+                "histogram": counts[i, :used].tolist(),
+            }
+        )
+    return histograms
+
+
+def _read_zones(in_zone_vector):
+    """Reads the zones as a GeoDataFrame."""
+    import geopandas as gpd
+
+    if isinstance(in_zone_vector, str):
+        return gpd.read_file(in_zone_vector)
+    elif isinstance(in_zone_vector, gpd.GeoDataFrame):
+        return in_zone_vector
+    raise TypeError("in_zone_vector must be a file path or a GeoDataFrame.")
+
+
+def rasterize_zones(zones, out_shape, transform, all_touched=False):
+    """Burns the zones into a label array, where pixel value i + 1 is zone i and 0 is outside all zones.
+
+    Where zones overlap, a pixel is assigned to the zone that comes last.
+
+    Args:
+        zones (geopandas.GeoDataFrame): The zones, in the CRS of the raster.
+        out_shape (tuple): The (rows, cols) of the output array.
+        transform (affine.Affine): The affine transform of the raster grid.
+        all_touched (bool, optional): Whether to include every pixel touched by a zone,
+            instead of only the pixels whose center is inside. Defaults to False.
+
+    Returns:
+        numpy.ndarray: The int32 label array.
+    """
+    from rasterio import features
+
+    shapes = [
+        (geom, i + 1)
+        for i, geom in enumerate(zones.geometry)
+        if geom is not None and not geom.is_empty
+    ]
+    if not shapes:
+        return np.zeros(out_shape, dtype=np.int32)
+    return features.rasterize(
+        shapes,
+        out_shape=out_shape,
+        transform=transform,
+        fill=0,
+        all_touched=all_touched,
+        dtype="int32",
+    )
+
+
+def _save_results(zones, out_file_path):
+    """Writes the zonal statistics to a csv or vector file."""
+    filetype = os.path.splitext(out_file_path)[1][1:].lower()
+    if filetype == "csv":
+        zones.drop(columns=zones.geometry.name).to_csv(out_file_path, index=False)
+    else:
+        # Vector formats cannot store list or dict columns
+        zones = zones.copy()
+        for column in ("histogram",):
+            if column in zones.columns:
+                zones[column] = zones[column].apply(str)
+        zones.to_file(out_file_path)
+
+
+def zonal_stats_local(
+    in_value_raster,
+    in_zone_vector,
+    out_file_path=None,
+    stat_type="MEAN",
+    band=1,
+    all_touched=False,
+    verbose=False,
+    block_size=None,
+    processes=None,
+    **kwargs,
+):
+    """Summarizes the values of a local raster within the zones of a local vector dataset.
+
+    The zones are rasterized to a label array once, and all zones are summarized
+    together with vectorized NumPy operations. For rasters that do not fit in
+    memory, pass block_size or processes to use zonal_stats_blocks() instead.
+
+    Args:
+        in_value_raster (str): The path or URL of a raster file, e.g., a GeoTIFF.
+        in_zone_vector (str | geopandas.GeoDataFrame): The path to a vector file, or a GeoDataFrame, that defines the zones.
+        out_file_path (str, optional): The output csv, shp, geojson, or gpkg file. Defaults to None.
+        stat_type (str | list, optional): One or more statistic types: COUNT, MEAN, MEAN_UNWEIGHTED, MAXIMUM, MEDIAN,
+            MINIMUM, MODE, STD, MIN_MAX, SUM, VARIANCE, HIST, or FIXED_HIST. Defaults to "MEAN".
+            For 'HIST', you can provide max_buckets and min_bucket_width. For 'FIXED_HIST', you can provide
+            hist_min, hist_max, and hist_steps.
+        band (int, optional): The band of the raster to summarize. Defaults to 1.
+        all_touched (bool, optional): Whether to include every pixel touched by a zone. Defaults to False.
+        verbose (bool, optional): Whether to print descriptive text. Defaults to False.
+        block_size (int, optional): If given, the raster is processed in blocks of this size with
+            zonal_stats_blocks(). Defaults to None.
+        processes (int, optional): If given, the raster is processed in blocks on this many processes with
+            zonal_stats_blocks(). Defaults to None.
+
+    Returns:
+        geopandas.GeoDataFrame: The zones with one column per statistic.
+    """
+    import rasterio
+
+    if "statistics_type" in kwargs:
+        stat_type = kwargs.pop("statistics_type")
+    if block_size is not None or processes is not None:
+        return zonal_stats_blocks(
+            in_value_raster,
+            in_zone_vector,
+            out_file_path,
+            stat_type=stat_type,
+            band=band,
+            block_size=block_size or 1024,
+            processes=processes,
+            all_touched=all_touched,
+            verbose=verbose,
+            **kwargs,
+        )
+    stat_types = _check_stat_types(stat_type)
+    zones = _read_zones(in_zone_vector)
+
+    with rasterio.open(in_value_raster) as src:
+        if zones.crs is not None and src.crs is not None and zones.crs != src.crs:
+            zones = zones.to_crs(src.crs)
+        data = src.read(band, masked=True)
+        labels = rasterize_zones(zones, data.shape, src.transform, all_touched)
+
+    if verbose:
+        print(f"Computing statistics for {len(zones)} zones ...")
+
+    valid = labels > 0
+    valid &= ~np.ma.getmaskarray(data)
+    values = np.ma.getdata(data)[valid].astype(np.float64)
+    valid_labels = labels[valid] - 1
+    finite = np.isfinite(values)
+    stats = zone_statistics(
+        valid_labels[finite], values[finite], len(zones), stat_types, **kwargs
+    )
+
+    zones = zones.copy()
+    for column, result in stats.items():
+        zones[column] = list(result) if isinstance(result, list) else result
+
+    if out_file_path is not None:
+        _save_results(zones, os.path.abspath(out_file_path))
+        if verbose:
+            print(f"Data saved to {out_file_path}")
+
+    return zones
+
+
+class ZoneAccumulator:
+    """Mergeable per-zone statistics for computing zonal statistics block by block.
+
+    Counts, sums, minima, and maxima are merged directly. Means and variances are
+    merged with the parallel form of Welford's algorithm (Chan et al.), so the
+    result does not depend on how the raster is split into blocks. Median, mode,
+    and histograms are derived from a fixed-bin histogram per zone.
+
+    Args:
+        n_zones (int): The number of zones.
+        bin_edges (numpy.ndarray, optional): The edges of the histogram bins used for MEDIAN, MODE, and HIST.
+            Defaults to None (no histogram).
+        unit_bins (bool, optional): Whether every bin holds a single integer value, which makes the median
+            and mode exact. Defaults to False.
+        fixed_hist (tuple, optional): The (hist_min, hist_max, hist_steps) of FIXED_HIST. Defaults to None.
+    """
+
+    def __init__(self, n_zones, bin_edges=None, unit_bins=False, fixed_hist=None):
+        self.n_zones = n_zones
+        self.bin_edges = bin_edges
+        self.unit_bins = unit_bins
+        self.fixed_hist = fixed_hist
+        self.count = np.zeros(n_zones, dtype=np.int64)
+        self.mean = np.zeros(n_zones)
+        self.m2 = np.zeros(n_zones)
+        self.sum = np.zeros(n_zones)
+        self.min = np.full(n_zones, np.inf)
+        self.max = np.full(n_zones, -np.inf)
+        self.hist = None
+        if bin_edges is not None:
+            self.hist = np.zeros((n_zones, len(bin_edges) - 1), dtype=np.int64)
+        self.fixed = None
+        if fixed_hist is not None:
+            self.fixed = np.zeros((n_zones, fixed_hist[2]), dtype=np.int64)
+
+    def partial(self, labels, values):
+        """Summarizes one block of labels and values for the zones present in it.
+
+        Args:
+            labels (numpy.ndarray): A 1-D array of zone indices.
+            values (numpy.ndarray): A 1-D array of float values.
+
+        Returns:
+            dict: The partial statistics, which can be passed to merge().
+        """
+        present = np.bincount(labels)
+        zones = np.flatnonzero(present)
+        k = len(zones)
+        remap = np.zeros(len(present), dtype=np.int64)
+        remap[zones] = np.arange(k)
+        local = remap[labels]
+        count = present[zones]
+        total = np.bincount(local, weights=values, minlength=k)
+        mean = total / count
+        m2 = np.bincount(local, weights=(values - mean[local]) ** 2, minlength=k)
+
+        # A stable sort of small integer keys is a linear-time radix sort
+        keys = local.astype(np.uint16) if k <= np.iinfo(np.uint16).max else local
+        order = np.argsort(keys, kind="stable")
+        starts = _zone_starts(count)
+        sorted_values = values[order]
+        partial = {
+            "zones": zones,
+            "count": count,
+            "sum": total,
+            "mean": mean,
+            "m2": m2,
+            "min": np.minimum.reduceat(sorted_values, starts),
+            "max": np.maximum.reduceat(sorted_values, starts),
+        }
+        if self.hist is not None:
+            n_bins = self.hist.shape[1]
+            bins = np.searchsorted(self.bin_edges, values, side="right") - 1
+            bins = np.clip(bins, 0, n_bins - 1)
+            partial["hist"] = np.bincount(
+                local * n_bins + bins, minlength=k * n_bins
+            ).reshape(k, n_bins)
+        if self.fixed is not None:
+            hist_min, hist_max, hist_steps = self.fixed_hist
+            width = (hist_max - hist_min) / hist_steps
+            bins = np.floor((values - hist_min) / width).astype(np.int64)
+            inside = (bins >= 0) & (bins < hist_steps)
+            partial["fixed"] = np.bincount(
+                local[inside] * hist_steps + bins[inside], minlength=k * hist_steps
+            ).reshape(k, hist_steps)
+        return partial
+
+    def merge(self, partial):
+        """Merges partial statistics returned by partial() into the accumulator.
+
+        Args:
+            partial (dict): The partial statistics of one block.
+        """
+        zones = partial["zones"]
+        if len(zones) == 0:
+            return
+        na = self.count[zones]
+        nb = partial["count"]
+        n = na + nb
+        delta = partial["mean"] - self.mean[zones]
+        self.mean[zones] += delta * nb / n
+        self.m2[zones] += partial["m2"] + delta**2 * na * nb / n
+        self.count[zones] = n
+        self.sum[zones] += partial["sum"]
+        self.min[zones] = np.minimum(self.min[zones], partial["min"])
+        self.max[zones] = np.maximum(self.max[zones], partial["max"])
+        if self.hist is not None:
+            self.hist[zones] += partial["hist"]
+        if self.fixed is not None:
+            self.fixed[zones] += partial["fixed"]
+
+    def _bin_value(self, index):
+        """Returns the value represented by histogram bins."""
+        if self.unit_bins:
+            return self.bin_edges[index]
+        return (self.bin_edges[index] + self.bin_edges[index + 1]) / 2
+
+    def _rank_value(self, rank):
+        """Returns the value at the given rank of each zone from the histogram."""
+        cumulative = np.cumsum(self.hist, axis=1)
+        index = (cumulative > rank[:, None]).argmax(axis=1)
+        return self._bin_value(index)
+
+    def result(self, stat_type="MEAN", max_buckets=256, **kwargs):
+        """Returns the statistics in the same form as zone_statistics().
+
+        Args:
+            stat_type (str | list, optional): One or more statistic types. Defaults to "MEAN".
+            max_buckets (int, optional): The maximum number of buckets of the "HIST" histograms. Defaults to 256.
+
+        Returns:
+            dict: A dictionary of output column name to a list or array with one entry per zone.
+        """
+        stat_types = _check_stat_types(stat_type)
+        has_data = self.count > 0
+        results = {}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            variance = np.where(has_data, self.m2 / self.count, np.nan)
+        minimum = np.where(has_data, self.min, np.nan)
+        maximum = np.where(has_data, self.max, np.nan)
+
+        for s in stat_types:
+            if s == "COUNT":
+                results["count"] = self.count
+            elif s in ("MEAN", "MEAN_UNWEIGHTED"):
+                results["mean"] = np.where(has_data, self.mean, np.nan)
+            elif s == "SUM":
+                results["sum"] = np.where(has_data, self.sum, np.nan)
+            elif s == "VARIANCE":
+                results["variance"] = variance
+            elif s == "STD":
+                results["stdDev"] = np.sqrt(variance)
+            elif s == "MINIMUM":
+                results["min"] = minimum
+            elif s == "MAXIMUM":
+                results["max"] = maximum
+            elif s == "MIN_MAX":
+                results["min"] = minimum
+                results["max"] = maximum
+            elif s == "MEDIAN":
+                lower = self._rank_value((self.count - 1) // 2)
+                upper = self._rank_value(self.count // 2)
+                results["median"] = np.where(has_data, (lower + upper) / 2, np.nan)
+            elif s == "MODE":
+                mode = self._bin_value(self.hist.argmax(axis=1))
+                results["mode"] = np.where(has_data, mode, np.nan)
+            elif s == "FIXED_HIST":
+                hist_min, hist_max, hist_steps = self.fixed_hist
+                starts = hist_min + (hist_max - hist_min) / hist_steps * np.arange(hist_steps)
+                results["histogram"] = [
+                    [[float(start), int(c)] for start, c in zip(starts, row)]
+                    for row in self.fixed
+                ]
+            elif s == "HIST":
+                results["histogram"] = self._histograms(has_data, max_buckets)
+        return results
+
+    def _histograms(self, has_data, max_buckets):
+        """Returns the non-empty range of each zone's histogram, merged down to at most max_buckets buckets."""
+        histograms = []
+        widths = np.diff(self.bin_edges)
+        for i in range(self.n_zones):
+            if not has_data[i]:
+                histograms.append(None)
+                continue
+            used = np.flatnonzero(self.hist[i])
+            row = self.hist[i, used[0] : used[-1] + 1]
+            factor = int(np.ceil(len(row) / max_buckets))
+            if factor > 1:
+                row = np.add.reduceat(row, np.arange(0, len(row), factor))
+            histograms.append(
+                {
+                    "bucketMin": float(self.bin_edges[used[0]]),
+                    "bucketWidth": float(widths[0] * factor),
+                    "histogram": row.tolist(),
+                }
+            )
+        return histograms
+
+
+def _memmap_band(path, band=1):
+    """Memory-maps a band of an uncompressed, strip-organized GeoTIFF.
+
+    Returns:
+        numpy.memmap | None: The band as a (rows, cols) array, or None if the
+            file layout does not allow memory-mapping.
+    """
+    import rasterio
+
+    try:
+        with rasterio.open(path) as src:
+            if (
+                src.driver != "GTiff"
+                or src.compression is not None
+                or (src.count > 1 and src.interleaving != rasterio.enums.Interleaving.band)
+                or src.block_shapes[band - 1][1] != src.width
+            ):
+                return None
+            rows_per_strip = src.block_shapes[band - 1][0]
+            n_strips = -(-src.height // rows_per_strip)
+            dtype = np.dtype(src.dtypes[band - 1])
+
+            def offset(i):
+                value = src.get_tag_item(f"BLOCK_OFFSET_0_{i}", "TIFF", bidx=band)
+                return int(value) if value else None
+
+            first, last = offset(0), offset(n_strips - 1)
+            strip_bytes = rows_per_strip * src.width * dtype.itemsize
+            if first is None or last != first + (n_strips - 1) * strip_bytes:
+                return None
+            shape = (src.height, src.width)
+
+        with open(path, "rb") as f:
+            byteorder = "<" if f.read(2) == b"II" else ">"
+        return np.memmap(
+            path, dtype=dtype.newbyteorder(byteorder), mode="r", offset=first, shape=shape
+        )
+    except Exception:
+        return None
+
+
+def block_windows(width, height, block_size=1024):
+    """Splits a raster into square windows of at most block_size pixels on each side.
+
+    Args:
+        width (int): The raster width in pixels.
+        height (int): The raster height in pixels.
+        block_size (int, optional): The block size in pixels. Defaults to 1024.
+
+    Returns:
+        list: A list of rasterio.windows.Window.
+    """
+    from rasterio.windows import Window
+
+    return [
+        Window(col, row, min(block_size, width - col), min(block_size, height - row))
+        for row in range(0, height, block_size)
+        for col in range(0, width, block_size)
+    ]
+
+
+# The per-process state of the block workers, set by _init_block_worker()
+_block_state = {}
+
+
+def _init_block_worker(path, band, zone_wkbs, all_touched, accumulator_args):
+    """Opens the raster and prepares the zone index once in each worker process."""
+    import rasterio
+    import shapely
+
+    geometries = shapely.from_wkb(zone_wkbs)
+    _block_state.clear()
+    _block_state.update(
+        src=rasterio.open(path),
+        band=band,
+        memmap=_memmap_band(path, band),
+        geometries=geometries,
+        tree=shapely.STRtree(geometries),
+        all_touched=all_touched,
+        accumulator=ZoneAccumulator(0, **accumulator_args),
+    )
+
+
+def _process_block(window):
+    """Computes the partial zonal statistics of one raster window."""
+    import shapely
+    from rasterio import features, windows
+
+    state = _block_state
+    src = state["src"]
+    transform = windows.transform(window, src.transform)
+    bounds = windows.bounds(window, src.transform)
+    candidates = state["tree"].query(shapely.box(*bounds))
+    if len(candidates) == 0:
+        return None
+
+    shape = (int(window.height), int(window.width))
+    labels = features.rasterize(
+        [(state["geometries"][i], int(i) + 1) for i in sorted(candidates)],
+        out_shape=shape,
+        transform=transform,
+        fill=0,
+        all_touched=state["all_touched"],
+        dtype="int32",
+    )
+    inside = labels > 0
+    if not inside.any():
+        return None
+
+    data, valid = _read_window(window)
+    valid &= inside
+    values = data[valid].astype(np.float64)
+    labels = labels[valid] - 1
+    finite = np.isfinite(values)
+    if not finite.any():
+        return None
+    return state["accumulator"].partial(labels[finite], values[finite])
+
+
+def _read_window(window):
+    """Reads one raster window and the mask of its valid pixels in a block worker."""
+    state = _block_state
+    src = state["src"]
+    if state["memmap"] is not None:
+        row, col = int(window.row_off), int(window.col_off)
+        height, width = int(window.height), int(window.width)
+        data = np.asarray(state["memmap"][row : row + height, col : col + width])
+        valid = np.ones(data.shape, dtype=bool)
+        if src.nodata is not None:
+            valid = data != src.nodata
+        return data, valid
+    data = src.read(state["band"], window=window, masked=True)
+    return np.ma.getdata(data), ~np.ma.getmaskarray(data)
+
+
+def _window_range(window):
+    """Returns the minimum and maximum of the valid values of one raster window."""
+    data, valid = _read_window(window)
+    values = data[valid]
+    if values.dtype.kind == "f":
+        values = values[np.isfinite(values)]
+    if values.size == 0:
+        return None
+    return float(values.min()), float(values.max())
+
+
+def _run_blocks(func, windows, processes, initargs, report=None):
+    """Yields func(window) for each window, in order, in this process or on a process pool."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if processes == 1:
+        _init_block_worker(*initargs)
+        try:
+            for done, window in enumerate(windows, 1):
+                yield func(window)
+                if report:
+                    report(done)
+        finally:
+            _block_state["src"].close()
+            _block_state.clear()
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_block_worker, initargs=initargs
+    ) as executor:
+        chunksize = max(1, len(windows) // ((processes or os.cpu_count() or 1) * 8))
+        for done, result in enumerate(executor.map(func, windows, chunksize=chunksize), 1):
+            yield result
+            if report:
+                report(done)
+
+
+def _histogram_bins(dtype, bins, value_range):
+    """Chooses the histogram bins used for MEDIAN, MODE, and HIST in the block pipeline.
+
+    Args:
+        dtype (numpy.dtype): The data type of the raster band.
+        bins (int): The number of bins of non-integer ranges.
+        value_range (tuple): The (min, max) of the values, or None if the raster has no valid values.
+
+    Returns:
+        tuple: The bin edges, and whether every bin holds a single integer value.
+    """
+    if value_range is None:
+        value_range = (0.0, 1.0)
+    low, high = value_range
+    if dtype.kind in "iu" and high - low + 1 <= max(bins, 256):
+        # One bin per integer value, which makes the median and mode exact
+        return np.arange(low, high + 2, dtype=np.float64), True
+    if high <= low:
+        high = low + 1
+    return np.linspace(low, high, bins + 1), False
+
+
+def zonal_stats_blocks(
+    in_value_raster,
+    in_zone_vector,
+    out_file_path=None,
+    stat_type="MEAN",
+    band=1,
+    block_size=1024,
+    processes=None,
+    bins=1024,
+    value_range=None,
+    all_touched=False,
+    verbose=False,
+    **kwargs,
+):
+    """Summarizes a raster that may be larger than memory within zones, block by block on a process pool.
+
+    The raster is read in windows of block_size x block_size pixels (memory-mapped
+    if the file is an uncompressed strip GeoTIFF), and every block is summarized
+    into mergeable per-zone accumulators. Peak memory per process is bounded by
+    the block size, not the raster size.
+
+    MEDIAN, MODE, and HIST are computed from a histogram with `bins` bins over
+    value_range, which is found with a first pass over the blocks unless given.
+    They are exact for integer rasters whose value range fits in the bins, and
+    approximate to one bin width otherwise. Values outside a given value_range
+    are counted in the first or last bin.
+
+    Args:
+        in_value_raster (str): The path of the raster file.
+        in_zone_vector (str | geopandas.GeoDataFrame): The path to a vector file, or a GeoDataFrame, that defines the zones.
+        out_file_path (str, optional): The output csv, shp, geojson, or gpkg file. Defaults to None.
+        stat_type (str | list, optional): One or more statistic types, see zonal_stats_local(). Defaults to "MEAN".
+        band (int, optional): The band of the raster to summarize. Defaults to 1.
+        block_size (int, optional): The block size in pixels. Defaults to 1024.
+        processes (int, optional): The number of worker processes. Defaults to None (the number of CPUs).
+            Use 1 to process the blocks in the current process.
+        bins (int, optional): The number of histogram bins for MEDIAN, MODE, and HIST. Defaults to 1024.
+        value_range (tuple, optional): The (min, max) of the histogram bins. Defaults to None (the exact
+            range of the raster, computed in a first pass).
+        all_touched (bool, optional): Whether to include every pixel touched by a zone. Defaults to False.
+        verbose (bool, optional): Whether to print the progress. Defaults to False.
+
+    Returns:
+        geopandas.GeoDataFrame: The zones with one column per statistic.
+    """
+    import rasterio
+    import shapely
+
+    if "statistics_type" in kwargs:
+        stat_type = kwargs.pop("statistics_type")
+    stat_types = _check_stat_types(stat_type)
+    zones = _read_zones(in_zone_vector)
+
+    with rasterio.open(in_value_raster) as src:
+        if zones.crs is not None and src.crs is not None and zones.crs != src.crs:
+            zones = zones.to_crs(src.crs)
+        windows = block_windows(src.width, src.height, block_size)
+        dtype = np.dtype(src.dtypes[band - 1])
+
+    geometries = zones.geometry.values
+    geometries = [
+        g if g is not None else shapely.GeometryCollection() for g in geometries
+    ]
+    zone_wkbs = shapely.to_wkb(geometries)
+
+    accumulator_args = {}
+    if {"MEDIAN", "MODE", "HIST"} & set(stat_types):
+        if value_range is None:
+            if dtype.kind in "iu" and dtype.itemsize == 1:
+                value_range = (np.iinfo(dtype).min, np.iinfo(dtype).max)
+            else:
+                # An exact first pass, so no value falls outside the bins
+                if verbose:
+                    print("Computing the value range ...")
+                initargs = (in_value_raster, band, zone_wkbs, all_touched, {})
+                ranges = [r for r in _run_blocks(_window_range, windows, processes, initargs) if r]
+                if ranges:
+                    value_range = (min(r[0] for r in ranges), max(r[1] for r in ranges))
+        edges, unit_bins = _histogram_bins(dtype, bins, value_range)
+        accumulator_args.update(bin_edges=edges, unit_bins=unit_bins)
+    if "FIXED_HIST" in stat_types:
+        accumulator_args["fixed_hist"] = (
+            kwargs.get("hist_min", 1.0),
+            kwargs.get("hist_max", 100.0),
+            kwargs.get("hist_steps", 10),
+        )
+
+    initargs = (in_value_raster, band, zone_wkbs, all_touched, accumulator_args)
+    accumulator = ZoneAccumulator(len(zones), **accumulator_args)
+
+    def report(done):
+        if verbose:
+            print(f"Processed {done}/{len(windows)} blocks", end="\r")
+
+    for partial in _run_blocks(_process_block, windows, processes, initargs, report):
+        if partial is not None:
+            accumulator.merge(partial)
+
+    stats = accumulator.result(stat_types, **kwargs)
+    zones = zones.copy()
+    for column, result in stats.items():
+        zones[column] = list(result) if isinstance(result, list) else result
+
+    if out_file_path is not None:
+        _save_results(zones, os.path.abspath(out_file_path))
+        if verbose:
+            print(f"\nData saved to {out_file_path}")
+
+    return zones